@@ -0,0 +1,193 @@
+"""Async (ASGI) варианты горячих эндпоинтов.
+DRF не умеет async представления, поэтому это обычные async view Django,
+которые переиспользуют серилизаторы, права и сервисы из синхронной части.
+Запуск: gunicorn supermaster.asgi:application -k uvicorn_worker.UvicornWorker"""
+
+import json
+from functools import wraps
+from typing import Iterable
+
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import as_serializer_error
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+# Локальные импорты
+from .authentication import CachedJWTAuthentication, TokenUserAuthentication
+from .conditional import has_validators, not_modified_response, set_validators
+from .models import Diary
+from .pagination import KeysetPagination
+from .permissions import IsAuthenticatedAndActiveUser, IsDairyOwner
+from .query_budget import query_budget
+from . import representations
+from .serializers import (
+    TokenRefreshSerializer,
+    UserLoginSerializer,
+    UserProfileSerializer,
+)
+from .services import UserAuthService
+from .throttling import LOGIN_THROTTLES, REFRESH_THROTTLES
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    # Тот же JSONRenderer, что у синхронных представлений - ответы совпадают байт в байт
+    renderer = JSONRenderer()
+    return HttpResponse(
+        renderer.render(data), status=status_code, content_type=renderer.media_type
+    )
+
+
+def parse_json(request: HttpRequest):
+    if not request.body:
+        return {}
+    try:
+        return json.loads(request.body)
+    except ValueError as e:
+        raise exceptions.ParseError(f"JSON parse error - {e}")
+
+
+def async_api_view(
+    methods: Iterable[str],
+    permission_classes: Iterable = (),
+    throttle_classes: Iterable = (),
+    authentication_class=CachedJWTAuthentication,
+):
+    """Минимальный аналог APIView для async функций: метод, JWT, права, троттлинг, ошибки API"""
+    authenticator = authentication_class()
+
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request: HttpRequest, *args, **kwargs):
+            if request.method not in methods:
+                return json_response(
+                    {"detail": f'Method "{request.method}" not allowed.'},
+                    status.HTTP_405_METHOD_NOT_ALLOWED,
+                )
+            try:
+                request.data = parse_json(request)
+                if permission_classes:
+                    result = await authenticator.aauthenticate(request)
+                    if result is None:
+                        raise exceptions.NotAuthenticated()
+                    request.user, request.auth = result
+                    for permission_class in permission_classes:
+                        permission = permission_class()
+                        if not permission.has_permission(request, view):
+                            raise exceptions.PermissionDenied(permission.message)
+                waits = [
+                    throttle.wait()
+                    for throttle in (throttle_class() for throttle_class in throttle_classes)
+                    if not throttle.allow_request(request, view)
+                ]
+                if waits:
+                    raise exceptions.Throttled(max(waits))
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+                response = json_response(data, exc.status_code)
+                if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                    response.headers["WWW-Authenticate"] = authenticator.authenticate_header(request)
+                if isinstance(exc, exceptions.Throttled) and exc.wait is not None:
+                    response.headers["Retry-After"] = str(int(exc.wait))
+                return response
+
+        return wrapper
+
+    return decorator
+
+
+@async_api_view(["POST"], throttle_classes=LOGIN_THROTTLES)
+@query_budget(3)
+async def login(request: HttpRequest) -> HttpResponse:
+    serializer = UserLoginSerializer(data=request.data)
+    # Поля проверяются без БД, учетные данные - через async ORM
+    data = serializer.to_internal_value(serializer.initial_data)
+    try:
+        data = await serializer.avalidate(data)
+    except exceptions.ValidationError as exc:
+        # Как run_validation: ошибки validate попадают в non_field_errors
+        raise exceptions.ValidationError(as_serializer_error(exc))
+    response = await UserAuthService.alogin_user(data)
+    return json_response(response)
+
+
+@async_api_view(["POST"], throttle_classes=REFRESH_THROTTLES)
+@query_budget(7)
+async def token_refresh(request: HttpRequest) -> HttpResponse:
+    serializer = TokenRefreshSerializer(data=request.data)
+    # Ротация и blacklist в simplejwt синхронные - выполняем их в потоке
+    try:
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+    return json_response(serializer.validated_data)
+
+
+@async_api_view(["PATCH"], permission_classes=[IsAuthenticatedAndActiveUser])
+@query_budget(3)
+async def update_profile(request: HttpRequest) -> HttpResponse:
+    serializer = UserProfileSerializer(instance=request.user, data=request.data, partial=True)
+    # Валидация профиля без БД, email проверяет ограничение при UPDATE
+    serializer.is_valid(raise_exception=True)
+    user, errors = await UserAuthService.aupdate_profile(request.user, serializer.validated_data)
+    if errors:
+        raise exceptions.ValidationError(errors)
+    return json_response(
+        {"message": "Профиль успешно обновлен", "user": representations.profile(user)}
+    )
+
+
+@async_api_view(
+    ["GET"],
+    permission_classes=[IsAuthenticatedAndActiveUser],
+    authentication_class=TokenUserAuthentication,
+)
+@query_budget(3)
+async def get_diary(request: HttpRequest, diary_id: int) -> HttpResponse:
+    if has_validators(request):
+        updated_at = await (
+            Diary.objects.visible().filter(id=diary_id, owner_id=request.user.id)
+            .values_list("updated_at", flat=True)
+            .order_by("pk")
+            .afirst()
+        )
+        response = not_modified_response(request, diary_id, updated_at)
+        if response is not None:
+            return response
+
+    diary = await (
+        Diary.objects.visible().filter(id=diary_id).values(*representations.DIARY_VALUES).afirst()
+    )
+    if diary is None:
+        raise exceptions.NotFound("No Diary matches the given query.")
+    permission = IsDairyOwner()
+    if not permission.has_object_permission(request, None, diary):
+        raise exceptions.PermissionDenied(permission.message)
+    return set_validators(
+        json_response(representations.diary(diary)), diary["id"], diary["updated_at"]
+    )
+
+
+@async_api_view(
+    ["GET"],
+    permission_classes=[IsAuthenticatedAndActiveUser],
+    authentication_class=TokenUserAuthentication,
+)
+@query_budget(2)
+async def list_diaries(request: HttpRequest) -> HttpResponse:
+    paginator = KeysetPagination()
+    diaries = await paginator.apaginate_queryset(
+        Diary.objects.visible().filter(owner_id=request.user.id).values(*representations.DIARY_LIST_VALUES),
+        request,
+    )
+    owner = request.user.username
+    data = [representations.diary_list_item(diary, owner) for diary in diaries]
+    return json_response({"next": paginator.get_next_link(), "results": data})
@@ -0,0 +1,432 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import db_routing
+from .models import User
+from .tokens import TOKEN_EPOCH_CLAIM
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_CACHE_SETTINGS = {
+    # Локальный LRU в каждом процессе
+    "LOCAL_MAXSIZE": 4096,
+    "LOCAL_TTL": 30,
+    # Общий кэш (alias из CACHES), None - не использовать
+    "SHARED_CACHE_ALIAS": None,
+    "SHARED_TTL": 300,
+    "KEY_PREFIX": "account:user:",
+    # Представления дневников берут пользователя из claims токена (TokenUserAuthentication)
+    "TOKEN_USER": True,
+    # TTL эпох токенов в LRU процесса: столько другой процесс без общего кэша может
+    # принимать отозванный токен - на всех эндпоинтах, кэш пользователей сверяется с эпохой
+    "EPOCH_LOCAL_TTL": 5,
+    "EPOCH_KEY_PREFIX": "account:epoch:",
+}
+
+# Пароль в кэш не кладем - поле останется отложенным и подгрузится только по требованию
+EXCLUDED_FIELDS = ("password",)
+
+
+def get_user_cache_settings() -> Dict[str, Any]:
+    return {**DEFAULT_USER_CACHE_SETTINGS, **getattr(settings, "ACCOUNT_USER_CACHE", {})}
+
+
+class LocalLRUCache:
+    """Потокобезопасный LRU с TTL для одного процесса"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class UserCache:
+    """Двухуровневый кэш пользователей: LRU процесса + опциональный общий кэш.
+    Хранит только значения полей, на каждый запрос собирается новый экземпляр User"""
+
+    def __init__(self):
+        self._local: Optional[LocalLRUCache] = None
+        self._lock = threading.Lock()
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return get_user_cache_settings()
+
+    @property
+    def local(self) -> LocalLRUCache:
+        if self._local is None:
+            with self._lock:
+                if self._local is None:
+                    config = self.config
+                    self._local = LocalLRUCache(config["LOCAL_MAXSIZE"], config["LOCAL_TTL"])
+        return self._local
+
+    @property
+    def shared(self):
+        alias = self.config["SHARED_CACHE_ALIAS"]
+        return caches[alias] if alias else None
+
+    def _key(self, user_id) -> str:
+        return f"{self.config['KEY_PREFIX']}{user_id}"
+
+    @staticmethod
+    def _dump(user: User) -> Dict[str, Any]:
+        deferred = user.get_deferred_fields()
+        return {
+            field.attname: getattr(user, field.attname)
+            for field in User._meta.concrete_fields
+            if field.attname not in EXCLUDED_FIELDS and field.attname not in deferred
+        }
+
+    @staticmethod
+    def _load(data: Dict[str, Any]) -> User:
+        return User.from_db("default", list(data), list(data.values()))
+
+    def get(self, user_id) -> Optional[User]:
+        key = str(user_id)
+        data = self.local.get(key)
+        if data is None and self.shared is not None:
+            data = self.shared.get(self._key(key))
+            if data is not None:
+                self.local.set(key, data)
+        return self._load(data) if data is not None else None
+
+    async def aget(self, user_id) -> Optional[User]:
+        key = str(user_id)
+        data = self.local.get(key)
+        if data is None and self.shared is not None:
+            data = await self.shared.aget(self._key(key))
+            if data is not None:
+                self.local.set(key, data)
+        return self._load(data) if data is not None else None
+
+    def set(self, user: User) -> None:
+        key = str(user.pk)
+        data = self._dump(user)
+        self.local.set(key, data)
+        if self.shared is not None:
+            self.shared.set(self._key(key), data, self.config["SHARED_TTL"])
+
+    async def aset(self, user: User) -> None:
+        key = str(user.pk)
+        data = self._dump(user)
+        self.local.set(key, data)
+        if self.shared is not None:
+            await self.shared.aset(self._key(key), data, self.config["SHARED_TTL"])
+
+    def invalidate(self, user_id) -> None:
+        key = str(user_id)
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._key(key))
+
+    def clear(self) -> None:
+        self.local.clear()
+
+
+user_cache = UserCache()
+
+
+class TokenEpochCache:
+    """user_id -> token_epoch для проверки токенов без загрузки пользователя.
+    При промахе читается одно поле и всегда с основной БД: отставание реплики
+    не должно пропускать отозванный токен"""
+
+    def __init__(self):
+        self._local: Optional[LocalLRUCache] = None
+        self._lock = threading.Lock()
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return get_user_cache_settings()
+
+    @property
+    def local(self) -> LocalLRUCache:
+        if self._local is None:
+            with self._lock:
+                if self._local is None:
+                    config = self.config
+                    self._local = LocalLRUCache(config["LOCAL_MAXSIZE"], config["EPOCH_LOCAL_TTL"])
+        return self._local
+
+    @property
+    def shared(self):
+        alias = self.config["SHARED_CACHE_ALIAS"]
+        return caches[alias] if alias else None
+
+    def _key(self, user_id) -> str:
+        return f"{self.config['EPOCH_KEY_PREFIX']}{user_id}"
+
+    @staticmethod
+    def _query(user_id):
+        return User.objects.using(db_routing.PRIMARY).filter(pk=user_id).values_list("token_epoch", flat=True)
+
+    def cached(self, user_id) -> Optional[int]:
+        """Эпоха из кэша без запроса в БД, None - неизвестна"""
+        key = str(user_id)
+        epoch = self.local.get(key)
+        if epoch is None and self.shared is not None:
+            epoch = self.shared.get(self._key(key))
+            if epoch is not None:
+                self.local.set(key, epoch)
+        return epoch
+
+    async def acached(self, user_id) -> Optional[int]:
+        key = str(user_id)
+        epoch = self.local.get(key)
+        if epoch is None and self.shared is not None:
+            epoch = await self.shared.aget(self._key(key))
+            if epoch is not None:
+                self.local.set(key, epoch)
+        return epoch
+
+    def set(self, user_id, epoch: int) -> None:
+        """Эпоха только что прочитанная с основной БД"""
+        key = str(user_id)
+        self.local.set(key, epoch)
+        if self.shared is not None:
+            self.shared.set(self._key(key), epoch, self.config["SHARED_TTL"])
+
+    async def aset(self, user_id, epoch: int) -> None:
+        key = str(user_id)
+        self.local.set(key, epoch)
+        if self.shared is not None:
+            await self.shared.aset(self._key(key), epoch, self.config["SHARED_TTL"])
+
+    def get(self, user_id) -> Optional[int]:
+        epoch = self.cached(user_id)
+        if epoch is None:
+            epoch = self._query(user_id).first()
+            if epoch is not None:
+                self.set(user_id, epoch)
+        return epoch
+
+    async def aget(self, user_id) -> Optional[int]:
+        epoch = await self.acached(user_id)
+        if epoch is None:
+            epoch = await self._query(user_id).afirst()
+            if epoch is not None:
+                await self.aset(user_id, epoch)
+        return epoch
+
+    def invalidate(self, user_id) -> None:
+        key = str(user_id)
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._key(key))
+
+    def clear(self) -> None:
+        self.local.clear()
+
+
+epoch_cache = TokenEpochCache()
+
+
+def invalidate_user(user_id) -> None:
+    """Сбрасывает пользователя и эпоху его токенов из кэша сразу и еще раз
+    после коммита, чтобы параллельный запрос не закэшировал строку до коммита"""
+
+    def invalidate():
+        user_cache.invalidate(user_id)
+        epoch_cache.invalidate(user_id)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def check_token_epoch(validated_token, current_epoch: Optional[int]) -> None:
+    """Токен выпущен до отзыва (soft_delete, смена пароля, выход везде).
+    Токены без claim epoch выпущены до его появления и проверяются только по пользователю"""
+    if TOKEN_EPOCH_CLAIM in validated_token and validated_token[TOKEN_EPOCH_CLAIM] != current_epoch:
+        raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+
+class TokenClaimsUser(TokenUser):
+    """Пользователь из claims access токена (account.tokens.token_for_user), без строки в БД"""
+
+    @cached_property
+    def id(self) -> int:
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def is_active(self) -> bool:
+        return self.token.get("is_active", False)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, который берет пользователя из кэша вместо SELECT на каждый запрос"""
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+    def check_user(self, user, validated_token, epoch: Optional[int]):
+        """epoch - из epoch_cache: token_epoch пользователя с реплики может отставать"""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        check_token_epoch(validated_token, epoch)
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+    def _manager(self, validated_token):
+        """Эпоха на реплике может отставать от отзыва: пользователя для токена с эпохой
+        читаем с основной БД, это один запрос вместо SELECT с реплики и эпохи с основной"""
+        if TOKEN_EPOCH_CLAIM in validated_token:
+            return self.user_model.objects.using(db_routing.PRIMARY)
+        return self.user_model.objects
+
+    def _load_user(self, user_id, manager):
+        try:
+            user = manager.get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        user_cache.set(user)
+        # Эпоха с реплики может отставать - в кэш эпох только с основной БД
+        if user._state.db == db_routing.PRIMARY:
+            epoch_cache.set(user.pk, user.token_epoch)
+        return user
+
+    async def _aload_user(self, user_id, manager):
+        try:
+            user = await manager.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+        await user_cache.aset(user)
+        if user._state.db == db_routing.PRIMARY:
+            await epoch_cache.aset(user.pk, user.token_epoch)
+        return user
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        # До загрузки пользователя: после своей записи он читается с основной БД
+        db_routing.set_user(user_id)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = self._load_user(user_id, self._manager(validated_token))
+        elif user.token_epoch != epoch_cache.cached(user_id):
+            # Кэш пользователя живет LOCAL_TTL, а удаление, смена пароля или выход везде в другом
+            # процессе сбрасывают только его кэш. Эпоха неизвестна (истек EPOCH_LOCAL_TTL) или
+            # изменилась - перечитываем пользователя с основной БД, это же обновит эпоху
+            user = self._load_user(user_id, self.user_model.objects.using(db_routing.PRIMARY))
+
+        # Пользователь с эпохой загружен с основной БД или сверен с кэшем эпох - здесь запроса нет
+        epoch = epoch_cache.get(user_id) if TOKEN_EPOCH_CLAIM in validated_token else None
+        return self.check_user(user, validated_token, epoch)
+
+    async def aget_user(self, validated_token):
+        """Async вариант get_user для ASGI представлений (account.async_views)"""
+        user_id = self.get_user_id(validated_token)
+        await db_routing.aset_user(user_id)
+        user = await user_cache.aget(user_id)
+        if user is None:
+            user = await self._aload_user(user_id, self._manager(validated_token))
+        elif user.token_epoch != await epoch_cache.acached(user_id):
+            user = await self._aload_user(user_id, self.user_model.objects.using(db_routing.PRIMARY))
+
+        epoch = await epoch_cache.aget(user_id) if TOKEN_EPOCH_CLAIM in validated_token else None
+        return self.check_user(user, validated_token, epoch)
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+
+class TokenUserAuthentication(CachedJWTAuthentication):
+    """Для представлений, которым от пользователя нужны только id и username (дневники):
+    пользователь собирается из claims токена, отзыв проверяется по кэшу эпох.
+    Токены без claim epoch и режим TOKEN_USER=False - как CachedJWTAuthentication"""
+
+    def _use_claims(self, validated_token) -> bool:
+        return get_user_cache_settings()["TOKEN_USER"] and TOKEN_EPOCH_CLAIM in validated_token
+
+    def _check_claims_user(self, user: TokenClaimsUser, epoch: Optional[int]) -> TokenClaimsUser:
+        if epoch is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        check_token_epoch(user.token, epoch)
+        return user
+
+    def get_user(self, validated_token):
+        if not self._use_claims(validated_token):
+            return super().get_user(validated_token)
+        user = TokenClaimsUser(validated_token)
+        db_routing.set_user(user.id)
+        return self._check_claims_user(user, epoch_cache.get(user.id))
+
+    async def aget_user(self, validated_token):
+        if not self._use_claims(validated_token):
+            return await super().aget_user(validated_token)
+        user = TokenClaimsUser(validated_token)
+        await db_routing.aset_user(user.id)
+        return self._check_claims_user(user, await epoch_cache.aget(user.id))
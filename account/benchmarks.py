@@ -0,0 +1,134 @@
+"""Общие утилиты для команд нагрузочного тестирования (account/management/commands/benchmark_*)"""
+
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from .models import Diary, User
+from .tokens import RefreshToken, outstanding_token, token_for_user
+
+BENCH_PASSWORD = "BenchPass123"
+
+
+# silk пишет каждый запрос в БД - в замерах он только искажает результат
+EXCLUDED_MIDDLEWARE = ("silk.middleware.SilkyMiddleware",)
+
+
+@contextmanager
+def throwaway_database(keepdb: bool = False):
+    """Временная тестовая БД (test_<NAME> или SQLite в памяти), удаляется после замера"""
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=keepdb)
+    middleware = [m for m in settings.MIDDLEWARE if m not in EXCLUDED_MIDDLEWARE]
+    try:
+        with override_settings(MIDDLEWARE=middleware):
+            yield
+    finally:
+        connections.close_all()
+        teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def close_pool_connections(pool: ThreadPoolExecutor, workers: int, timeout: float = 30.0) -> None:
+    """Закрывает соединения с БД во всех потоках пула, иначе они держат временную БД и
+    teardown_databases ее не удалит. Задачи ждут друг друга на барьере, поэтому все workers
+    выполняются одновременно в разных потоках - по одной в каждом"""
+    barrier = threading.Barrier(workers, timeout=timeout)
+
+    def close(_):
+        barrier.wait()
+        connections.close_all()
+
+    list(pool.map(close, range(workers)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    """Сводка по задержкам в миллисекундах"""
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+
+
+def seed_users(count: int, diaries_per_user: int = 1, prefix: str = "bench") -> Tuple[List[User], List[Diary]]:
+    """Пользователи с общим заранее посчитанным хэшем пароля и их дневники"""
+    password = make_password(BENCH_PASSWORD)
+    users = User.objects.bulk_create(
+        User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password)
+        for i in range(count)
+    )
+    diaries = Diary.objects.bulk_create(
+        Diary(owner=user, title=f"Дневник {n} {user.username}")
+        for user in users
+        for n in range(diaries_per_user)
+    )
+    return users, diaries
+
+
+def issue_refresh_tokens(users: List[User]) -> List[str]:
+    """Refresh токены для списка пользователей, OutstandingToken вставляются одним bulk_create"""
+    tokens = [token_for_user(RefreshToken, user) for user in users]
+    OutstandingToken.objects.bulk_create(
+        outstanding_token(token, user) for user, token in zip(users, tokens)
+    )
+    return [str(token) for token in tokens]
+
+
+class QueryCounter:
+    """execute_wrapper, считающий запросы текущего потока"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def count(self) -> int:
+        return getattr(self._local, "count", 0)
+
+    def reset(self) -> None:
+        self._local.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self._local.count = self.count + 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def capture(self):
+        self.reset()
+        with connection.execute_wrapper(self):
+            yield self
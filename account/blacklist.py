@@ -0,0 +1,104 @@
+import heapq
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLACKLIST_FILTER_SETTINGS = {
+    # Как часто (сек) подтягивать новые строки BlacklistedToken, 0 - на каждую проверку
+    "SYNC_INTERVAL": 1.0,
+    # Сколько секунд до прошлой синхронизации перечитывать по blacklisted_at: время ставится
+    # при INSERT, а строка видна после COMMIT. Дольше этого транзакция с записью в blacklist
+    # идти не должна (выход, soft_delete), заодно покрывает расхождение часов между нодами
+    "SYNC_MARGIN": 30,
+    # Строк за один проход курсора при первой загрузке
+    "CHUNK_SIZE": 5000,
+}
+
+
+def get_blacklist_filter_settings() -> Dict[str, Any]:
+    return {
+        **DEFAULT_BLACKLIST_FILTER_SETTINGS,
+        **getattr(settings, "ACCOUNT_TOKEN_BLACKLIST_FILTER", {}),
+    }
+
+
+class BlacklistFilter:
+    """Множество jti из token_blacklist в памяти процесса.
+    Первая синхронизация загружает неистекшие jti, дальше - только строки с blacklisted_at не
+    старше прошлой синхронизации минус SYNC_MARGIN (индекс из миграции 0012). По id нельзя:
+    id выдается при INSERT, и долгая транзакция коммитит меньший id после больших.
+    Истекшие jti вытесняются по expires_at. Отрицательный ответ отдается без БД, положительный проверяется в БД"""
+
+    def __init__(self):
+        self._expires: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        # Момент начала прошлой синхронизации, все закоммиченные до него строки уже загружены
+        self._synced_at = None
+        self._last_sync = None
+        self._lock = threading.Lock()
+
+    def _add(self, jti: str, expires_at: float) -> None:
+        if jti not in self._expires:
+            heapq.heappush(self._heap, (expires_at, jti))
+        self._expires[jti] = expires_at
+
+    def _prune(self, now: float) -> None:
+        while self._heap and self._heap[0][0] <= now:
+            _, jti = heapq.heappop(self._heap)
+            self._expires.pop(jti, None)
+
+    def sync(self, force: bool = False) -> None:
+        config = get_blacklist_filter_settings()
+        now = time.monotonic()
+        if (
+            not force
+            and self._last_sync is not None
+            and now - self._last_sync < config["SYNC_INTERVAL"]
+        ):
+            return
+
+        with self._lock:
+            started = timezone.now()
+            rows = BlacklistedToken.objects.filter(token__expires_at__gt=started)
+            if self._synced_at is not None:
+                rows = rows.filter(
+                    blacklisted_at__gte=self._synced_at - timedelta(seconds=config["SYNC_MARGIN"])
+                )
+            for jti, expires_at in rows.values_list("token__jti", "token__expires_at").iterator(
+                chunk_size=config["CHUNK_SIZE"]
+            ):
+                self._add(jti, expires_at.timestamp())
+            self._prune(time.time())
+            self._synced_at = started
+            self._last_sync = now
+
+    def add(self, jti: str, expires_at: float) -> None:
+        """Токен занесен в blacklist этим процессом - видно сразу, без ожидания синхронизации"""
+        with self._lock:
+            self._add(jti, expires_at)
+
+    def might_contain(self, jti: str) -> bool:
+        self.sync()
+        return jti in self._expires
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires.clear()
+            self._heap.clear()
+            self._synced_at = None
+            self._last_sync = None
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+blacklist_filter = BlacklistFilter()
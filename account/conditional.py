@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Optional
+
+from django.http import HttpResponseBase
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+# Заголовки, при которых клиент ждет 304 вместо тела
+CONDITIONAL_HEADERS = ("HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE")
+
+
+def has_validators(request) -> bool:
+    """Прислал ли клиент ETag/Last-Modified с прошлого ответа"""
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
+
+
+def make_etag(pk, updated_at: datetime) -> str:
+    return quote_etag(f"{pk}-{int(updated_at.timestamp() * 1_000_000)}")
+
+
+def set_validators(response: HttpResponseBase, pk, updated_at: datetime) -> HttpResponseBase:
+    response.headers["ETag"] = make_etag(pk, updated_at)
+    response.headers["Last-Modified"] = http_date(updated_at.timestamp())
+    return response
+
+
+def not_modified_response(request, pk, updated_at: Optional[datetime]) -> Optional[HttpResponseBase]:
+    """304 (или 412) если версия у клиента совпадает с updated_at, иначе None"""
+    if updated_at is None:
+        return None
+    response = get_conditional_response(
+        request,
+        etag=make_etag(pk, updated_at),
+        last_modified=int(updated_at.timestamp()),
+    )
+    if response is None:
+        return None
+    return set_validators(response, pk, updated_at)
@@ -0,0 +1,171 @@
+"""Чтение моделей account (User, Diary) с реплик.
+Запись всегда идет в основную БД. После записи в account остаток запроса читает с основной БД,
+а автор записи - еще STICKY_SECONDS секунд (метка в кэше по id пользователя), чтобы
+видеть свои изменения, пока реплика догоняет. Вне HTTP запроса (команды, shell)
+все читается с основной БД"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULT_DB_ROUTING_SETTINGS = {
+    # Алиасы реплик из DATABASES, пусто - все на основной БД
+    "REPLICAS": (),
+    # Сколько секунд после своей записи пользователь читает с основной БД.
+    # Должно быть больше отставания реплик
+    "STICKY_SECONDS": 10,
+    # alias из CACHES для меток; при нескольких процессах - общий кэш
+    "CACHE_ALIAS": "default",
+    "KEY_PREFIX": "account:db-pin:",
+    # Приложения, которые читаются с реплик. token_blacklist - только с основной БД,
+    # иначе отозванный токен пройдет, пока реплика отстает
+    "APPS": ("account",),
+}
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+
+def get_db_routing_settings() -> Dict[str, Any]:
+    return {**DEFAULT_DB_ROUTING_SETTINGS, **getattr(settings, "ACCOUNT_DB_ROUTING", {})}
+
+
+class RoutingState:
+    """Состояние одного запроса. Объект общий для копий контекста (sync_to_async),
+    поэтому запись в потоке ORM видна и в async представлении"""
+
+    __slots__ = ("primary", "wrote", "user_id")
+
+    def __init__(self):
+        self.primary = False
+        self.wrote = False
+        self.user_id = None
+
+
+_state: ContextVar[Optional[RoutingState]] = ContextVar("account_db_routing", default=None)
+
+
+def _pin_key(config: Dict[str, Any], user_id) -> str:
+    return f"{config['KEY_PREFIX']}{user_id}"
+
+
+def reading_from_replica() -> bool:
+    state = _state.get()
+    return state is not None and not state.primary and bool(get_db_routing_settings()["REPLICAS"])
+
+
+def set_user(user_id) -> None:
+    """Вызывается аутентификацией до загрузки пользователя: недавно писавший читает с основной БД"""
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    config = get_db_routing_settings()
+    if not state.primary and config["REPLICAS"]:
+        state.primary = bool(caches[config["CACHE_ALIAS"]].get(_pin_key(config, user_id)))
+
+
+async def aset_user(user_id) -> None:
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    config = get_db_routing_settings()
+    if not state.primary and config["REPLICAS"]:
+        state.primary = bool(await caches[config["CACHE_ALIAS"]].aget(_pin_key(config, user_id)))
+
+
+@contextmanager
+def use_primary():
+    """Чтение с основной БД внутри блока"""
+    state = _state.get()
+    if state is None or state.primary:
+        yield
+        return
+    state.primary = True
+    try:
+        yield
+    finally:
+        state.primary = False
+
+
+def _should_pin(state: RoutingState, config: Dict[str, Any]) -> bool:
+    return state.wrote and state.user_id is not None and bool(config["REPLICAS"])
+
+
+class ReplicaRouter:
+    """Ставится в DATABASE_ROUTERS, состояние запроса задает ReplicaRoutingMiddleware"""
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        config = get_db_routing_settings()
+        if model._meta.app_label not in config["APPS"] or not config["REPLICAS"]:
+            return None
+        state = _state.get()
+        if state is None or state.primary:
+            # Явно, иначе связанный объект загрузится из БД экземпляра, то есть с реплики
+            return PRIMARY
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in config["REPLICAS"]:
+            return instance._state.db
+        return random.choice(config["REPLICAS"])
+
+    def db_for_write(self, model, **hints) -> Optional[str]:
+        config = get_db_routing_settings()
+        state = _state.get()
+        # Записи других приложений (token_blacklist, silk) чтение account не меняют
+        if state is not None and model._meta.app_label in config["APPS"]:
+            state.primary = True
+            state.wrote = True
+        # Экземпляр, прочитанный с реплики, сохраняется в основную БД
+        return PRIMARY if config["REPLICAS"] else None
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        databases = {PRIMARY, *get_db_routing_settings()["REPLICAS"]}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Задает состояние маршрутизации на время запроса и ставит метку после записи"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+            config = get_db_routing_settings()
+            if _should_pin(state, config):
+                caches[config["CACHE_ALIAS"]].set(
+                    _pin_key(config, state.user_id), True, config["STICKY_SECONDS"]
+                )
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _state.reset(token)
+            config = get_db_routing_settings()
+            if _should_pin(state, config):
+                await caches[config["CACHE_ALIAS"]].aset(
+                    _pin_key(config, state.user_id), True, config["STICKY_SECONDS"]
+                )
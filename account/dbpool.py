@@ -0,0 +1,76 @@
+"""Пул соединений psycopg (OPTIONS["pool"] в DATABASES, Django 5.1+).
+Прогрев при старте воркера (gunicorn.conf.py) и метрики ожидания и заполненности
+пула для /metrics. У каждого воркера свой пул, /metrics складывает их"""
+
+import time
+from typing import Dict, Iterator, List
+
+from django.db import connections
+
+from .metrics import Sample, register_collector
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ключи ConnectionPool.get_stats(): мгновенные значения и накопительные счетчики
+POOL_GAUGES = (
+    ("pool_size", "account_db_pool_connections", "Открытые соединения пула"),
+    ("pool_available", "account_db_pool_available_connections", "Свободные соединения пула"),
+    ("pool_max", "account_db_pool_max_connections", "Максимальный размер пула"),
+    ("requests_waiting", "account_db_pool_requests_waiting", "Запросы, ждущие соединение сейчас"),
+)
+POOL_COUNTERS = (
+    ("requests_num", "account_db_pool_requests_total", "Выдачи соединений из пула"),
+    ("requests_queued", "account_db_pool_requests_queued_total", "Выдачи, которым пришлось ждать"),
+    ("requests_errors", "account_db_pool_timeouts_total", "Не дождались соединения (PoolTimeout)"),
+    ("connections_lost", "account_db_pool_connections_lost_total", "Соединения, не прошедшие проверку"),
+)
+
+
+def pools() -> Iterator[tuple]:
+    """(alias, пул) для БД с OPTIONS["pool"]; пул создается закрытым при первом обращении"""
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None:
+            yield alias, pool
+
+
+def warm_up(timeout: float = 10.0) -> Dict[str, float]:
+    """Открывает пулы и ждет min_size соединений, без пула - открывает соединение потока.
+    Возвращает время на каждую БД в секундах. Недоступная БД не роняет воркер:
+    пул продолжит подключаться в фоне"""
+    timings = {}
+    for alias in connections:
+        connection = connections[alias]
+        started = time.perf_counter()
+        try:
+            pool = getattr(connection, "pool", None)
+            if pool is not None:
+                pool.open(wait=True, timeout=timeout)
+            else:
+                connection.ensure_connection()
+        except Exception as e:
+            logger.warning(f"Прогрев соединений с БД {alias} не удался: {e}")
+            continue
+        timings[alias] = time.perf_counter() - started
+    return timings
+
+
+def pool_samples() -> List[Sample]:
+    samples = []
+    for alias, pool in pools():
+        stats = pool.get_stats()
+        labels = {"database": alias}
+        for key, name, help_text in POOL_GAUGES:
+            samples.append((name, labels, "gauge", help_text, stats.get(key, 0)))
+        for key, name, help_text in POOL_COUNTERS:
+            samples.append((name, labels, "counter", help_text, stats.get(key, 0)))
+        samples.append((
+            "account_db_pool_wait_seconds_total", labels, "counter",
+            "Суммарное ожидание соединения", stats.get("requests_wait_ms", 0) / 1000,
+        ))
+    return samples
+
+
+register_collector(pool_samples)
@@ -0,0 +1,88 @@
+"""Пакетная запись дневников (POST /api/diary/batch/) для клиентов с офлайн синхронизацией.
+Число запросов к БД не зависит от размера пачки: одна выборка своих дневников под
+обновление и удаление, bulk_create, bulk_update и один DELETE по владельцу.
+Все операции - одна транзакция, результат отдается по каждой операции в том же порядке"""
+
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import representations
+from .models import Diary
+
+DEFAULT_DIARY_BATCH_SETTINGS = {
+    # Операций в одном запросе. bulk_update на SQLite делит запрос по 999 параметрам
+    # (по 3 на дневник), до 333 операций это один UPDATE
+    "MAX_OPERATIONS": 100,
+}
+
+# Совпадают с DiaryBatchOperationSerializer.op
+CREATE, UPDATE, DELETE = "create", "update", "delete"
+NOT_FOUND = "Дневник не найден"
+
+
+def get_diary_batch_settings() -> Dict[str, Any]:
+    return {**DEFAULT_DIARY_BATCH_SETTINGS, **getattr(settings, "ACCOUNT_DIARY_BATCH", {})}
+
+
+def _not_found(operation: Dict[str, Any]) -> Dict[str, Any]:
+    return {"op": operation["op"], "id": operation["id"], "status": 404, "error": NOT_FOUND}
+
+
+def apply_diary_batch(owner_id: int, owner: str, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """operations - провалидированные DiaryBatchSerializer: id не повторяются.
+    Чужие, скрытые и несуществующие дневники получают 404, остальные операции применяются"""
+    ids = [operation["id"] for operation in operations if operation["op"] != CREATE]
+    now = timezone.now()
+    with transaction.atomic():
+        # created_at нужен для ответа на update; блокировка - против параллельной пачки того же владельца
+        owned = (
+            dict(
+                Diary.objects.visible()
+                .filter(owner_id=owner_id, id__in=ids)
+                .select_for_update()
+                .values_list("id", "created_at")
+            )
+            if ids
+            else {}
+        )
+        created = Diary.objects.bulk_create(
+            [
+                Diary(owner_id=owner_id, title=operation["title"])
+                for operation in operations
+                if operation["op"] == CREATE
+            ]
+        )
+        updated = [
+            # bulk_update не проставляет auto_now - updated_at для ETag задаем сами
+            Diary(id=operation["id"], title=operation["title"], updated_at=now)
+            for operation in operations
+            if operation["op"] == UPDATE and operation["id"] in owned
+        ]
+        if updated:
+            Diary.objects.bulk_update(updated, ["title", "updated_at"])
+        deleted = [
+            operation["id"]
+            for operation in operations
+            if operation["op"] == DELETE and operation["id"] in owned
+        ]
+        if deleted:
+            Diary.objects.filter(owner_id=owner_id, id__in=deleted).delete()
+
+    results = []
+    created_diaries = iter(created)
+    for operation in operations:
+        if operation["op"] == CREATE:
+            diary = next(created_diaries)
+            row = {"id": diary.id, "title": diary.title, "created_at": diary.created_at}
+            results.append({"op": CREATE, "status": 201, "diary": representations.diary_list_item(row, owner)})
+        elif operation["id"] not in owned:
+            results.append(_not_found(operation))
+        elif operation["op"] == UPDATE:
+            row = {"id": operation["id"], "title": operation["title"], "created_at": owned[operation["id"]]}
+            results.append({"op": UPDATE, "status": 200, "diary": representations.diary_list_item(row, owner)})
+        else:
+            results.append({"op": DELETE, "id": operation["id"], "status": 204})
+    return results
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASHING_SETTINGS = {
+    # Сколько хэшей считается одновременно в процессе
+    "MAX_WORKERS": 2,
+    # Сколько задач может ждать в очереди, остальные сразу получают 503
+    "MAX_PENDING": 8,
+    # Сколько секунд запрос ждет результата хэширования
+    "TIMEOUT": 5,
+    # Итерации PBKDF2 (CalibratedPBKDF2PasswordHasher), подбираются командой calibrate_hasher.
+    # None - значение Django по умолчанию
+    "PBKDF2_ITERATIONS": None,
+}
+
+
+def get_hashing_settings() -> Dict[str, Any]:
+    return {**DEFAULT_HASHING_SETTINGS, **getattr(settings, "ACCOUNT_PASSWORD_HASHING", {})}
+
+
+class CalibratedPBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 с числом итераций из ACCOUNT_PASSWORD_HASHING["PBKDF2_ITERATIONS"].
+    Алгоритм тот же (pbkdf2_sha256), поэтому старые хэши проверяются, а хэши с другим
+    числом итераций обновляются при следующем входе (must_update)"""
+
+    @property
+    def iterations(self) -> int:
+        return get_hashing_settings()["PBKDF2_ITERATIONS"] or hashers.PBKDF2PasswordHasher.iterations
+
+
+class PasswordHashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Сервис временно перегружен, попробуйте позже"
+    default_code = "password_hashing_unavailable"
+
+
+class BoundedHashingExecutor:
+    """Отдельный пул потоков для PBKDF2 с ограничением очереди.
+    Хэширование не занимает больше MAX_WORKERS ядер, а при переполнении
+    очереди запрос сразу отклоняется вместо ожидания"""
+
+    def __init__(self, max_workers: int, max_pending: int, timeout: float):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hashing"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, fn: Callable, *args):
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Очередь хэширования паролей переполнена")
+            raise PasswordHashingUnavailable()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn: Callable, *args) -> Any:
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            logger.warning("Превышено время ожидания хэширования пароля")
+            raise PasswordHashingUnavailable()
+
+    async def arun(self, fn: Callable, *args) -> Any:
+        """Как run, но ожидание не блокирует event loop (ASGI)"""
+        future = asyncio.wrap_future(self.submit(fn, *args))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Превышено время ожидания хэширования пароля")
+            raise PasswordHashingUnavailable()
+
+
+_executor: Optional[BoundedHashingExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> BoundedHashingExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = get_hashing_settings()
+                _executor = BoundedHashingExecutor(
+                    config["MAX_WORKERS"], config["MAX_PENDING"], config["TIMEOUT"]
+                )
+    return _executor
+
+
+def hash_password(raw_password: str) -> str:
+    """make_password в пуле хэширования"""
+    return get_executor().run(hashers.make_password, raw_password)
+
+
+def rehash_password(user_id, raw_password: str, encoded: str) -> bool:
+    """Новый хэш вместо устаревшего encoded. UPDATE с условием на старый хэш:
+    пароль, смененный за это время, не перезаписывается"""
+    from .authentication import invalidate_user
+    from .models import User
+
+    updated = User.objects.filter(pk=user_id, password=encoded).update(
+        password=hashers.make_password(raw_password)
+    )
+    if updated:
+        # update() не шлет post_save - сбрасываем кэш аутентификации сами
+        invalidate_user(user_id)
+    return bool(updated)
+
+
+def _rehash_task(user_id, raw_password: str, encoded: str) -> None:
+    try:
+        rehash_password(user_id, raw_password, encoded)
+    except Exception:
+        logger.exception(f"Не удалось обновить хэш пароля пользователя {user_id}")
+    finally:
+        # Поток пула живет долго - соединение возвращаем сразу, а не держим до следующей задачи
+        connections.close_all()
+
+
+def schedule_rehash(user, raw_password: str, encoded: str) -> None:
+    """Обновление хэша в пуле хэширования после ответа на вход. При переполненной
+    очереди пропускается - хэш обновится при следующем входе"""
+    try:
+        get_executor().submit(_rehash_task, user.pk, raw_password, encoded)
+    except PasswordHashingUnavailable:
+        logger.info(f"Обновление хэша пароля пользователя {user.pk} отложено: пул занят")
+
+
+def _must_update(encoded: str) -> bool:
+    return hashers.identify_hasher(encoded).must_update(encoded)
+
+
+def verify_password(user, raw_password: str) -> bool:
+    """Аналог user.check_password: проверка в пуле. Устаревший хэш (другой алгоритм
+    или число итераций) обновляется в фоне после коммита, а не в запросе входа"""
+    encoded = user.password
+    is_correct = get_executor().run(hashers.check_password, raw_password, encoded)
+    if is_correct and _must_update(encoded):
+        transaction.on_commit(partial(schedule_rehash, user, raw_password, encoded))
+    return is_correct
+
+
+def dummy_verify(raw_password: str) -> None:
+    """Хэш для несуществующего email, чтобы время ответа совпадало с реальным аккаунтом"""
+    get_executor().run(hashers.make_password, raw_password)
+
+
+async def ahash_password(raw_password: str) -> str:
+    return await get_executor().arun(hashers.make_password, raw_password)
+
+
+async def averify_password(user, raw_password: str) -> bool:
+    encoded = user.password
+    is_correct = await get_executor().arun(hashers.check_password, raw_password, encoded)
+    if is_correct and _must_update(encoded):
+        # Async ORM работает в autocommit, ждать коммита нечего
+        schedule_rehash(user, raw_password, encoded)
+    return is_correct
+
+
+async def adummy_verify(raw_password: str) -> None:
+    await get_executor().arun(hashers.make_password, raw_password)
@@ -0,0 +1,225 @@
+import json
+import os
+import statistics
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from account.benchmarks import (
+    BENCH_PASSWORD,
+    QueryCounter,
+    Timer,
+    close_pool_connections,
+    issue_refresh_tokens,
+    seed_users,
+    summarize,
+    throwaway_database,
+)
+from account.dbpool import pool_samples
+from account.tokens import AccessToken
+
+SCENARIOS = ("register", "login", "refresh", "profile", "diary", "logout", "mixed")
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон register/login/refresh/profile/diary/logout на временной БД: "
+        "p50/p95/p99, пропускная способность и число запросов к БД на запрос"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--diaries", type=int, default=5, help="Дневников на пользователя")
+        parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--scenarios", default=",".join(SCENARIOS),
+            help=f"Через запятую из: {', '.join(SCENARIOS)}",
+        )
+        parser.add_argument("--output", help="Сохранить результат в JSON файл")
+        parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options["scenarios"].split(",") if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+        # Лимиты отключены, а очередь хэширования вмещает все параллельные запросы -
+        # иначе замер покажет 429/503 вместо времени ответа
+        overrides = override_settings(
+            ACCOUNT_RATE_LIMITS={"RATES": {}},
+            ACCOUNT_PASSWORD_HASHING={
+                **getattr(settings, "ACCOUNT_PASSWORD_HASHING", {}),
+                "MAX_PENDING": options["concurrency"],
+            },
+        )
+        with throwaway_database(), overrides:
+            if connection.vendor == "sqlite" and options["concurrency"] > 1:
+                self.stderr.write(
+                    "SQLite блокирует параллельную запись, для сценариев с записью лучше --concurrency 1"
+                )
+            self.users, self.diaries = seed_users(options["users"], options["diaries"])
+            self.access = {user.id: f"Bearer {AccessToken.for_user(user)}" for user in self.users}
+            result = {
+                "meta": {
+                    "commit": get_git_commit(),
+                    "started_at": datetime.now(timezone.utc).isoformat(),
+                    "database": connection.vendor,
+                    "users": options["users"],
+                    "diaries_per_user": options["diaries"],
+                    "requests": options["requests"],
+                    "concurrency": options["concurrency"],
+                    "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+                    "pool": bool(connection.settings_dict["OPTIONS"].get("pool")),
+                    # Как в gunicorn.conf.py: --concurrency равный threads - один gthread воркер, 1 - sync
+                    "worker_class": os.getenv("GUNICORN_WORKER_CLASS", "gthread"),
+                    "threads": int(os.getenv("GUNICORN_THREADS", "4")),
+                },
+                "scenarios": {
+                    name: self.run(getattr(self, f"prepare_{name}")(options["requests"]), options)
+                    for name in scenarios
+                },
+            }
+            result["meta"]["pool_stats"] = {name: value for name, _, _, _, value in pool_samples()}
+
+        previous = self.load(options["compare"]) if options["compare"] else {}
+        for name, stats in result["scenarios"].items():
+            line = (
+                f"{name}: {stats['throughput_rps']} req/s, p50={stats['p50_ms']}ms "
+                f"p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms, "
+                f"запросов к БД={stats['queries_per_request']}, ошибок={stats['errors']}"
+            )
+            before = previous.get(name)
+            if before:
+                line += f" (p95 было {before['p95_ms']}ms, req/s было {before['throughput_rps']})"
+            self.stdout.write(line)
+            if "diary" in stats:
+                self.stdout.write(
+                    f"  дневники среди входов: p50={stats['diary']['p50_ms']}ms p95={stats['diary']['p95_ms']}ms"
+                )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Результат сохранен в {options['output']}"))
+
+    def load(self, path):
+        with open(path) as f:
+            return json.load(f).get("scenarios", {})
+
+    # Каждый prepare_* готовит запросы заранее: (метод, путь, тело, заголовки, ожидаемый статус)
+
+    def prepare_register(self, count):
+        return [
+            ("post", "/api/users/register/", {
+                "username": f"reg{i}",
+                "email": f"reg{i}@example.com",
+                "password": BENCH_PASSWORD,
+                "password2": BENCH_PASSWORD,
+            }, {}, 201)
+            for i in range(count)
+        ]
+
+    def prepare_login(self, count):
+        return [
+            ("post", "/api/users/login/", {"email": user.email, "password": BENCH_PASSWORD}, {}, 200)
+            for user in self.cycle(self.users, count)
+        ]
+
+    def prepare_refresh(self, count):
+        # Ротация заносит токен в blacklist - каждому запросу свой refresh
+        tokens = issue_refresh_tokens(self.cycle(self.users, count))
+        return [("post", "/api/token/refresh/", {"refresh": token}, {}, 200) for token in tokens]
+
+    def prepare_profile(self, count):
+        return [
+            ("patch", "/api/users/update/", {"first_name": f"Имя{i}"},
+             {"Authorization": self.access[user.id]}, 200)
+            for i, user in enumerate(self.cycle(self.users, count))
+        ]
+
+    def prepare_diary(self, count):
+        return [
+            ("get", f"/api/diary/{diary.id}/", None,
+             {"Authorization": self.access[diary.owner_id]}, 200)
+            for diary in self.cycle(self.diaries, count)
+        ]
+
+    def prepare_logout(self, count):
+        users = self.cycle(self.users, count)
+        tokens = issue_refresh_tokens(users)
+        return [
+            ("post", "/api/users/logout/", {"refresh": token},
+             {"Authorization": self.access[user.id]}, 204)
+            for user, token in zip(users, tokens)
+        ]
+
+    def prepare_mixed(self, count):
+        # Вход и чтение дневника через один: сколько ждут дневники, пока потоки заняты PBKDF2
+        logins, diaries = self.prepare_login(count // 2), self.prepare_diary(count - count // 2)
+        return [job for pair in zip(diaries, logins) for job in pair] + diaries[len(logins):]
+
+    @staticmethod
+    def cycle(items, count):
+        return [items[i % len(items)] for i in range(count)]
+
+    def run(self, jobs, options):
+        counter = QueryCounter()
+        local = threading.local()
+
+        def request(job):
+            method, path, data, headers, expected = job
+            if not hasattr(local, "client"):
+                local.client = Client()
+            started = time.perf_counter()
+            try:
+                with counter.capture():
+                    response = getattr(local.client, method)(
+                        path, data, content_type="application/json", headers=headers
+                    )
+                status = response.status_code
+            except Exception as e:
+                self.stderr.write(f"{method.upper()} {path}: {e}")
+                status = "exception"
+            latency = time.perf_counter() - started
+            # Тестовый клиент не закрывает соединение после запроса, а сервер закрывает
+            # (или возвращает в пул) - иначе разница между пулом и CONN_MAX_AGE=0 не видна
+            close_old_connections()
+            return latency, counter.count, status, status == expected
+
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            with Timer() as timer:
+                results = list(pool.map(request, jobs))
+            close_pool_connections(pool, options["concurrency"])
+
+        stats = summarize([latency for latency, *_ in results], timer.elapsed)
+        diary = [latency for (_, path, *_), (latency, *_) in zip(jobs, results) if path.startswith("/api/diary/")]
+        if diary and len(diary) < len(results):
+            stats["diary"] = summarize(diary, timer.elapsed)
+        queries = [count for _, count, *_ in results]
+        stats.update(
+            queries_per_request=round(statistics.fmean(queries), 2) if queries else 0.0,
+            max_queries=max(queries, default=0),
+            errors=sum(1 for *_, ok in results if not ok),
+            status_codes=dict(Counter(str(status) for _, _, status, _ in results)),
+        )
+        return stats
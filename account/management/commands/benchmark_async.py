@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+
+from account.benchmarks import Timer, close_pool_connections, seed_users, summarize, throwaway_database
+from account.tokens import AccessToken
+
+ENDPOINTS = {
+    # имя: (синхронный путь, async путь)
+    "diary": ("/api/diary/{diary_id}/", "/api/async/diary/{diary_id}/"),
+    "diary-list": ("/api/diary/", "/api/async/diary/"),
+}
+
+
+class Command(BaseCommand):
+    help = "Сравнивает пропускную способность синхронных (WSGI) и async (ASGI) представлений на временной БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="diary")
+        parser.add_argument("--output", help="Сохранить результат в JSON файл")
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            targets = self.seed(options["users"])
+            sync_path, async_path = ENDPOINTS[options["endpoint"]]
+            result = {
+                "endpoint": options["endpoint"],
+                "concurrency": options["concurrency"],
+                "wsgi": self.run_sync(sync_path, targets, options),
+                "asgi": asyncio.run(self.run_async(async_path, targets, options)),
+            }
+
+        for mode in ("wsgi", "asgi"):
+            stats = result[mode]
+            self.stdout.write(
+                f"{mode}: {stats['throughput_rps']} req/s, "
+                f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результат сохранен в {options['output']}"))
+
+    def seed(self, count):
+        _, diaries = seed_users(count)
+        return [
+            (f"Bearer {AccessToken.for_user(diary.owner)}", diary.id) for diary in diaries
+        ]
+
+    def run_sync(self, path, targets, options):
+        def request(i):
+            token, diary_id = targets[i % len(targets)]
+            started = time.perf_counter()
+            response = Client().get(path.format(diary_id=diary_id), HTTP_AUTHORIZATION=token)
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            with Timer() as timer:
+                latencies = list(pool.map(request, range(options["requests"])))
+            close_pool_connections(pool, options["concurrency"])
+        return summarize(latencies, timer.elapsed)
+
+    async def run_async(self, path, targets, options):
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        client = AsyncClient()
+
+        async def request(i):
+            token, diary_id = targets[i % len(targets)]
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(
+                    path.format(diary_id=diary_id), headers={"Authorization": token}
+                )
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - started
+
+        with Timer() as timer:
+            latencies = await asyncio.gather(*(request(i) for i in range(options["requests"])))
+        # ORM из async представлений работает в потоке sync_to_async (thread_sensitive):
+        # его соединения закрываются там же, до удаления временной БД
+        await sync_to_async(connections.close_all)()
+        return summarize(list(latencies), timer.elapsed)
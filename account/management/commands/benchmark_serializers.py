@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from account import representations
+from account.benchmarks import Timer, seed_users, throwaway_database
+from account.models import Diary, User
+from account.serializers import DairySerializer, DiaryListSerializer, UserProfileSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает серилизаторы DRF и быстрые представления (account.representations) "
+        "на больших пачках: выборка + серилизация + JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=10000, help="Записей в пачке")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        batch = options["batch"]
+        with throwaway_database():
+            # Один владелец на все дневники, как на странице списка, и отдельные пользователи для профилей
+            (owner,), _ = seed_users(1, batch, prefix="owner")
+            seed_users(batch, 0)
+            cases = {
+                "diary": (
+                    lambda: DairySerializer(Diary.objects.select_related("owner"), many=True).data,
+                    lambda: [
+                        representations.diary(row)
+                        for row in Diary.objects.values(*representations.DIARY_VALUES)
+                    ],
+                ),
+                "diary-list": (
+                    lambda: DiaryListSerializer(
+                        self.with_owner(Diary.objects.filter(owner=owner), owner), many=True
+                    ).data,
+                    lambda: [
+                        representations.diary_list_item(row, owner.username)
+                        for row in Diary.objects.filter(owner=owner).values(
+                            *representations.DIARY_LIST_VALUES
+                        )
+                    ],
+                ),
+                "profile": (
+                    lambda: UserProfileSerializer(User.objects.exclude(id=owner.id), many=True).data,
+                    lambda: [representations.profile(user) for user in User.objects.exclude(id=owner.id)],
+                ),
+            }
+            for name, (serializer, fast) in cases.items():
+                self.compare(name, serializer, fast, options["repeat"])
+
+    @staticmethod
+    def with_owner(queryset, owner):
+        # Так же, как DiaryListAPIView до быстрого пути: владелец подставляется без JOIN
+        diaries = list(queryset)
+        for diary in diaries:
+            diary.owner = owner
+        return diaries
+
+    def measure(self, build, repeat):
+        renderer = JSONRenderer()
+        best, body = None, None
+        for _ in range(repeat):
+            with Timer() as timer:
+                body = renderer.render(build())
+            best = timer.elapsed if best is None else min(best, timer.elapsed)
+        return best, body
+
+    def compare(self, name, serializer, fast, repeat):
+        slow_time, slow_body = self.measure(serializer, repeat)
+        fast_time, fast_body = self.measure(fast, repeat)
+        if slow_body != fast_body:
+            raise CommandError(f"{name}: ответы серилизатора и быстрого пути различаются")
+        self.stdout.write(
+            f"{name}: серилизатор {slow_time * 1000:.1f}ms, быстрый путь {fast_time * 1000:.1f}ms, "
+            f"ускорение x{slow_time / fast_time:.1f} ({len(fast_body)} байт, совпадают)"
+        )
@@ -0,0 +1,90 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from account.benchmarks import EXCLUDED_MIDDLEWARE
+from account.management.commands.benchmark_api import get_git_commit
+from account.warmup import warm_up_app
+
+MODES = ("cold", "warm")
+
+
+class Command(BaseCommand):
+    help = (
+        "Холодный старт в свежем процессе: импорт и django.setup(), прогрев (account.warmup) "
+        "и время первого и второго запроса, без прогрева и с ним. Запросы не обращаются к БД"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Процессов на режим")
+        parser.add_argument("--output", help="Сохранить результат в JSON файл")
+        parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+        parser.add_argument("--child", choices=MODES, help="Внутренний режим: один замер в этом процессе")
+        parser.add_argument("--started-at", type=float, help="Внутренний: time.time() перед запуском процесса")
+
+    def handle(self, *args, **options):
+        if options["child"]:
+            self.stdout.write(json.dumps(self.measure(options["child"], options["started_at"])))
+            return
+
+        result = {
+            "meta": {"commit": get_git_commit(), "runs": options["runs"]},
+            "modes": {mode: self.run(mode, options["runs"]) for mode in MODES},
+        }
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f).get("modes", {})
+        for mode, stats in result["modes"].items():
+            line = ", ".join(f"{name}={value}ms" for name, value in stats.items())
+            before = previous.get(mode)
+            if before:
+                line += f" (первый запрос был {before['first_request_ms']}ms)"
+            self.stdout.write(f"{mode}: {line}")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Результат сохранен в {options['output']}"))
+
+    def run(self, mode, runs):
+        samples = []
+        for _ in range(runs):
+            command = [
+                sys.executable, str(settings.BASE_DIR / "manage.py"), "benchmark_startup",
+                "--child", mode, "--started-at", repr(time.time()),
+            ]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode:
+                raise CommandError(completed.stderr)
+            samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        # Медиана по процессам, каждое значение - отдельно
+        return {name: round(statistics.median(s[name] for s in samples), 2) for name in samples[0]}
+
+    def measure(self, mode, started_at):
+        result = {"setup_ms": (time.time() - started_at) * 1000}
+        if mode == "warm":
+            result["warm_up_ms"] = sum(warm_up_app().values()) * 1000
+
+        # Refresh вместо access: полная проверка подписи и 401 без запроса пользователя
+        token = RefreshToken()
+        headers = {"Authorization": f"Bearer {token}"}
+        middleware = [m for m in settings.MIDDLEWARE if m not in EXCLUDED_MIDDLEWARE]
+        client = Client()
+        latencies = []
+        with override_settings(MIDDLEWARE=middleware):
+            for _ in range(2):
+                started = time.perf_counter()
+                response = client.get("/api/users/update/", headers=headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 401:
+                    raise CommandError(f"Ожидался 401, получен {response.status_code}")
+        result["first_request_ms"], result["second_request_ms"] = latencies
+        return result
@@ -0,0 +1,72 @@
+import statistics
+import time
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+from account.hashing import CalibratedPBKDF2PasswordHasher, get_hashing_settings
+
+# Нижняя граница OWASP для PBKDF2-HMAC-SHA256 - быстрее железо не делает пароль дешевле этого
+MIN_ITERATIONS = 600_000
+ROUND_TO = 10_000
+PASSWORD = "CalibratePass123"
+
+
+class Command(BaseCommand):
+    help = (
+        "Подбирает число итераций PBKDF2 под целевое время проверки пароля на этой машине. "
+        "Результат - значение PASSWORD_HASH_ITERATIONS; хэши пользователей обновятся в фоне при входе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target-ms", type=float, default=250.0, help="Целевое время одной проверки")
+        parser.add_argument("--samples", type=int, default=5, help="Замеров на каждое значение")
+        parser.add_argument("--min-iterations", type=int, default=MIN_ITERATIONS)
+
+    def handle(self, *args, **options):
+        if options["samples"] < 1 or options["target_ms"] <= 0:
+            raise CommandError("--samples и --target-ms должны быть положительными")
+        hasher = get_hasher()
+        if not isinstance(hasher, CalibratedPBKDF2PasswordHasher):
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Первый в PASSWORD_HASHERS - {type(hasher).__name__}, подобранное значение не применится"
+                )
+            )
+
+        current = hasher.iterations if isinstance(hasher, PBKDF2PasswordHasher) else None
+        samples = options["samples"]
+        # Пробный замер на значении Django по умолчанию, время PBKDF2 линейно по итерациям
+        probe = PBKDF2PasswordHasher.iterations
+        probe_ms = self.measure(probe, samples)
+        iterations = int(probe * options["target_ms"] / probe_ms) // ROUND_TO * ROUND_TO
+        if iterations < options["min_iterations"]:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"Под {options['target_ms']:.0f}ms выходит {iterations} итераций - "
+                    f"ниже минимума, берется {options['min_iterations']}"
+                )
+            )
+            iterations = options["min_iterations"]
+        result_ms = self.measure(iterations, samples)
+
+        if current:
+            self.stdout.write(f"Сейчас: {current} итераций, {self.measure(current, samples):.1f}ms")
+        max_workers = get_hashing_settings()["MAX_WORKERS"]
+        self.stdout.write(
+            f"Подобрано: {iterations} итераций, {result_ms:.1f}ms на проверку, "
+            f"до {max_workers * 1000 / result_ms:.0f} входов/с на процесс (MAX_WORKERS={max_workers})"
+        )
+        self.stdout.write(self.style.SUCCESS(f"PASSWORD_HASH_ITERATIONS={iterations}"))
+
+    @staticmethod
+    def measure(iterations: int, samples: int) -> float:
+        """Медиана времени encode в миллисекундах; verify считает тот же PBKDF2"""
+        hasher = PBKDF2PasswordHasher()
+        salt = hasher.salt()
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            hasher.encode(PASSWORD, salt, iterations)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,177 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from account.models import Diary, User
+
+# Число дневников на пользователя - Парето: у большинства 0-2, у немногих сотни
+PARETO_ALPHA = 1.5
+USERNAME_DIGITS = 7
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует пользователей и дневники для нагрузочных тестов и проверки планов запросов: "
+        "общий заранее посчитанный хэш пароля, пачки bulk_create или COPY на PostgreSQL. "
+        "Повторный запуск продолжает с последнего созданного пользователя"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--avg-diaries", type=float, default=5.0, help="Среднее число дневников")
+        parser.add_argument("--max-diaries", type=int, default=1000, help="Потолок на пользователя")
+        parser.add_argument("--inactive-percent", type=float, default=2.0, help="Мягко удаленных, %%")
+        parser.add_argument("--days", type=int, default=365, help="На сколько дней назад растянуть даты")
+        parser.add_argument("--chunk-size", type=int, default=10_000)
+        parser.add_argument("--prefix", default="load")
+        parser.add_argument("--password", default="LoadPass123")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--method", choices=("auto", "copy", "bulk"), default="auto",
+            help="copy - COPY FROM STDIN (только PostgreSQL), bulk - bulk_create",
+        )
+
+    def handle(self, *args, **options):
+        method = options["method"]
+        if method == "auto":
+            method = "copy" if connection.vendor == "postgresql" else "bulk"
+        if method == "copy" and connection.vendor != "postgresql":
+            raise CommandError("COPY доступен только на PostgreSQL")
+        if len(options["prefix"]) + USERNAME_DIGITS > 15:
+            raise CommandError("Префикс длиннее 8 символов не пройдет валидацию username")
+
+        self.options = options
+        self.password = make_password(options["password"])
+        self.now = timezone.now()
+        start = self.first_missing_index()
+        total = options["users"]
+        if start >= total:
+            self.stdout.write(self.style.SUCCESS(f"Уже создано {total} пользователей с префиксом {options['prefix']}"))
+            return
+        if start:
+            self.stdout.write(f"Продолжение с пользователя {start}")
+
+        insert_chunk = self.copy_chunk if method == "copy" else self.bulk_chunk
+        started = time.perf_counter()
+        users_done, diaries_done = 0, 0
+        for chunk_start in range(start, total, options["chunk_size"]):
+            indexes = range(chunk_start, min(chunk_start + options["chunk_size"], total))
+            # Пользователи и их дневники в одной транзакции: недописанная пачка не остается
+            with transaction.atomic():
+                diaries_done += insert_chunk(indexes)
+            users_done += len(indexes)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{chunk_start + len(indexes)}/{total} пользователей, +{diaries_done} дневников, "
+                f"{users_done / elapsed:.0f} польз./с"
+            )
+
+        if connection.vendor == "postgresql":
+            # Свежая статистика, иначе планы запросов будут от пустых таблиц
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {User._meta.db_table}, {Diary._meta.db_table}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано {users_done} пользователей и {diaries_done} дневников "
+                f"за {time.perf_counter() - started:.1f}с ({method})"
+            )
+        )
+
+    def username(self, index: int) -> str:
+        return f"{self.options['prefix']}{index:0{USERNAME_DIGITS}d}"
+
+    def first_missing_index(self) -> int:
+        # Имена дополнены нулями - последнее по алфавиту и есть последнее созданное
+        last = User.objects.filter(username__startswith=self.options["prefix"]).aggregate(
+            last=Max("username")
+        )["last"]
+        suffix = last[len(self.options["prefix"]):] if last else ""
+        return int(suffix) + 1 if suffix.isdigit() else 0
+
+    def rng(self, chunk_start: int) -> random.Random:
+        # Одна и та же пачка при тех же параметрах дает те же данные
+        return random.Random(self.options["seed"] * 1_000_003 + chunk_start)
+
+    def diary_count(self, rng: random.Random) -> int:
+        # (X - 1) для Парето(alpha) в среднем 1 / (alpha - 1)
+        value = self.options["avg_diaries"] * (PARETO_ALPHA - 1) * (rng.paretovariate(PARETO_ALPHA) - 1)
+        return min(int(value), self.options["max_diaries"])
+
+    def user_rows(self, indexes, rng):
+        days = self.options["days"]
+        inactive = self.options["inactive_percent"] / 100
+        for index in indexes:
+            date_joined = self.now - timedelta(seconds=rng.uniform(0, days * 86400))
+            is_active = rng.random() >= inactive
+            yield {
+                "username": self.username(index),
+                "email": f"{self.username(index)}@load.example.com",
+                "password": self.password,
+                "date_joined": date_joined,
+                "is_active": is_active,
+                "deleted_at": None if is_active else self.now - timedelta(days=rng.uniform(0, days)),
+            }
+
+    def diary_rows(self, users, rng):
+        """users - (id, date_joined, is_active); дневники датированы между регистрацией и сейчас.
+        Дневники мягко удаленных скрыты, как после UserAuthService.soft_delete_user"""
+        for user_id, date_joined, is_active in users:
+            span = max((self.now - date_joined).total_seconds(), 1)
+            for n in range(self.diary_count(rng)):
+                created_at = date_joined + timedelta(seconds=rng.uniform(0, span))
+                yield user_id, f"Дневник {n}", created_at, not is_active
+
+    def bulk_chunk(self, indexes) -> int:
+        rng = self.rng(indexes[0])
+        users = User.objects.bulk_create(
+            User(**row) for row in self.user_rows(indexes, rng)
+        )
+        diaries = Diary.objects.bulk_create(
+            (
+                Diary(owner_id=owner_id, title=title, is_hidden=is_hidden)
+                for owner_id, title, _, is_hidden in self.diary_rows(
+                    [(user.id, user.date_joined, user.is_active) for user in users], rng
+                )
+            ),
+            batch_size=self.options["chunk_size"],
+        )
+        # auto_now_add перезаписывает created_at в bulk_create, поэтому даты
+        # растянуты только в режиме COPY
+        return len(diaries)
+
+    def copy_chunk(self, indexes) -> int:
+        rng = self.rng(indexes[0])
+        rows = list(self.user_rows(indexes, rng))
+        user_table = connection.ops.quote_name(User._meta.db_table)
+        diary_table = connection.ops.quote_name(Diary._meta.db_table)
+        with connection.cursor() as cursor:
+            with cursor.copy(
+                f"COPY {user_table} (username, email, password, first_name, last_name, is_superuser, "
+                f"is_staff, is_active, date_joined, updated_at, deleted_at, token_epoch) FROM STDIN"
+            ) as copy:
+                for row in rows:
+                    copy.write_row((
+                        row["username"], row["email"], row["password"], "", "", False, False,
+                        row["is_active"], row["date_joined"], self.now, row["deleted_at"], 0,
+                    ))
+            # COPY не возвращает id - забираем их по username (уникальный индекс)
+            cursor.execute(
+                f"SELECT id, date_joined, is_active FROM {user_table} "
+                f"WHERE username BETWEEN %s AND %s ORDER BY username",
+                [rows[0]["username"], rows[-1]["username"]],
+            )
+            users = cursor.fetchall()
+            diaries = 0
+            with cursor.copy(
+                f"COPY {diary_table} (owner_id, title, created_at, updated_at, is_hidden) FROM STDIN"
+            ) as copy:
+                for owner_id, title, created_at, is_hidden in self.diary_rows(users, rng):
+                    copy.write_row((owner_id, title, created_at, created_at, is_hidden))
+                    diaries += 1
+        return diaries
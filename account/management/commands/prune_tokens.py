@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from account.token_prune import expired_tokens, get_token_prune_settings, prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет истекшие refresh токены (OutstandingToken и их BlacklistedToken) "
+        "пачками по индексу (expires_at, id) с паузой между пачками"
+    )
+
+    def add_arguments(self, parser):
+        config = get_token_prune_settings()
+        parser.add_argument("--batch-size", type=int, default=config["BATCH_SIZE"])
+        parser.add_argument("--sleep", type=float, default=config["SLEEP"], help="Пауза между пачками, сек")
+        parser.add_argument("--max-batches", type=int, help="Остановиться после N пачек")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать истекшие токены")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options["dry_run"]:
+            self.stdout.write(f"Истекших токенов: {expired_tokens(now).count()}")
+            return
+
+        def progress(counts):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Пачка: {counts}")
+
+        totals = prune_expired_tokens(
+            now,
+            batch_size=options["batch_size"],
+            sleep=options["sleep"],
+            max_batches=options["max_batches"],
+            on_batch=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Удалено токенов: {totals['tokens']} (из них в blacklist: {totals['blacklisted_tokens']}), "
+                f"пачек: {totals['batches']}"
+            )
+        )
@@ -0,0 +1,91 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from account.purge import MODES, get_purge_settings, purge_deleted_users, purgeable_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет или обезличивает мягко удаленных пользователей старше срока хранения "
+        "вместе с дневниками и токенами, пачками по id в коротких транзакциях"
+    )
+
+    def add_arguments(self, parser):
+        config = get_purge_settings()
+        parser.add_argument("--retention-days", type=int, default=config["RETENTION_DAYS"])
+        parser.add_argument("--mode", choices=MODES, default=config["MODE"])
+        parser.add_argument("--batch-size", type=int, default=config["BATCH_SIZE"])
+        parser.add_argument("--sleep", type=float, default=config["SLEEP"], help="Пауза между пачками, сек")
+        parser.add_argument("--max-batches", type=int, help="Остановиться после N пачек")
+        parser.add_argument(
+            "--state-file",
+            help="JSON с прогрессом: прерванный запуск продолжится с последней обработанной пачки",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать пользователей")
+
+    def handle(self, *args, **options):
+        state = self.load_state(options["state_file"])
+        if state:
+            if state["mode"] != options["mode"]:
+                raise CommandError(
+                    f"Незавершенный запуск в режиме {state['mode']}, удалите {options['state_file']} "
+                    "или запустите в том же режиме"
+                )
+            # Срок хранения не сдвигается между продолжениями одного запуска
+            cutoff = datetime.fromisoformat(state["cutoff"])
+            after_id = state["after_id"]
+            self.stdout.write(f"Продолжение с id > {after_id}")
+        else:
+            cutoff = timezone.now() - timedelta(days=options["retention_days"])
+            after_id = 0
+
+        if options["dry_run"]:
+            count = purgeable_users(cutoff).filter(id__gt=after_id).count()
+            self.stdout.write(f"К очистке ({options['mode']}): {count} пользователей, удаленных до {cutoff}")
+            return
+
+        def save_progress(last_id, counts):
+            self.save_state(
+                options["state_file"],
+                {"after_id": last_id, "cutoff": cutoff.isoformat(), "mode": options["mode"]},
+            )
+
+        totals = purge_deleted_users(
+            cutoff,
+            mode=options["mode"],
+            batch_size=options["batch_size"],
+            sleep=options["sleep"],
+            after_id=after_id,
+            max_batches=options["max_batches"],
+            on_batch=save_progress if options["state_file"] else None,
+        )
+        finished = options["max_batches"] is None or totals["batches"] < options["max_batches"]
+        if finished and options["state_file"] and os.path.exists(options["state_file"]):
+            os.remove(options["state_file"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Удалено' if options['mode'] == 'delete' else 'Обезличено'} пользователей: {totals['users']}, "
+                f"дневников: {totals['diaries']}, токенов: {totals['tokens']} "
+                f"(из них в blacklist: {totals['blacklisted_tokens']}), пачек: {totals['batches']}"
+                + ("" if finished else ", остановлено по --max-batches")
+            )
+        )
+
+    @staticmethod
+    def load_state(path):
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def save_state(path, state):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
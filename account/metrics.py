@@ -0,0 +1,462 @@
+"""Метрики запросов в памяти процесса с выдачей в формате Prometheus.
+В отличие от silk ничего не пишет в БД: на запрос - учет запросов к БД и обновление
+счетчиков под локом. Несколько воркеров gunicorn сбрасывают свои снимки в файлы
+MULTIPROCESS_DIR, а /metrics складывает их"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+
+from . import querylog
+from .query_budget import query_budget
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_SETTINGS = {
+    "ENABLED": True,
+    # Каталог для файлов воркеров (<pid>.json), None - один процесс
+    "MULTIPROCESS_DIR": None,
+    # Как часто воркер сбрасывает снимок в файл, секунды
+    "FLUSH_INTERVAL": 5.0,
+    # Границы гистограммы времени ответа, секунды
+    "BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    # Считать запросы к БД и их время
+    "RECORD_DB": True,
+    # Если задан, /metrics отдается только с заголовком Authorization: Bearer <TOKEN>
+    "TOKEN": None,
+    "EXCLUDE_PATHS": ("/metrics",),
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (имя, метки, "gauge" | "counter", описание, значение)
+Sample = Tuple[str, Dict[str, str], str, str, float]
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+def get_metrics_settings() -> Dict[str, Any]:
+    return {**DEFAULT_METRICS_SETTINGS, **getattr(settings, "ACCOUNT_METRICS", {})}
+
+
+class RouteStats:
+    __slots__ = ("count", "duration", "buckets", "db_queries", "db_duration", "response_bytes", "statuses")
+
+    def __init__(self, bucket_count: int):
+        self.count = 0
+        self.duration = 0.0
+        # Последняя ячейка - +Inf
+        self.buckets = [0] * (bucket_count + 1)
+        self.db_queries = 0
+        self.db_duration = 0.0
+        self.response_bytes = 0
+        self.statuses: Dict[str, int] = {}
+
+    def dump(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data.update(buckets=list(self.buckets), statuses=dict(self.statuses))
+        return data
+
+
+class MetricsRegistry:
+    """Счетчики по (метод, маршрут) одного процесса"""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.bucket_bounds = tuple(buckets)
+        self._routes: Dict[tuple, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(
+        self,
+        method: str,
+        route: str,
+        status_code: int,
+        duration: float,
+        db_queries: int = 0,
+        db_duration: float = 0.0,
+        response_bytes: int = 0,
+    ) -> None:
+        bucket = bisect_left(self.bucket_bounds, duration)
+        status_key = str(status_code)
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = RouteStats(len(self.bucket_bounds))
+            stats.count += 1
+            stats.duration += duration
+            stats.buckets[bucket] += 1
+            stats.db_queries += db_queries
+            stats.db_duration += db_duration
+            stats.response_bytes += response_bytes
+            stats.statuses[status_key] = stats.statuses.get(status_key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = [[method, route, stats.dump()] for (method, route), stats in self._routes.items()]
+        return {"buckets": list(self.bucket_bounds), "routes": routes}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+    """Значения не из запросов (например, пул соединений, account.dbpool). collector
+    вызывается при каждом снимке, значения воркеров складываются"""
+    if collector not in _collectors:
+        _collectors.append(collector)
+    return collector
+
+
+def collect_samples() -> List[list]:
+    samples = []
+    for collector in _collectors:
+        try:
+            samples.extend(list(sample) for sample in collector())
+        except Exception:
+            logger.exception(f"Ошибка сборщика метрик {collector!r}")
+    return samples
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Складывает снимки нескольких процессов, снимки с другими границами пропускаются"""
+    bounds: Optional[List[float]] = None
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    samples: Dict[tuple, list] = {}
+    for snapshot in snapshots:
+        for name, labels, kind, help_text, value in snapshot.get("samples", ()):
+            key = (name, tuple(sorted(labels.items())))
+            if key in samples:
+                samples[key][4] += value
+            else:
+                samples[key] = [name, labels, kind, help_text, value]
+        if bounds is None:
+            bounds = snapshot["buckets"]
+        elif snapshot["buckets"] != bounds:
+            logger.warning("Пропущен снимок метрик с другими границами гистограммы")
+            continue
+        for method, route, stats in snapshot["routes"]:
+            target = merged.get((method, route))
+            if target is None:
+                merged[(method, route)] = {
+                    **stats, "buckets": list(stats["buckets"]), "statuses": dict(stats["statuses"])
+                }
+                continue
+            for name in ("count", "duration", "db_queries", "db_duration", "response_bytes"):
+                target[name] += stats[name]
+            target["buckets"] = [a + b for a, b in zip(target["buckets"], stats["buckets"])]
+            for code, count in stats["statuses"].items():
+                target["statuses"][code] = target["statuses"].get(code, 0) + count
+    return {
+        "buckets": bounds or [],
+        "routes": [[method, route, stats] for (method, route), stats in merged.items()],
+        "samples": list(samples.values()),
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound))
+
+
+def render(snapshot: Dict[str, Any]) -> str:
+    """Текстовый формат Prometheus 0.0.4"""
+    bounds = snapshot["buckets"]
+    routes = sorted(snapshot["routes"], key=lambda item: (item[1], item[0]))
+    lines = [
+        "# HELP account_http_requests_total Запросы по маршруту, методу и статусу",
+        "# TYPE account_http_requests_total counter",
+    ]
+    for method, route, stats in routes:
+        labels = f'method="{method}",route="{_escape(route)}"'
+        for code, count in sorted(stats["statuses"].items()):
+            lines.append(f'account_http_requests_total{{{labels},status="{code}"}} {count}')
+
+    lines += [
+        "# HELP account_http_request_duration_seconds Время ответа",
+        "# TYPE account_http_request_duration_seconds histogram",
+    ]
+    for method, route, stats in routes:
+        labels = f'method="{method}",route="{_escape(route)}"'
+        cumulative = 0
+        for bound, count in zip(bounds, stats["buckets"]):
+            cumulative += count
+            lines.append(
+                f'account_http_request_duration_seconds_bucket{{{labels},le="{_format_bound(bound)}"}} {cumulative}'
+            )
+        lines.append(f'account_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+        lines.append(f'account_http_request_duration_seconds_sum{{{labels}}} {stats["duration"]}')
+        lines.append(f'account_http_request_duration_seconds_count{{{labels}}} {stats["count"]}')
+
+    counters = (
+        ("account_http_db_queries_total", "db_queries", "Запросы к БД"),
+        ("account_http_db_query_duration_seconds_total", "db_duration", "Время запросов к БД"),
+        ("account_http_response_size_bytes_total", "response_bytes", "Размер тел ответов"),
+    )
+    for name, field, help_text in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for method, route, stats in routes:
+            lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {stats[field]}')
+
+    described = set()
+    for name, labels, kind, help_text, value in sorted(snapshot.get("samples", ()), key=lambda item: item[0]):
+        if name not in described:
+            described.add(name)
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in sorted(labels.items()))
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MultiProcessStore:
+    """Снимки воркеров в файлах <pid>.json. Файлы завершившихся воркеров остаются,
+    чтобы счетчики не уменьшались; каталог очищается при старте сервиса"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def write(self, snapshot: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        # Читатель видит либо старый, либо новый файл целиком
+        os.replace(tmp_path, path)
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        snapshots = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать метрики {name}: {e}")
+        return snapshots
+
+
+class Metrics:
+    """Реестр процесса и периодический сброс в MultiProcessStore"""
+
+    def __init__(self):
+        self._registry: Optional[MetricsRegistry] = None
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._pid = os.getpid()
+        # Последние запросы воркера не теряются при его штатной остановке
+        atexit.register(self.flush)
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return get_metrics_settings()
+
+    @property
+    def registry(self) -> MetricsRegistry:
+        if self._registry is None or self._pid != os.getpid():
+            with self._lock:
+                if self._registry is None or self._pid != os.getpid():
+                    # После fork (gunicorn --preload) воркер начинает с нуля
+                    self._registry = MetricsRegistry(self.config["BUCKETS"])
+                    self._pid = os.getpid()
+        return self._registry
+
+    @property
+    def store(self) -> Optional[MultiProcessStore]:
+        directory = self.config["MULTIPROCESS_DIR"]
+        return MultiProcessStore(directory) if directory else None
+
+    def observe(self, *args, **kwargs) -> None:
+        self.registry.observe(*args, **kwargs)
+        store = self.store
+        if store is not None and time.monotonic() - self._last_flush >= self.config["FLUSH_INTERVAL"]:
+            self._last_flush = time.monotonic()
+            self.flush(store)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.registry.snapshot(), "pid": os.getpid(), "samples": collect_samples()}
+
+    def flush(self, store: Optional[MultiProcessStore] = None) -> None:
+        store = store or self.store
+        if store is None:
+            return
+        try:
+            store.write(self.snapshot())
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить метрики: {e}")
+
+    def collect(self) -> Dict[str, Any]:
+        store = self.store
+        if store is None:
+            return self.snapshot()
+        # Свой снимок сбрасываем сразу, чтобы в ответе были последние данные этого воркера
+        self.flush(store)
+        return merge_snapshots(_drop_stale_gauges(snapshot) for snapshot in store.read_all())
+
+    def clear(self) -> None:
+        self.registry.clear()
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _drop_stale_gauges(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    # Счетчики завершившегося воркера остаются в сумме, а мгновенные значения (размер пула) - нет
+    if _process_alive(snapshot.get("pid")):
+        return snapshot
+    return {**snapshot, "samples": [s for s in snapshot.get("samples", ()) if s[2] != "gauge"]}
+
+
+metrics = Metrics()
+
+
+class StartupTimes:
+    """Холодный старт воркера (account.warmup) и время его первого запроса.
+    Отдаются счетчиками: сумма по всем воркерам и их число, среднее - в Prometheus"""
+
+    def __init__(self):
+        self.cold_start: Optional[float] = None
+        self.first_request: Optional[float] = None
+
+    def request_finished(self, duration: float) -> None:
+        if self.first_request is None:
+            self.first_request = duration
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        if self.cold_start is not None:
+            samples += [
+                ("account_worker_starts_total", {}, "counter", "Запущенные воркеры", 1),
+                ("account_worker_cold_start_seconds_total", {}, "counter",
+                 "От fork до готовности воркера", self.cold_start),
+            ]
+        if self.first_request is not None:
+            samples += [
+                ("account_worker_first_requests_total", {}, "counter", "Первые запросы воркеров", 1),
+                ("account_worker_first_request_seconds_total", {}, "counter",
+                 "Время первого запроса воркера", self.first_request),
+            ]
+        return samples
+
+
+startup = StartupTimes()
+register_collector(startup.samples)
+
+
+class QueryTimer:
+    """Число и суммарное время запросов к БД (account.querylog)"""
+
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def record(self, sql: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+
+
+def get_route(request: HttpRequest) -> str:
+    # Шаблон маршрута, а не путь - число меток не растет от id в URL
+    match = getattr(request, "resolver_match", None)
+    if match is None or not match.route:
+        return "<unmatched>"
+    return "/" + match.route.replace("^", "").replace("$", "")
+
+
+class MetricsMiddleware:
+    """Ставится первым в MIDDLEWARE, чтобы время включало остальные middleware"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _skip(self, request: HttpRequest, config: Dict[str, Any]) -> bool:
+        return not config["ENABLED"] or request.path in config["EXCLUDE_PATHS"]
+
+    def _record(self, request, response, started, timer) -> None:
+        duration = time.perf_counter() - started
+        startup.request_finished(duration)
+        metrics.observe(
+            request.method,
+            get_route(request),
+            response.status_code,
+            duration,
+            timer.count if timer else 0,
+            timer.duration if timer else 0.0,
+            0 if response.streaming else len(response.content),
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_metrics_settings()
+        if self._skip(request, config):
+            return self.get_response(request)
+
+        timer = QueryTimer() if config["RECORD_DB"] else None
+        started = time.perf_counter()
+        if timer is None:
+            response = self.get_response(request)
+        else:
+            with querylog.collect(timer):
+                response = self.get_response(request)
+        self._record(request, response, started, timer)
+        return response
+
+    async def __acall__(self, request):
+        config = get_metrics_settings()
+        if self._skip(request, config):
+            return await self.get_response(request)
+
+        timer = QueryTimer() if config["RECORD_DB"] else None
+        started = time.perf_counter()
+        if timer is None:
+            response = await self.get_response(request)
+        else:
+            with querylog.collect(timer):
+                response = await self.get_response(request)
+        self._record(request, response, started, timer)
+        return response
+
+
+@query_budget(0)
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    token = get_metrics_settings()["TOKEN"]
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(render(metrics.collect()), content_type=CONTENT_TYPE)
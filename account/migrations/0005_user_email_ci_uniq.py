@@ -0,0 +1,79 @@
+import account.models
+import django.db.models.functions.text
+from django.db import migrations, models
+
+INDEX_NAME = "account_user_email_ci_uniq"
+
+CONSTRAINT = models.UniqueConstraint(
+    django.db.models.functions.text.Lower("email"),
+    condition=models.Q(("email", ""), _negated=True),
+    name=INDEX_NAME,
+)
+
+
+def create_email_index(apps, schema_editor):
+    """На PostgreSQL индекс строится CONCURRENTLY, без блокировки записи в account_user"""
+    User = apps.get_model("account", "User")
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.add_constraint(User, CONSTRAINT)
+        return
+
+    table = schema_editor.quote_name(User._meta.db_table)
+    name = schema_editor.quote_name(INDEX_NAME)
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+        f"ON {table} (LOWER(\"email\")) WHERE NOT (\"email\" = '')"
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = %s::regclass",
+            [INDEX_NAME],
+        )
+        (is_valid,) = cursor.fetchone()
+    if not is_valid:
+        # Обычно из-за дублей email в разном регистре - их нужно разобрать вручную
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        raise RuntimeError(
+            f"Не удалось построить {INDEX_NAME}: есть email, совпадающие без учета регистра"
+        )
+
+
+def drop_email_index(apps, schema_editor):
+    User = apps.get_model("account", "User")
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.remove_constraint(User, CONSTRAINT)
+        return
+
+    schema_editor.execute(
+        f"DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(INDEX_NAME)}"
+    )
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('account', '0004_alter_diary_options_diary_created_at_and_more'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', account.models.UserManager()),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='user',
+                    constraint=CONSTRAINT,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_email_index, drop_email_index),
+            ],
+        ),
+    ]
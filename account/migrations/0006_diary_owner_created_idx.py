@@ -0,0 +1,54 @@
+from django.db import migrations, models
+
+OWNER_CREATED_INDEX = models.Index(
+    fields=["owner", "-created_at", "-id"],
+    name="account_dia_owner_created_idx",
+)
+# Дублировал первичный ключ
+ID_INDEX = models.Index(fields=["id"], name="account_dia_id_bcf98b_idx")
+
+
+def _concurrently(schema_editor):
+    """На PostgreSQL индексы создаются и удаляются CONCURRENTLY, без блокировки записи"""
+    if schema_editor.connection.vendor == "postgresql":
+        return {"concurrently": True}
+    return {}
+
+
+def forwards(apps, schema_editor):
+    Diary = apps.get_model("account", "Diary")
+    schema_editor.add_index(Diary, OWNER_CREATED_INDEX, **_concurrently(schema_editor))
+    schema_editor.remove_index(Diary, ID_INDEX, **_concurrently(schema_editor))
+
+
+def backwards(apps, schema_editor):
+    Diary = apps.get_model("account", "Diary")
+    schema_editor.add_index(Diary, ID_INDEX, **_concurrently(schema_editor))
+    schema_editor.remove_index(Diary, OWNER_CREATED_INDEX, **_concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('account', '0005_user_email_ci_uniq'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='diary',
+                    index=OWNER_CREATED_INDEX,
+                ),
+                migrations.RemoveIndex(
+                    model_name='diary',
+                    name='account_dia_id_bcf98b_idx',
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(forwards, backwards),
+            ],
+        ),
+    ]
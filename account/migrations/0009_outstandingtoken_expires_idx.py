@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+# Индекс на таблице simplejwt: keyset очистка истекших токенов (account.token_prune)
+# идет диапазоном по (expires_at, id), а не полным сканированием
+EXPIRES_INDEX = models.Index(fields=["expires_at", "id"], name="account_outtok_expires_idx")
+
+
+def _concurrently(schema_editor):
+    """На PostgreSQL индекс создается и удаляется CONCURRENTLY, без блокировки записи"""
+    if schema_editor.connection.vendor == "postgresql":
+        return {"concurrently": True}
+    return {}
+
+
+def forwards(apps, schema_editor):
+    OutstandingToken = apps.get_model("token_blacklist", "OutstandingToken")
+    schema_editor.add_index(OutstandingToken, EXPIRES_INDEX, **_concurrently(schema_editor))
+
+
+def backwards(apps, schema_editor):
+    OutstandingToken = apps.get_model("token_blacklist", "OutstandingToken")
+    schema_editor.remove_index(OutstandingToken, EXPIRES_INDEX, **_concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('account', '0008_user_deleted_at'),
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+    ]
+
+    # Модель чужого приложения - меняется только БД, состояние миграций не трогаем
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0009_outstandingtoken_expires_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='token_epoch',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0010_user_token_epoch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diary',
+            name='is_hidden',
+            field=models.BooleanField(db_default=False, default=False),
+        ),
+    ]
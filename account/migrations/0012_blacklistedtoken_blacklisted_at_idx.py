@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+# Индекс на таблице simplejwt: инкрементальная синхронизация фильтра blacklist
+# (account.blacklist) читает последние строки диапазоном по blacklisted_at
+BLACKLISTED_AT_INDEX = models.Index(fields=["blacklisted_at"], name="account_bltok_blacklisted_idx")
+
+
+def _concurrently(schema_editor):
+    """На PostgreSQL индекс создается и удаляется CONCURRENTLY, без блокировки записи"""
+    if schema_editor.connection.vendor == "postgresql":
+        return {"concurrently": True}
+    return {}
+
+
+def forwards(apps, schema_editor):
+    BlacklistedToken = apps.get_model("token_blacklist", "BlacklistedToken")
+    schema_editor.add_index(BlacklistedToken, BLACKLISTED_AT_INDEX, **_concurrently(schema_editor))
+
+
+def backwards(apps, schema_editor):
+    BlacklistedToken = apps.get_model("token_blacklist", "BlacklistedToken")
+    schema_editor.remove_index(BlacklistedToken, BLACKLISTED_AT_INDEX, **_concurrently(schema_editor))
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('account', '0011_diary_is_hidden'),
+        ('token_blacklist', '0013_alter_blacklistedtoken_options_and_more'),
+    ]
+
+    # Модель чужого приложения - меняется только БД, состояние миграций не трогаем
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
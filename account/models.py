@@ -1,17 +1,74 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Lower
+from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager
 
 
-class User(AbstractUser):
+class UserQuerySet(models.QuerySet):
+    def with_email(self, email: str):
+        """Поиск по email без учета регистра, попадает в индекс account_user_email_ci_uniq"""
+        return (
+            self.alias(email_lower=Lower("email"))
+            .filter(email_lower=Lower(Value(email)))
+            .exclude(email="")
+        )
+
+
+class UserManager(DjangoUserManager.from_queryset(UserQuerySet)):
     pass
 
+
+class User(AbstractUser):
+    # Версия профиля для ETag/Last-Modified
+    updated_at = models.DateTimeField(auto_now=True)
+    # Момент мягкого удаления, от него считается срок хранения (purge_deleted_users)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Версия выданных токенов (claim "epoch"): увеличение отзывает все access и refresh токены.
+    # Не PositiveIntegerField: CHECK при добавлении колонки проверял бы всю таблицу под блокировкой
+    token_epoch = models.IntegerField(default=0)
+
+    objects = UserManager()
+
     def soft_delete(self):
-        """Мягкое удаление пользователя"""
-        self.is_active = False
-        self.save()
+        """Мягкое удаление пользователя вместе с дневниками и токенами (UserAuthService.soft_delete_user)"""
+        from .services import UserAuthService
 
+        UserAuthService.soft_delete_user(self)
         return self
 
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        # Смена пароля отзывает выданные токены, у нового пользователя их нет
+        if self.pk is not None:
+            self.token_epoch += 1
+
+    def check_password(self, raw_password):
+        # Обновление устаревшего хэша идет через set_password и save(update_fields=["password"]) -
+        # это не смена пароля, эпоха остается прежней
+        epoch = self.token_epoch
+        try:
+            return super().check_password(raw_password)
+        finally:
+            self.token_epoch = epoch
+
+    def revoke_tokens(self):
+        """Выход на всех устройствах: одним UPDATE, без перезаписи остальных полей.
+        Эпоха и blacklist в одной транзакции - без отозванных access при живых refresh"""
+        from .authentication import invalidate_user
+
+        with transaction.atomic():
+            User.objects.filter(pk=self.pk).update(token_epoch=F("token_epoch") + 1)
+            self.refresh_from_db(fields=["token_epoch"])
+            # update() не шлет post_save - сбрасываем кэш аутентификации сами
+            invalidate_user(self.pk)
+            return self.blacklist_refresh_tokens()
+
+    def blacklist_refresh_tokens(self) -> int:
+        """Все refresh токены пользователя в blacklist одним запросом (account.tokens)"""
+        from .tokens import blacklist_user_tokens
+
+        return blacklist_user_tokens(self.pk)
+
     def is_deleted(self):
         """Проверка, удален ли пользователь"""
         return not self.is_active
@@ -23,22 +80,44 @@ class User(AbstractUser):
         indexes = [
             models.Index(fields=["is_active", "id"]),
         ]
+        constraints = [
+            # Уникальность email без учета регистра, пустые email не учитываются
+            models.UniqueConstraint(
+                Lower("email"),
+                condition=~Q(email=""),
+                name="account_user_email_ci_uniq",
+            ),
+        ]
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
 
 
+class DiaryQuerySet(models.QuerySet):
+    def visible(self):
+        """Без дневников мягко удаленных пользователей"""
+        return self.filter(is_hidden=False)
+
+
 class Diary(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="diaries")
     title = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Скрыт вместе с мягко удаленным владельцем. db_default - для вставок в обход ORM
+    is_hidden = models.BooleanField(default=False, db_default=False)
+
+    objects = DiaryQuerySet.as_manager()
     
     def __str__(self):
         return f"{self.title} - {self.owner.username}"
     
     class Meta:
         indexes = [
-            models.Index(fields=["id"]),
+            # Список дневников владельца с keyset пагинацией по (created_at, id)
+            models.Index(
+                fields=["owner", "-created_at", "-id"],
+                name="account_dia_owner_created_idx",
+            ),
         ]
         verbose_name = "Дневник"
         verbose_name_plural = "Дневники"
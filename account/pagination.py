@@ -0,0 +1,105 @@
+import base64
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset пагинация по (created_at, id) от новых к старым.
+    В отличие от OFFSET каждая страница - это диапазон по индексу, ее стоимость
+    не зависит от номера страницы"""
+
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Неверный курсор"
+    # Параметры читаются из request.GET: пагинатор работает и с HttpRequest в account.async_views
+    ordering = ("-created_at", "-id")
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, created_at: datetime, pk: int) -> str:
+        raw = f"{created_at.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request) -> Optional[tuple]:
+        encoded = request.GET.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            raw = force_str(base64.urlsafe_b64decode(encoded.encode()))
+            created_at, pk = raw.split("|")
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if cursor is not None:
+            created_at, pk = cursor
+            # created_at__lte дает планировщику границу диапазона по индексу
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                created_at__lte=created_at,
+            )
+        # Берем на одну запись больше, чтобы понять есть ли следующая страница
+        return queryset[: self.page_size_value + 1]
+
+    def _set_page(self, results: list) -> list:
+        self.has_next = len(results) > self.page_size_value
+        results = results[: self.page_size_value]
+        self.last = results[-1] if results else None
+        return results
+
+    @staticmethod
+    def cursor_position(item) -> tuple:
+        # Модель или строка .values() с created_at и id
+        if isinstance(item, dict):
+            return item["created_at"], item["id"]
+        return item.created_at, item.pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async вариант paginate_queryset для ASGI"""
+        page = self.get_page_queryset(queryset, request)
+        return self._set_page([obj async for obj in page])
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(*self.cursor_position(self.last)),
+        )
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
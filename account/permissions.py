@@ -18,4 +18,6 @@ class IsDairyOwner(BasePermission):
     message = "Вы не являетесь владельцем дневника"
 
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
+        # obj - модель или строка .values() (account.representations), владельца не загружаем
+        owner_id = obj["owner_id"] if isinstance(obj, dict) else obj.owner_id
+        return owner_id == request.user.pk
@@ -0,0 +1,136 @@
+"""Окончательное удаление или обезличивание мягко удаленных пользователей.
+Пользователи перебираются по id пачками, каждая пачка - своя короткая транзакция,
+поэтому задачу можно запускать на живой БД (см. команду purge_deleted_users)"""
+
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Coalesce, Concat
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .authentication import invalidate_user
+from .models import Diary, User
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PURGE_SETTINGS = {
+    # Сколько дней мягко удаленный аккаунт хранится до очистки
+    "RETENTION_DAYS": 30,
+    "BATCH_SIZE": 500,
+    # Пауза между пачками, секунды - чтобы не забирать всю запись у живого трафика
+    "SLEEP": 0.5,
+    # "delete" - удалить строку пользователя, "anonymize" - оставить строку без личных данных
+    "MODE": "delete",
+}
+
+MODES = ("delete", "anonymize")
+ANONYMIZED_USERNAME_PREFIX = "deleted-"
+
+
+def get_purge_settings() -> Dict[str, Any]:
+    return {**DEFAULT_PURGE_SETTINGS, **getattr(settings, "ACCOUNT_USER_PURGE", {})}
+
+
+def purgeable_users(cutoff: datetime):
+    """Неактивные пользователи, удаленные раньше cutoff, по возрастанию id (индекс (is_active, id)).
+    У удаленных до появления deleted_at берется updated_at. Персонал не трогаем,
+    уже обезличенных (username = deleted-<id>) пропускаем"""
+    return (
+        User.objects.filter(is_active=False, is_staff=False, is_superuser=False)
+        .alias(deleted=Coalesce("deleted_at", "updated_at"))
+        .filter(deleted__lt=cutoff)
+        .exclude(username=Concat(Value(ANONYMIZED_USERNAME_PREFIX), Cast("id", CharField())))
+        .order_by("id")
+    )
+
+
+def next_batch(cutoff: datetime, after_id: int, size: int) -> List[int]:
+    return list(
+        purgeable_users(cutoff).filter(id__gt=after_id).values_list("id", flat=True)[:size]
+    )
+
+
+def _lock_batch(cutoff: datetime, ids: List[int]) -> List[int]:
+    # Повторная проверка под блокировкой: пользователь мог быть восстановлен после выборки
+    return list(
+        purgeable_users(cutoff).filter(id__in=ids).select_for_update().values_list("id", flat=True)
+    )
+
+
+def _delete_related(ids: List[int]) -> Dict[str, int]:
+    # OutstandingToken.user - SET_NULL, без явного удаления токены остались бы навсегда
+    _, tokens = OutstandingToken.objects.filter(user_id__in=ids).delete()
+    diaries, _ = Diary.objects.filter(owner_id__in=ids).delete()
+    return {
+        "diaries": diaries,
+        "tokens": tokens.get(OutstandingToken._meta.label, 0),
+        "blacklisted_tokens": tokens.get(BlacklistedToken._meta.label, 0),
+    }
+
+
+def delete_users(cutoff: datetime, ids: List[int]) -> Dict[str, int]:
+    with transaction.atomic():
+        ids = _lock_batch(cutoff, ids)
+        if not ids:
+            return {"users": 0}
+        counts = _delete_related(ids)
+        _, users = User.objects.filter(id__in=ids).delete()
+        counts["users"] = users.get(User._meta.label, 0)
+    return counts
+
+
+def anonymize_users(cutoff: datetime, ids: List[int]) -> Dict[str, int]:
+    with transaction.atomic():
+        ids = _lock_batch(cutoff, ids)
+        if not ids:
+            return {"users": 0}
+        counts = _delete_related(ids)
+        counts["users"] = User.objects.filter(id__in=ids).update(
+            username=Concat(Value(ANONYMIZED_USERNAME_PREFIX), Cast("id", CharField())),
+            email="",
+            first_name="",
+            last_name="",
+            password=make_password(None),
+            last_login=None,
+        )
+        # update() не шлет post_save - сбрасываем кэш аутентификации сами
+        for user_id in ids:
+            invalidate_user(user_id)
+    return counts
+
+
+def purge_deleted_users(
+    cutoff: datetime,
+    mode: str = "delete",
+    batch_size: int = 500,
+    sleep: float = 0.0,
+    after_id: int = 0,
+    max_batches: Optional[int] = None,
+    on_batch: Optional[Callable[[int, Dict[str, int]], None]] = None,
+) -> Dict[str, int]:
+    """Обрабатывает пачки до конца или max_batches. on_batch(последний id, счетчики)
+    вызывается после коммита каждой пачки - по нему сохраняется прогресс"""
+    process = delete_users if mode == "delete" else anonymize_users
+    totals = {"batches": 0, "users": 0, "diaries": 0, "tokens": 0, "blacklisted_tokens": 0}
+    while max_batches is None or totals["batches"] < max_batches:
+        ids = next_batch(cutoff, after_id, batch_size)
+        if not ids:
+            break
+        counts = process(cutoff, ids)
+        after_id = ids[-1]
+        totals["batches"] += 1
+        for name, value in counts.items():
+            totals[name] += value
+        logger.info(f"Очистка пользователей ({mode}): до id={after_id}, {counts}")
+        if on_batch is not None:
+            on_batch(after_id, counts)
+        if sleep:
+            time.sleep(sleep)
+    return totals
@@ -0,0 +1,64 @@
+"""Бюджет запросов к БД для представлений.
+Представление объявляет максимум через @query_budget(n), тестовый клиент
+(account.testing) считает запросы каждого вызова и падает со списком SQL,
+если бюджет превышен. Так N+1 и лишние проверки уникальности видны в тестах"""
+
+from typing import Callable, List, Optional
+
+from django.urls import Resolver404
+
+# Служебные запросы, которые не зависят от кода представления
+IGNORED_PREFIXES = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT", "EXPLAIN")
+# silk (local.py) пишет каждый запрос в свои таблицы
+IGNORED_TABLES = ('"silk_',)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries: int) -> Callable:
+    """Максимум запросов к БД на один вызов метода представления или async view"""
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+def get_view_budget(match, method: str) -> Optional[int]:
+    """Бюджет обработчика из ResolverMatch: action ViewSet, метод APIView или функция"""
+    func = match.func
+    view_class = getattr(func, "cls", None) or getattr(func, "view_class", None)
+    if view_class is None:
+        return getattr(func, "query_budget", None)
+    actions = getattr(func, "actions", None)
+    handler_name = actions.get(method.lower()) if actions else method.lower()
+    handler = getattr(view_class, handler_name or "", None)
+    return getattr(handler, "query_budget", None)
+
+
+class QueryRecorder:
+    """Собирает SQL без служебных запросов (account.querylog)"""
+
+    def __init__(self):
+        self.queries: List[str] = []
+
+    def record(self, sql: str, duration: float) -> None:
+        if not sql.startswith(IGNORED_PREFIXES) and not any(t in sql for t in IGNORED_TABLES):
+            self.queries.append(sql)
+
+
+def check_query_budget(response, method: str, queries: List[str]) -> None:
+    try:
+        match = response.resolver_match
+        budget = get_view_budget(match, method)
+    except Resolver404:
+        return
+    if budget is None or len(queries) <= budget:
+        return
+    listing = "\n".join(f"{i}. {sql}" for i, sql in enumerate(queries, 1))
+    raise QueryBudgetExceeded(
+        f"{method} {match.route}: {len(queries)} запросов к БД при бюджете {budget}\n{listing}"
+    )
@@ -0,0 +1,41 @@
+"""Учет запросов к БД в пределах одного HTTP запроса.
+Обертка ставится на каждое соединение при подключении (signals.py), а получатели
+берутся из contextvar. connection.execute_wrapper здесь не подходит: async ORM
+выполняет запросы в потоке sync_to_async со своим соединением, а contextvar
+туда копируется"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Tuple
+
+_collectors: ContextVar[Tuple] = ContextVar("account_query_collectors", default=())
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    collectors = _collectors.get()
+    if not collectors:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for collector in collectors:
+            collector.record(sql, duration)
+
+
+def install(connection) -> None:
+    # В начало списка: connection.execute_wrapper() снимает обертки с конца
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+@contextmanager
+def collect(collector):
+    """collector.record(sql, duration) вызывается для каждого запроса внутри блока"""
+    token = _collectors.set(_collectors.get() + (collector,))
+    try:
+        yield collector
+    finally:
+        _collectors.reset(token)
@@ -0,0 +1,47 @@
+"""Ответы только на чтение без серилизаторов DRF.
+Дневники собираются из строк .values() сразу в dict, без модели и JOIN на всю строку
+владельца, профиль - из уже загруженного пользователя. JSON совпадает байт в байт с
+DairySerializer, DiaryListSerializer и UserProfileSerializer (см. TestRepresentations),
+серилизаторы остаются для валидации и схемы"""
+
+from typing import Any, Dict
+
+from rest_framework import serializers
+
+from .models import User
+from .serializers import DATE_JOINED_FORMAT
+
+# Поля для .values(): owner_id нужен для проверки владельца, updated_at - для ETag
+DIARY_VALUES = ("id", "owner_id", "owner__username", "title", "updated_at")
+DIARY_LIST_VALUES = ("id", "title", "created_at")
+
+# Те же поля DRF, что и в серилизаторах - форматирование дат не расходится
+_iso_datetime = serializers.DateTimeField()
+_date_joined = serializers.DateTimeField(format=DATE_JOINED_FORMAT)
+
+
+def diary(row: Dict[str, Any]) -> Dict[str, Any]:
+    """DairySerializer: owner - это str(owner), то есть username"""
+    return {"owner": row["owner__username"], "title": row["title"]}
+
+
+def diary_list_item(row: Dict[str, Any], owner: str) -> Dict[str, Any]:
+    """DiaryListSerializer, владелец у всей страницы один"""
+    return {
+        "id": row["id"],
+        "owner": owner,
+        "title": row["title"],
+        "created_at": _iso_datetime.to_representation(row["created_at"]),
+    }
+
+
+def profile(user: User) -> Dict[str, Any]:
+    """UserProfileSerializer"""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "date_joined": _date_joined.to_representation(user.date_joined),
+    }
@@ -1,9 +1,25 @@
 from django.contrib.auth import authenticate
 from rest_framework import serializers
-from rest_framework.validators import UniqueValidator
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (
+    TokenRefreshSerializer as BaseTokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
 
 # локальные импорты
+from . import db_routing
+from .authentication import check_token_epoch, epoch_cache
 from .models import User, Diary
+from .hashing import adummy_verify, averify_password, dummy_verify, verify_password
+from .throttling import login_failures
+from .tokens import RefreshToken
+
+DATE_JOINED_FORMAT = "%d-%m-%Y %H:%M"
+
+
+def same_credentials(user: User, other) -> bool:
+    """Тот же хэш и статус - повторная проверка пароля дала бы тот же ответ"""
+    return other is not None and user.password == other.password and user.is_active == other.is_active
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -11,22 +27,9 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     принимает username, password, password2"""
 
     password2 = serializers.CharField(write_only=True)
-    username = serializers.CharField(
-        validators=[
-            UniqueValidator(
-                queryset=User.objects.all(),
-                message="Пользователь с таким логином уже существует",
-            )
-        ]
-    )
-    email = serializers.EmailField(
-        validators=[
-            UniqueValidator(
-                queryset=User.objects.all(),
-                message="Пользователь с таким email уже существует",
-            )
-        ]
-    )
+    # Уникальность username и email проверяет сам INSERT (см. UserAuthService.register_user)
+    username = serializers.CharField()
+    email = serializers.EmailField()
 
     class Meta:
         model = User
@@ -63,35 +66,70 @@ class UserLoginSerializer(serializers.Serializer):
         """Проверка правильно ли пользователь ввел данные от аккаунта(не сработает с is_active=False)
         при неверных данных всегда вернет неверный логин или пароль в целях безопасности
         """
-        try:
-            user = User.objects.get(email=data["email"])
-            if not user.check_password(data["password"]):
-                raise User.DoesNotExist()
+        # 429 до поиска пользователя и хэширования, если по аккаунту много неудачных попыток
+        login_failures.check(data["email"])
+        user = User.objects.with_email(data["email"]).first()
+        if user is None:
+            # Считаем хэш и для несуществующего email, чтобы не выдать его временем ответа
+            dummy_verify(data["password"])
+        # PBKDF2 считается в отдельном ограниченном пуле (account.hashing)
+        is_valid = user is not None and verify_password(user, data["password"]) and not user.is_deleted()
+        if not is_valid and db_routing.reading_from_replica():
+            # Реплика могла еще не получить новый аккаунт, смену пароля или восстановление
+            primary = User.objects.using(db_routing.PRIMARY).with_email(data["email"]).first()
+            if primary is not None and not same_credentials(primary, user):
+                user = primary
+                is_valid = verify_password(user, data["password"]) and not user.is_deleted()
+
+        if not is_valid:
+            login_failures.record_failure(data["email"])
+            raise serializers.ValidationError("Неверная почта или пароль")
 
-            if user.is_deleted():
-                raise User.DoesNotExist()
+        if user._state.db != db_routing.PRIMARY:
+            # Эпоха токенов с реплики может отставать - выданные токены сразу оказались бы отозванными
+            user.token_epoch = epoch_cache.get(user.pk)
+        login_failures.reset(data["email"])
+        data["user"] = user
+        return data
 
-        except User.DoesNotExist:
+    async def avalidate(self, data):
+        """Async вариант validate для ASGI, поля уже проверены to_internal_value"""
+        login_failures.check(data["email"])
+        user = await User.objects.with_email(data["email"]).afirst()
+        if user is None:
+            await adummy_verify(data["password"])
+        is_valid = (
+            user is not None
+            and await averify_password(user, data["password"])
+            and not user.is_deleted()
+        )
+        if not is_valid and db_routing.reading_from_replica():
+            primary = await User.objects.using(db_routing.PRIMARY).with_email(data["email"]).afirst()
+            if primary is not None and not same_credentials(primary, user):
+                user = primary
+                is_valid = await averify_password(user, data["password"]) and not user.is_deleted()
+
+        if not is_valid:
+            login_failures.record_failure(data["email"])
             raise serializers.ValidationError("Неверная почта или пароль")
 
+        if user._state.db != db_routing.PRIMARY:
+            user.token_epoch = await epoch_cache.aget(user.pk)
+        login_failures.reset(data["email"])
         data["user"] = user
         return data
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
-    date_joined = serializers.DateTimeField(format="%d-%m-%Y %H:%M", read_only=True)
+    date_joined = serializers.DateTimeField(format=DATE_JOINED_FORMAT, read_only=True)
 
     class Meta:
         model = User
         fields = ["id", "username", "email", "first_name", "last_name", "date_joined"]
         read_only_fields = ["id", "username", "date_joined"]
 
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exclude(id=self.instance.id).exists():
-            raise serializers.ValidationError(
-                "Пользователь с таким email уже существует."
-            )
-        return value
+    # Уникальность email без запроса в БД: ее проверяет ограничение при UPDATE
+    # (UserAuthService.update_profile), ошибка отдается в том же формате
 
     def validate_first_name(self, value):
         if len(value.strip()) < 3:
@@ -112,3 +150,70 @@ class DairySerializer(serializers.ModelSerializer):
     class Meta:
         model = Diary
         fields = ["owner", "title"]
+
+
+class DiaryListSerializer(DairySerializer):
+    """Элемент списка дневников, id и created_at нужны клиенту для ссылок и курсора"""
+
+    class Meta(DairySerializer.Meta):
+        fields = ["id", "owner", "title", "created_at"]
+
+
+class DiaryBatchOperationSerializer(serializers.Serializer):
+    """Одна операция пачки (account.diary_batch): create - title, update - id и title, delete - id"""
+
+    op = serializers.ChoiceField(choices=["create", "update", "delete"])
+    id = serializers.IntegerField(min_value=1, required=False)
+    title = serializers.CharField(max_length=Diary._meta.get_field("title").max_length, required=False)
+
+    def validate(self, data):
+        if data["op"] == "create" and "id" in data:
+            raise serializers.ValidationError({"id": "id задает база при создании"})
+        if data["op"] != "create" and "id" not in data:
+            raise serializers.ValidationError({"id": "Обязательное поле."})
+        if data["op"] != "delete" and "title" not in data:
+            raise serializers.ValidationError({"title": "Обязательное поле."})
+        return data
+
+
+class DiaryBatchSerializer(serializers.Serializer):
+    operations = DiaryBatchOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        from .diary_batch import get_diary_batch_settings
+
+        max_operations = get_diary_batch_settings()["MAX_OPERATIONS"]
+        if len(operations) > max_operations:
+            raise serializers.ValidationError(f"Не больше {max_operations} операций за запрос.")
+        ids = [operation["id"] for operation in operations if "id" in operation]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Один дневник - одна операция в пачке.")
+        return operations
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """Обновление токенов с проверкой blacklist через фильтр в памяти (account.blacklist)
+    и эпохи токенов: после отзыва старый refresh не обновляется"""
+
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        # Как в simplejwt, но пользователь читается один раз и с основной БД - вместе с эпохой
+        refresh = self.token_class(attrs["refresh"])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id:
+            user = User.objects.using(db_routing.PRIMARY).filter(pk=user_id).first()
+            if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+            check_token_epoch(refresh, user.token_epoch)
+
+        data = {"access": str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data["refresh"] = str(refresh)
+        return data
@@ -1,23 +1,94 @@
 from .models import User
-from typing import Tuple, Optional, Dict, Any
-from django.db import IntegrityError
-from .models import User
-from rest_framework_simplejwt.tokens import RefreshToken
+import time
+from contextlib import nullcontext
+from typing import Tuple, Optional, Dict, Any, List, Union
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import db_routing
+from .models import Diary, User
+from .hashing import hash_password
+from .tokens import RefreshToken, blacklist_user_tokens
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Имя нарушенного ограничения (PostgreSQL) или фрагмент текста ошибки (SQLite) -> поле
+UNIQUE_CONSTRAINT_FIELDS = {
+    "account_user_email_ci_uniq": "email",
+    "account_user_username_key": "username",
+    "account_user.username": "username",
+}
+
+UNIQUE_FIELD_ERRORS = {
+    "username": "Пользователь с таким логином уже существует",
+    "email": "Пользователь с таким email уже существует",
+}
+
+# Ошибки уникальности при обновлении профиля (текст email как до перехода на ограничение)
+PROFILE_FIELD_ERRORS = {
+    **UNIQUE_FIELD_ERRORS,
+    "email": "Пользователь с таким email уже существует.",
+}
+
+
+def get_violated_unique_field(error: IntegrityError) -> Optional[str]:
+    """По IntegrityError определяет, какое поле нарушило уникальность"""
+    diag = getattr(error.__cause__, "diag", None)
+    text = getattr(diag, "constraint_name", None) or str(error)
+    for constraint, field in UNIQUE_CONSTRAINT_FIELDS.items():
+        if constraint in text:
+            return field
+    return None
+
+
+def changed_fields(instance, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля из data, которые отличаются от текущих значений instance"""
+    return {field: value for field, value in data.items() if getattr(instance, field) != value}
+
+
+def _unique_error(
+    error: IntegrityError, messages: Dict[str, str] = UNIQUE_FIELD_ERRORS
+) -> Dict[str, List[str]]:
+    field = get_violated_unique_field(error)
+    if field is None:
+        raise error
+    return {field: [messages[field]]}
+
+
+def fresh_user(user: User):
+    """Строка пользователя с основной БД. request.user из кэша аутентификации может отставать
+    на LOCAL_TTL от записи в другом процессе: решать по нему, что изменилось, нельзя"""
+    return User.objects.using(db_routing.PRIMARY).defer("password").filter(pk=user.pk)
+
 
 class UserAuthService:
     @staticmethod
     def register_user(
         validated_data: Dict[str, Any],
-    ) -> Tuple[Optional[User], Optional[str]]:
-        """Регистрация по логину и паролю"""
+    ) -> Tuple[Optional[User], Optional[Union[str, Dict[str, List[str]]]]]:
+        """Регистрация по логину и паролю.
+        Уникальность проверяется одним INSERT, при нарушении возвращаются
+        ошибки по полям в том же формате, что отдает валидация серилизатора"""
         validated_data.pop("password2", None)
+        # Хэшируем в пуле account.hashing, при перегрузке наружу уходит 503.
+        # Хэш считается и для занятых username/email: проверка exists() до хэширования сэкономила бы
+        # PBKDF2 только на дублях, но добавила бы запрос каждой успешной регистрации. Наплыв со свободными
+        # именами стоит столько же, его держат лимиты register_ip/register_global и очередь MAX_PENDING
+        password = hash_password(validated_data.pop("password"))
         try:
-            user = User.objects.create_user(**validated_data)
+            # Savepoint нужен только внутри внешней транзакции, иначе INSERT идет в autocommit
+            with transaction.atomic() if connection.in_atomic_block else nullcontext():
+                # То же что create_user, но с уже готовым хэшем пароля
+                user = User.objects.create(
+                    **{
+                        **validated_data,
+                        "username": User.normalize_username(validated_data["username"]),
+                        "email": User.objects.normalize_email(validated_data.get("email")),
+                        "password": password,
+                    }
+                )
             logger.info(
                 f"Пользователь с username: '{validated_data['username']}' создан"
             )
@@ -27,17 +98,100 @@ class UserAuthService:
             logger.error(
                 f"Ошибка уникальности при регистрации {validated_data['username']}: {e}"
             )
-            return None, "Пользователь с таким именем уже существует"
+            field = get_violated_unique_field(e)
+            if field is None:
+                return None, "Пользователь с таким именем уже существует"
+            return None, {field: [UNIQUE_FIELD_ERRORS[field]]}
         except Exception as e:
             logger.error(f"Ошибка регистрации пользователя {validated_data}", e)
             return None, str(e)
 
+    @staticmethod
+    def update_profile(
+        user: User, validated_data: Dict[str, Any]
+    ) -> Tuple[User, Optional[Dict[str, List[str]]]]:
+        """Обновление профиля: UPDATE только полей, отличающихся от строки в основной БД,
+        без изменений - без записи. Возвращает пользователя из этой строки.
+        Уникальность email проверяет ограничение account_user_email_ci_uniq, а не SELECT перед UPDATE"""
+        fresh = fresh_user(user).get()
+        changed = changed_fields(fresh, validated_data)
+        if not changed:
+            return fresh, None
+        for field, value in changed.items():
+            setattr(fresh, field, value)
+        try:
+            with transaction.atomic() if connection.in_atomic_block else nullcontext():
+                # updated_at (auto_now) - версия профиля для ETag, пишется вместе с полями
+                fresh.save(update_fields=[*changed, "updated_at"])
+        except IntegrityError as e:
+            return user, _unique_error(e, PROFILE_FIELD_ERRORS)
+        return fresh, None
+
+    @staticmethod
+    async def aupdate_profile(
+        user: User, validated_data: Dict[str, Any]
+    ) -> Tuple[User, Optional[Dict[str, List[str]]]]:
+        """Async вариант update_profile, async ORM работает в autocommit"""
+        fresh = await fresh_user(user).aget()
+        changed = changed_fields(fresh, validated_data)
+        if not changed:
+            return fresh, None
+        for field, value in changed.items():
+            setattr(fresh, field, value)
+        try:
+            await fresh.asave(update_fields=[*changed, "updated_at"])
+        except IntegrityError as e:
+            return user, _unique_error(e, PROFILE_FIELD_ERRORS)
+        return fresh, None
+
     @staticmethod
     def login_user(validated_data: Dict[str, Any]) -> Dict[str, Any]:
         """Вход по логину и паролю отдает токены"""
         user = validated_data["user"]
         # Делаем и возвращаем токены пользователю
         refresh = RefreshToken.for_user(user)
+        return UserAuthService._login_response(refresh, validated_data)
+
+    @staticmethod
+    async def alogin_user(validated_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Async вариант login_user для ASGI"""
+        refresh = await RefreshToken.afor_user(validated_data["user"])
+        return UserAuthService._login_response(refresh, validated_data)
+
+    @staticmethod
+    def soft_delete_user(user: User) -> Dict[str, Any]:
+        """Мягкое удаление одной транзакцией: UPDATE нужных полей пользователя,
+        скрытие всех его дневников одним UPDATE и все refresh токены в blacklist
+        одним INSERT ... SELECT. Возвращает число строк и время в секундах"""
+        started = time.perf_counter()
+        with transaction.atomic():
+            user.is_active = False
+            user.deleted_at = timezone.now()
+            # Эпоха отзывает и access токены, которые в blacklist не попадают. F(), как в revoke_tokens:
+            # эпоха экземпляра (из кэша) может отставать, и абсолютное значение затерло бы
+            # параллельный выход везде
+            user.token_epoch = F("token_epoch") + 1
+            user.save(update_fields=["is_active", "deleted_at", "token_epoch", "updated_at"])
+            user.refresh_from_db(fields=["token_epoch"])
+            diaries = Diary.objects.filter(owner_id=user.pk, is_hidden=False).update(is_hidden=True)
+            tokens = blacklist_user_tokens(user.pk)
+        result = {"diaries": diaries, "tokens": tokens, "duration": time.perf_counter() - started}
+        logger.info(
+            f"Пользователь {user.username} удален: скрыто дневников {diaries}, "
+            f"отозвано токенов {tokens}, {result['duration'] * 1000:.1f}ms"
+        )
+        return result
+
+    @staticmethod
+    def logout_everywhere(user: User) -> int:
+        """Выход на всех устройствах: эпоха токенов отзывает access токены,
+        refresh токены уходят в blacklist одним запросом. Возвращает их число"""
+        count = user.revoke_tokens()
+        logger.info(f"Пользователь {user.username} вышел на всех устройствах, отозвано токенов: {count}")
+        return count
+
+    @staticmethod
+    def _login_response(refresh: RefreshToken, validated_data: Dict[str, Any]) -> Dict[str, Any]:
         access = refresh.access_token
 
         logger.info(f"Пользователь {validated_data['email']} вошел в аккаунт")
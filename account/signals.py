@@ -0,0 +1,21 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import querylog
+from .authentication import invalidate_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance: User, **kwargs):
+    """Любое изменение строки пользователя (soft_delete, обновление профиля,
+    смена пароля) сбрасывает его из кэша аутентификации"""
+    invalidate_user(instance.pk)
+
+
+@receiver(connection_created)
+def install_query_log(sender, connection, **kwargs):
+    """Учет запросов для метрик и бюджетов запросов (account.querylog)"""
+    querylog.install(connection)
@@ -0,0 +1,23 @@
+"""Тестовые клиенты, которые проверяют бюджет запросов (account.query_budget) на каждом вызове"""
+
+from django.test import AsyncClient
+from rest_framework.test import APIClient
+
+from . import querylog
+from .query_budget import QueryRecorder, check_query_budget
+
+
+class BudgetAPIClient(APIClient):
+    def request(self, **kwargs):
+        with querylog.collect(QueryRecorder()) as recorder:
+            response = super().request(**kwargs)
+        check_query_budget(response, kwargs["REQUEST_METHOD"], recorder.queries)
+        return response
+
+
+class BudgetAsyncClient(AsyncClient):
+    async def request(self, **request):
+        with querylog.collect(QueryRecorder()) as recorder:
+            response = await super().request(**request)
+        check_query_budget(response, request["method"], recorder.queries)
+        return response
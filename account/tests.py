@@ -1,18 +1,44 @@
 import pytest
+from unittest import skipUnless
+from django.conf import settings
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import Diary
+from .testing import BudgetAPIClient, BudgetAsyncClient
 
 User = get_user_model()
 
 
-class TestUserAuthentication(APITestCase):
+def app_queries(ctx, table=None):
+    """SQL из CaptureQueriesContext без запросов silk (в local.py он пишет каждый запрос в БД)"""
+    return [
+        q['sql'] for q in ctx.captured_queries
+        if '"silk_' not in q['sql'] and not q['sql'].startswith('EXPLAIN')
+        and (table is None or f'"{table}"' in q['sql'])
+    ]
+
+
+class AccountAPITestCase(APITestCase):
+    """Базовый класс тестов: лимиты частоты в памяти процесса сбрасываются для каждого класса,
+    клиент проверяет бюджет запросов к БД (account.query_budget) на каждом вызове"""
+
+    client_class = BudgetAPIClient
+
+    @classmethod
+    def setUpClass(cls):
+        from .throttling import reset_rate_limits
+
+        super().setUpClass()
+        reset_rate_limits()
+
+
+class TestUserAuthentication(AccountAPITestCase):
     def setUp(self):
-        self.client = APIClient()
+        self.client = BudgetAPIClient()
         
         self.register_url = '/api/users/register/'
         self.login_url = '/api/users/login/'
@@ -123,9 +149,9 @@ class TestUserAuthentication(APITestCase):
         self.assertFalse(self.user.is_active)
 
 
-class TestUserProfile(APITestCase):
+class TestUserProfile(AccountAPITestCase):
     def setUp(self):
-        self.client = APIClient()
+        self.client = BudgetAPIClient()
         self.profile_url = '/api/users/update/'
         
         self.user = User.objects.create_user(
@@ -164,16 +190,74 @@ class TestUserProfile(APITestCase):
         response = self.client.patch(self.profile_url, update_data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_duplicate_email_rejected_by_constraint(self):
+        """Тест что занятый email (в другом регистре) отклоняет ограничение, без поиска email перед UPDATE"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        User.objects.create_user(username='otheruser', email='other@example.com', password='TestPass123')
+        self.client.get(self.profile_url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(self.profile_url, {'email': 'Other@Example.com', 'first_name': 'Newer'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['email'], ['Пользователь с таким email уже существует.'])
+        # Единственный SELECT - строка пользователя по id с основной БД
+        selects = [sql for sql in app_queries(ctx) if sql.startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('"email"', selects[0].split('WHERE', 1)[1])
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.email, self.user.first_name), ('test@example.com', 'Old'))
+        # Кэш аутентификации не получил несохраненные значения
+        self.assertEqual(self.client.get(self.profile_url).data['first_name'], 'Old')
+
+    def test_update_writes_only_changed_fields(self):
+        """Тест что UPDATE пишет только измененные поля, а без изменений записи нет"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.get(self.profile_url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(self.profile_url, {'first_name': 'Old', 'last_name': 'Name'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [sql for sql in app_queries(ctx) if 'SAVEPOINT' not in sql and not sql.startswith('SELECT')], []
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(self.profile_url, {'first_name': 'Fresh', 'last_name': 'Name'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [sql for sql in app_queries(ctx) if sql.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"first_name"', updates[0])
+        self.assertIn('"updated_at"', updates[0])
+        self.assertNotIn('"last_name"', updates[0])
+        self.assertNotIn('"password"', updates[0])
+
+    def test_update_compares_with_primary_row(self):
+        """Тест что изменения сравниваются со строкой в БД, а не с пользователем из кэша:
+        запись другого процесса не сбрасывает кэш этого, и PATCH старого значения не должен потеряться"""
+        self.client.get(self.profile_url)
+        # Запись в другом процессе: update() не шлет post_save, кэш здесь остается старым
+        User.objects.filter(pk=self.user.pk).update(first_name='Bobby')
+
+        response = self.client.patch(self.profile_url, {'first_name': 'Old'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['first_name'], 'Old')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Old')
+
     def test_update_profile_unauthorized(self):
         """Тест обновления профиля без авторизации"""
-        client = APIClient()
+        client = BudgetAPIClient()
         response = client.patch(self.profile_url, {})
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class TestDiaryPermissions(APITestCase):
+class TestDiaryPermissions(AccountAPITestCase):
     def setUp(self):
-        self.client = APIClient()
+        self.client = BudgetAPIClient()
         
         self.owner = User.objects.create_user(
             username='owner',
@@ -238,7 +322,7 @@ class TestDiaryPermissions(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class TestModels(APITestCase):
+class TestModels(AccountAPITestCase):
     def test_user_soft_delete(self):
         """Тест мягкого удаления пользователя"""
         user = User.objects.create_user(
@@ -280,7 +364,7 @@ class TestModels(APITestCase):
         self.assertEqual(diary.title, 'Test Diary')
 
 
-class TestServices(APITestCase):
+class TestServices(AccountAPITestCase):
     def test_user_auth_service_register_success(self):
         """Тест сервиса регистрации пользователя"""
         from .services import UserAuthService
@@ -330,4 +414,1470 @@ class TestServices(APITestCase):
         response = UserAuthService.login_user(validated_data)
         
         self.assertIn('tokens', response)
-        self.assertIn('access', response['tokens'])
\ No newline at end of file
+        self.assertIn('access', response['tokens'])
+
+    def test_soft_delete_user_cascades(self):
+        """Тест что удаление одной транзакцией скрывает дневники и отзывает токены только этого пользователя"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+        from .services import UserAuthService
+        from .tokens import RefreshToken as AccountRefreshToken
+
+        user = User.objects.create_user(username='gone', email='gone@example.com', password='TestPass123')
+        other = User.objects.create_user(username='stays', email='stays@example.com', password='TestPass123')
+        Diary.objects.bulk_create([Diary(owner=user, title=f'Diary {n}') for n in range(3)])
+        Diary.objects.create(owner=other, title='Other')
+        for _ in range(2):
+            AccountRefreshToken.for_user(user)
+        AccountRefreshToken.for_user(other)
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = UserAuthService.soft_delete_user(user)
+        self.assertEqual((result['diaries'], result['tokens']), (3, 2))
+        self.assertGreaterEqual(result['duration'], 0)
+        statements = [sql for sql in app_queries(ctx) if 'SAVEPOINT' not in sql]
+        # UPDATE пользователя, чтение новой эпохи, дневники, blacklist
+        self.assertEqual(len(statements), 4)
+        self.assertNotIn('"password"', statements[0])
+
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertIsNotNone(user.deleted_at)
+        self.assertEqual(Diary.objects.visible().filter(owner=user).count(), 0)
+        self.assertEqual(Diary.objects.visible().filter(owner=other).count(), 1)
+        self.assertEqual(BlacklistedToken.objects.filter(token__user=other).count(), 0)
+
+    def test_soft_delete_keeps_concurrent_epoch_bump(self):
+        """Тест что удаление по устаревшему экземпляру не затирает эпоху выхода везде из другого процесса"""
+        from django.db.models import F
+        from .services import UserAuthService
+
+        user = User.objects.create_user(username='racer', email='racer@example.com', password='TestPass123')
+        epoch = user.token_epoch
+        User.objects.filter(pk=user.pk).update(token_epoch=F('token_epoch') + 1)
+
+        UserAuthService.soft_delete_user(user)
+        self.assertEqual(user.token_epoch, epoch + 2)
+        self.assertEqual(User.objects.get(pk=user.pk).token_epoch, epoch + 2)
+
+class TestCachedAuthentication(AccountAPITestCase):
+    def setUp(self):
+        from .authentication import epoch_cache, user_cache
+
+        user_cache.clear()
+        epoch_cache.clear()
+        self.client = BudgetAPIClient()
+        self.user = User.objects.create_user(
+            username='cacheduser',
+            email='cached@example.com',
+            password='TestPass123'
+        )
+        self.diary = Diary.objects.create(owner=self.user, title='Cached Diary')
+        self.diary_url = f'/api/diary/{self.diary.id}/'
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def _user_selects(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.diary_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "account_user"' in q['sql']
+        ]
+
+    def test_second_request_uses_cache(self):
+        """Тест что повторный запрос не делает SELECT пользователя"""
+        self.assertEqual(len(self._user_selects()), 1)
+        self.assertEqual(self._user_selects(), [])
+
+    def test_soft_delete_invalidates_cache(self):
+        """Тест что soft_delete сбрасывает кэш и дальше будет 401"""
+        self._user_selects()
+        self.user.soft_delete()
+
+        response = self.client.get(self.diary_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_soft_delete_in_other_process(self):
+        """Тест что удаление в другом процессе видно здесь после EPOCH_LOCAL_TTL, а не LOCAL_TTL"""
+        from unittest import mock
+        from .authentication import epoch_cache, user_cache
+
+        self.assertEqual(self.client.get('/api/users/update/').status_code, status.HTTP_200_OK)
+        # Кэш сбрасывает только процесс, который пишет - здесь пользователь остается в кэше
+        with mock.patch('account.signals.invalidate_user'):
+            self.user.soft_delete()
+        self.assertTrue(user_cache.get(self.user.id).is_active)
+
+        # Истек TTL эпохи: пользователь перечитывается с основной БД
+        epoch_cache.clear()
+        response = self.client.get('/api/users/update/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_invalidates_cache(self):
+        """Тест что обновление профиля сбрасывает кэш"""
+        from .authentication import user_cache
+
+        self._user_selects()
+        response = self.client.patch('/api/users/update/', {'first_name': 'Cached'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(user_cache.get(self.user.id))
+
+
+class TestTokenEpoch(AccountAPITestCase):
+    """Токены из account.tokens: дневники без SELECT пользователя, отзыв по token_epoch"""
+
+    def setUp(self):
+        from .authentication import epoch_cache, user_cache
+        from .tokens import RefreshToken as AccountRefreshToken
+
+        user_cache.clear()
+        epoch_cache.clear()
+        self.client = BudgetAPIClient()
+        self.user = User.objects.create_user(
+            username='epochuser',
+            email='epoch@example.com',
+            password='TestPass123'
+        )
+        self.diary = Diary.objects.create(owner=self.user, title='Epoch Diary')
+        self.diary_url = f'/api/diary/{self.diary.id}/'
+        self.refresh = AccountRefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def _user_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Запросы дневника тоже упоминают account_user (JOIN за username) - берем только FROM
+        return [sql for sql in app_queries(ctx) if 'FROM "account_user"' in sql]
+
+    def _refresh_status(self):
+        response = BudgetAPIClient().post('/api/token/refresh/', {'refresh': str(self.refresh)})
+        return response.status_code
+
+    def test_diary_without_user_select(self):
+        """Тест что дневник и список читают только эпоху, и то один раз"""
+        queries = self._user_queries(self.diary_url)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"token_epoch"', queries[0])
+        self.assertNotIn('"password"', queries[0])
+        self.assertEqual(self._user_queries('/api/diary/'), [])
+        self.assertEqual(self.client.get('/api/diary/').data['results'][0]['owner'], 'epochuser')
+
+    def test_soft_delete_revokes_tokens(self):
+        """Тест что после soft_delete старые access и refresh не принимаются"""
+        self._user_queries(self.diary_url)
+        self.user.soft_delete()
+
+        response = self.client.get(self.diary_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get('/api/users/update/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._refresh_status(), status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes_tokens(self):
+        """Тест что смена пароля отзывает токены, а обновление хэша при входе - нет"""
+        self.assertTrue(self.user.check_password('TestPass123'))
+        self.assertEqual(self.user.token_epoch, 0)
+
+        self.user.set_password('NewPass12345')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/update/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._refresh_status(), status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_tokens(self):
+        """Тест выхода на всех устройствах: старые токены отозваны, новые работают"""
+        from .tokens import RefreshToken as AccountRefreshToken
+
+        self._user_queries(self.diary_url)
+        self.user.revoke_tokens()
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_epoch, 1)
+
+        response = self.client.get(self.diary_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['code'], 'token_revoked')
+        self.assertEqual(self._refresh_status(), status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccountRefreshToken.for_user(self.user).access_token}'
+        )
+        self.assertEqual(self.client.get(self.diary_url).status_code, status.HTTP_200_OK)
+
+    def test_token_without_epoch_claim(self):
+        """Тест что токены, выпущенные до появления эпохи, работают как раньше"""
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        queries = self._user_queries(self.diary_url)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"password"', queries[0])
+
+
+class TestLogoutEverywhere(AccountAPITestCase):
+    def setUp(self):
+        from .tokens import RefreshToken as AccountRefreshToken
+
+        self.client = BudgetAPIClient()
+        self.user = User.objects.create_user(
+            username='deviceuser',
+            email='devices@example.com',
+            password='TestPass123'
+        )
+        self.other = User.objects.create_user(
+            username='otherdevice',
+            email='otherdevice@example.com',
+            password='TestPass123'
+        )
+        self.tokens = [AccountRefreshToken.for_user(self.user) for _ in range(3)]
+        AccountRefreshToken.for_user(self.other)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens[0].access_token}')
+
+    def _blacklisted(self, user):
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        return BlacklistedToken.objects.filter(token__user=user).count()
+
+    def test_logout_all_blacklists_every_token(self):
+        """Тест что выход везде отзывает все refresh токены пользователя, но не чужие"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+        # Истекший токен в blacklist не добавляется
+        OutstandingToken.objects.create(
+            user=self.user, jti='expired', token='expired', expires_at=timezone.now() - timedelta(days=1)
+        )
+        self.tokens[1].blacklist()
+
+        response = self.client.post('/api/users/logout-all/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self._blacklisted(self.user), 3)
+        self.assertEqual(self._blacklisted(self.other), 0)
+        self.assertEqual(self.user.blacklist_refresh_tokens(), 0)
+
+        response = BudgetAPIClient().post('/api/token/refresh/', {'refresh': str(self.tokens[2])})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.post('/api/users/logout-all/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_tokens_atomic(self):
+        """Тест что при ошибке blacklist эпоха не увеличивается и access токены не отозваны"""
+        from unittest import mock
+        from django.db import DatabaseError
+
+        with mock.patch('account.tokens.blacklist_user_tokens', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.user.revoke_tokens()
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_epoch, 0)
+        self.assertEqual(self._blacklisted(self.user), 0)
+
+    def test_soft_delete_blacklists_tokens(self):
+        """Тест что удаление аккаунта отзывает все refresh токены без передачи их в запросе"""
+        response = self.client.delete('/api/users/delete/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._blacklisted(self.user), 3)
+
+
+class TestPasswordHashing(AccountAPITestCase):
+    def setUp(self):
+        self.client = BudgetAPIClient()
+        self.login_url = '/api/users/login/'
+        User.objects.create_user(
+            username='hashuser',
+            email='hash@example.com',
+            password='TestPass123'
+        )
+
+    def test_login_rejected_when_hashing_saturated(self):
+        """Тест что при переполненном пуле хэширования вход сразу отдает 503"""
+        from unittest import mock
+        from .hashing import BoundedHashingExecutor
+
+        executor = BoundedHashingExecutor(max_workers=1, max_pending=0, timeout=1)
+        executor._slots.acquire()
+        with mock.patch('account.hashing.get_executor', return_value=executor):
+            response = self.client.post(
+                self.login_url, {'email': 'hash@example.com', 'password': 'TestPass123'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_unknown_email_computes_dummy_hash(self):
+        """Тест что для несуществующего email тоже считается хэш"""
+        from unittest import mock
+
+        with mock.patch('account.serializers.dummy_verify') as dummy_verify:
+            response = self.client.post(
+                self.login_url, {'email': 'nobody@example.com', 'password': 'TestPass123'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        dummy_verify.assert_called_once_with('TestPass123')
+
+    def test_calibrated_iterations(self):
+        """Тест что число итераций берется из ACCOUNT_PASSWORD_HASHING"""
+        from django.contrib.auth.hashers import make_password
+        from django.test import override_settings
+
+        with override_settings(ACCOUNT_PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000}):
+            self.assertTrue(make_password('TestPass123').startswith('pbkdf2_sha256$1000$'))
+
+    def test_outdated_hash_upgraded_after_commit(self):
+        """Тест что устаревший хэш обновляется после коммита, а не в запросе входа"""
+        from unittest import mock
+        from django.contrib.auth.hashers import PBKDF2PasswordHasher, identify_hasher
+        from .hashing import rehash_password
+
+        user = User.objects.get(email='hash@example.com')
+        old = PBKDF2PasswordHasher().encode('TestPass123', PBKDF2PasswordHasher().salt(), 1000)
+        User.objects.filter(pk=user.pk).update(password=old)
+
+        with mock.patch('account.hashing.schedule_rehash') as schedule:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(
+                    self.login_url, {'email': 'hash@example.com', 'password': 'TestPass123'}
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(User.objects.get(pk=user.pk).password, old)
+            schedule.assert_not_called()
+            for callback in callbacks:
+                callback()
+        schedule.assert_called_once()
+
+        self.assertTrue(rehash_password(user.pk, 'TestPass123', old))
+        upgraded = User.objects.get(pk=user.pk).password
+        self.assertFalse(identify_hasher(upgraded).must_update(upgraded))
+        # Пароль сменился до фоновой задачи - ее хэш не записывается
+        self.assertFalse(rehash_password(user.pk, 'TestPass123', old))
+
+    def test_calibrate_hasher_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('calibrate_hasher', samples=1, target_ms=1, stdout=out, stderr=StringIO())
+        self.assertIn('PASSWORD_HASH_ITERATIONS=600000', out.getvalue())
+
+
+class TestEmailLookup(AccountAPITestCase):
+    def setUp(self):
+        self.client = BudgetAPIClient()
+        self.user = User.objects.create_user(
+            username='emailuser',
+            email='Email.User@Example.com',
+            password='TestPass123'
+        )
+
+    def test_email_lookup_uses_index(self):
+        """Тест что поиск по email идет через индекс account_user_email_ci_uniq"""
+        from django.db import connection
+
+        if connection.vendor == 'postgresql':
+            # На маленькой таблице планировщик иначе выберет seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = User.objects.with_email('email.user@example.com').explain()
+        self.assertIn('account_user_email_ci_uniq', plan)
+
+    def test_login_email_case_insensitive(self):
+        """Тест входа с email в другом регистре"""
+        response = self.client.post(
+            '/api/users/login/',
+            {'email': 'EMAIL.USER@example.com', 'password': 'TestPass123'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_registration_duplicate_email_other_case(self):
+        """Тест регистрации с существующим email в другом регистре"""
+        client = BudgetAPIClient()
+        response = client.post('/api/users/register/', {
+            'username': 'newuser',
+            'email': 'email.user@EXAMPLE.com',
+            'password': 'TestPass123',
+            'password2': 'TestPass123'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+
+
+class TestBlacklistFilter(AccountAPITestCase):
+    def setUp(self):
+        from .blacklist import blacklist_filter
+
+        blacklist_filter.clear()
+        self.client = BudgetAPIClient()
+        self.refresh_url = '/api/token/refresh/'
+        self.user = User.objects.create_user(
+            username='refreshuser',
+            email='refresh@example.com',
+            password='TestPass123'
+        )
+
+    def test_rotated_refresh_token_rejected(self):
+        """Тест что старый refresh токен после ротации отклоняется"""
+        refresh = str(RefreshToken.for_user(self.user))
+
+        response = self.client.post(self.refresh_url, {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(self.refresh_url, {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_negative_check_skips_blacklist_query(self):
+        """Тест что для не заблокированного токена нет запроса к BlacklistedToken по jti"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .blacklist import blacklist_filter
+        from .tokens import RefreshToken as CachedRefreshToken
+
+        refresh = str(RefreshToken.for_user(self.user))
+        blacklist_filter.sync(force=True)
+        with CaptureQueriesContext(connection) as ctx:
+            CachedRefreshToken(refresh)
+        self.assertEqual(ctx.captured_queries, [])
+
+    def test_blacklisted_in_other_process_seen_after_sync(self):
+        """Тест что токен, заблокированный в обход фильтра, виден после синхронизации"""
+        from .blacklist import blacklist_filter
+        from .tokens import RefreshToken as CachedRefreshToken
+        from rest_framework_simplejwt.exceptions import TokenError
+
+        token = RefreshToken.for_user(self.user)
+        blacklist_filter.sync(force=True)
+        token.blacklist()
+        blacklist_filter.sync(force=True)
+        with self.assertRaises(TokenError):
+            CachedRefreshToken(str(token))
+
+    def test_lower_id_committed_after_sync(self):
+        """Тест что строка с меньшим id, закоммиченная после синхронизации большего id, не теряется"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from rest_framework_simplejwt.exceptions import TokenError
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+        from .blacklist import blacklist_filter
+        from .tokens import RefreshToken as CachedRefreshToken
+
+        slow, fast = RefreshToken.for_user(self.user), RefreshToken.for_user(self.user)
+        blacklist_filter.sync(force=True)
+        # Быстрая транзакция получила id 5000 и уже видна
+        BlacklistedToken.objects.create(id=5000, token=OutstandingToken.objects.get(jti=fast['jti']))
+        blacklist_filter.sync(force=True)
+        # Медленная получила id и blacklisted_at раньше, при INSERT, а закоммитилась только сейчас
+        BlacklistedToken.objects.create(id=10, token=OutstandingToken.objects.get(jti=slow['jti']))
+        BlacklistedToken.objects.filter(id=10).update(blacklisted_at=timezone.now() - timedelta(seconds=5))
+        blacklist_filter.sync(force=True)
+        with self.assertRaises(TokenError):
+            CachedRefreshToken(str(slow))
+
+
+class TestSingleQueryRegistration(AccountAPITestCase):
+    def setUp(self):
+        self.client = BudgetAPIClient()
+        self.register_url = '/api/users/register/'
+        User.objects.create_user(
+            username='takenuser',
+            email='taken@example.com',
+            password='TestPass123'
+        )
+        self.user_data = {
+            'username': 'freshuser',
+            'email': 'fresh@example.com',
+            'password': 'TestPass123',
+            'password2': 'TestPass123'
+        }
+
+    def _post_capturing_user_queries(self, data):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.register_url, data)
+        queries = [q['sql'] for q in ctx.captured_queries if '"account_user"' in q['sql']]
+        return response, queries
+
+    def test_registration_single_insert(self):
+        """Тест что регистрация делает один запрос к account_user"""
+        response, queries = self._post_capturing_user_queries(self.user_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0].startswith('INSERT'))
+
+    def test_duplicate_username_field_error(self):
+        """Тест что нарушение уникальности username отдается ошибкой поля"""
+        data = {**self.user_data, 'username': 'takenuser'}
+        response, queries = self._post_capturing_user_queries(data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data, {'username': ['Пользователь с таким логином уже существует']}
+        )
+        self.assertEqual(len(queries), 1)
+
+    def test_duplicate_email_field_error(self):
+        """Тест что нарушение уникальности email отдается ошибкой поля"""
+        data = {**self.user_data, 'email': 'TAKEN@example.com'}
+        response, _ = self._post_capturing_user_queries(data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data, {'email': ['Пользователь с таким email уже существует']}
+        )
+
+
+class TestDiaryList(AccountAPITestCase):
+    def setUp(self):
+        from django.utils import timezone
+
+        self.client = BudgetAPIClient()
+        self.list_url = '/api/diary/'
+        self.owner = User.objects.create_user(
+            username='listowner',
+            email='listowner@example.com',
+            password='TestPass123'
+        )
+        other = User.objects.create_user(
+            username='listother',
+            email='listother@example.com',
+            password='TestPass123'
+        )
+        Diary.objects.create(owner=other, title='Other Diary')
+        self.diaries = [
+            Diary.objects.create(owner=self.owner, title=f'Diary {i}') for i in range(5)
+        ]
+        # Одинаковый created_at, чтобы проверить порядок по id
+        Diary.objects.filter(owner=self.owner).update(created_at=timezone.now())
+
+        refresh = RefreshToken.for_user(self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_list_paginates_with_cursor(self):
+        """Тест обхода всех страниц по курсору без повторов и чужих дневников"""
+        ids = []
+        url = f'{self.list_url}?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+
+        expected = sorted((d.id for d in self.diaries), reverse=True)
+        self.assertEqual(ids, expected)
+
+    def test_list_invalid_cursor(self):
+        """Тест неверного курсора"""
+        response = self.client.get(f'{self.list_url}?cursor=broken')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_unauthorized(self):
+        """Тест списка без авторизации"""
+        response = BudgetAPIClient().get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_list_query_uses_owner_created_index(self):
+        """Тест что выборка страницы идет по индексу (owner, created_at, id)"""
+        from django.db import connection
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Diary.objects.filter(owner=self.owner).order_by('-created_at', '-id')[:21].explain()
+        self.assertIn('account_dia_owner_created_idx', plan)
+
+
+class TestDiaryBatch(AccountAPITestCase):
+    def setUp(self):
+        from .tokens import RefreshToken as AccountRefreshToken
+
+        self.client = BudgetAPIClient()
+        self.batch_url = '/api/diary/batch/'
+        self.owner = User.objects.create_user(
+            username='batchowner',
+            email='batchowner@example.com',
+            password='TestPass123'
+        )
+        other = User.objects.create_user(
+            username='batchother',
+            email='batchother@example.com',
+            password='TestPass123'
+        )
+        self.other_diary = Diary.objects.create(owner=other, title='Other Diary')
+        self.diaries = [Diary.objects.create(owner=self.owner, title=f'Diary {i}') for i in range(4)]
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccountRefreshToken.for_user(self.owner).access_token}'
+        )
+
+    def _post(self, operations):
+        return self.client.post(self.batch_url, {'operations': operations}, format='json')
+
+    def test_batch_applies_operations(self):
+        """Тест create/update/delete в одной пачке, чужой дневник - 404 и не меняется"""
+        response = self._post([
+            {'op': 'create', 'title': 'New'},
+            {'op': 'update', 'id': self.diaries[0].id, 'title': 'Renamed'},
+            {'op': 'delete', 'id': self.diaries[1].id},
+            {'op': 'update', 'id': self.other_diary.id, 'title': 'Stolen'},
+            {'op': 'delete', 'id': 999999},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], [201, 200, 204, 404, 404])
+        self.assertEqual(results[0]['diary']['owner'], 'batchowner')
+        self.assertEqual(results[1]['diary']['title'], 'Renamed')
+
+        created = Diary.objects.get(id=results[0]['diary']['id'])
+        self.assertEqual((created.owner_id, created.title), (self.owner.id, 'New'))
+        self.diaries[0].refresh_from_db()
+        self.assertEqual(self.diaries[0].title, 'Renamed')
+        self.assertGreater(self.diaries[0].updated_at, self.diaries[0].created_at)
+        self.assertFalse(Diary.objects.filter(id=self.diaries[1].id).exists())
+        self.other_diary.refresh_from_db()
+        self.assertEqual(self.other_diary.title, 'Other Diary')
+
+    def test_query_count_does_not_grow_with_batch(self):
+        """Тест что число запросов одинаково для пачки из 3 и из 60 операций"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def count(size):
+            diaries = Diary.objects.bulk_create([Diary(owner=self.owner, title='Bulk') for _ in range(2 * size)])
+            operations = (
+                [{'op': 'create', 'title': f'Created {n}'} for n in range(size)]
+                + [{'op': 'update', 'id': d.id, 'title': 'Updated'} for d in diaries[:size]]
+                + [{'op': 'delete', 'id': d.id} for d in diaries[size:]]
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                response = self._post(operations)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len([sql for sql in app_queries(ctx) if 'SAVEPOINT' not in sql])
+
+        # Эпоха токенов читается при первом запросе - дальше из кэша
+        self.client.get('/api/diary/')
+        self.assertEqual(count(1), count(20))
+
+    def test_batch_validation(self):
+        """Тест что повтор id, операция без обязательных полей и лишние операции отклоняются целиком"""
+        from django.test import override_settings
+
+        diary_id = self.diaries[0].id
+        for operations in (
+            [{'op': 'update', 'id': diary_id, 'title': 'A'}, {'op': 'delete', 'id': diary_id}],
+            [{'op': 'update', 'id': diary_id}],
+            [{'op': 'create', 'id': diary_id, 'title': 'A'}],
+            [],
+        ):
+            self.assertEqual(self._post(operations).status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(ACCOUNT_DIARY_BATCH={'MAX_OPERATIONS': 2}):
+            response = self._post([{'op': 'create', 'title': 'A'}] * 3)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Diary.objects.filter(owner=self.owner).count(), 4)
+
+
+class TestConditionalGet(AccountAPITestCase):
+    def setUp(self):
+        self.client = BudgetAPIClient()
+        self.owner = User.objects.create_user(
+            username='etagowner',
+            email='etagowner@example.com',
+            password='TestPass123'
+        )
+        self.diary = Diary.objects.create(owner=self.owner, title='ETag Diary')
+        self.diary_url = f'/api/diary/{self.diary.id}/'
+        self.profile_url = '/api/users/update/'
+        refresh = RefreshToken.for_user(self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+    def test_diary_not_modified(self):
+        """Тест 304 для дневника по ETag без загрузки модели"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        etag = self.client.get(self.diary_url)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.diary_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        diary_queries = app_queries(ctx, 'account_diary')
+        self.assertEqual(len(diary_queries), 1)
+        self.assertNotIn('"account_diary"."title"', diary_queries[0])
+
+    def test_diary_modified_after_update(self):
+        """Тест что после изменения дневника отдается новое тело"""
+        etag = self.client.get(self.diary_url)['ETag']
+        self.diary.title = 'Changed'
+        self.diary.save()
+
+        response = self.client.get(self.diary_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'Changed')
+
+    def test_diary_other_user_etag_forbidden(self):
+        """Тест что чужой ETag не дает 304 другому пользователю"""
+        etag = self.client.get(self.diary_url)['ETag']
+        other = User.objects.create_user(
+            username='etagother',
+            email='etagother@example.com',
+            password='TestPass123'
+        )
+        refresh = RefreshToken.for_user(other)
+        client = BudgetAPIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = client.get(self.diary_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_profile_not_modified(self):
+        """Тест 304 для профиля"""
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'etagowner')
+
+        response = self.client.get(self.profile_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_profile_modified_in_other_process(self):
+        """Тест что запись в другом процессе (кэш пользователя здесь не сброшен) меняет версию профиля"""
+        from datetime import timedelta
+
+        response = self.client.get(self.profile_url)
+        etag = response['ETag']
+        # update() не шлет post_save - как запись другого воркера для кэша этого процесса
+        User.objects.filter(pk=self.owner.pk).update(
+            first_name='Changed', updated_at=self.owner.updated_at + timedelta(seconds=5)
+        )
+
+        response = self.client.get(self.profile_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['first_name'], 'Changed')
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class TestAsyncViews(AccountAPITestCase):
+    def setUp(self):
+        self.async_client = BudgetAsyncClient()
+        self.user = User.objects.create_user(
+            username='asyncuser',
+            email='async@example.com',
+            password='TestPass123',
+            first_name='Async',
+            last_name='User'
+        )
+        self.diary = Diary.objects.create(owner=self.user, title='Async Diary')
+        refresh = RefreshToken.for_user(self.user)
+        self.refresh = str(refresh)
+        self.auth_header = f'Bearer {refresh.access_token}'
+
+    async def test_async_login(self):
+        """Тест async входа"""
+        response = await self.async_client.post(
+            '/api/async/users/login/',
+            {'email': 'async@example.com', 'password': 'TestPass123'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.json()['tokens'])
+
+    async def test_async_login_wrong_password(self):
+        """Тест async входа с неверным паролем"""
+        response = await self.async_client.post(
+            '/api/async/users/login/',
+            {'email': 'async@example.com', 'password': 'WrongPass123'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {'non_field_errors': ['Неверная почта или пароль']})
+
+    async def test_async_diary_matches_sync(self):
+        """Тест что async дневник отдает то же, что и синхронный"""
+        from asgiref.sync import sync_to_async
+
+        sync_response = await sync_to_async(self.client.get)(
+            f'/api/diary/{self.diary.id}/', HTTP_AUTHORIZATION=self.auth_header
+        )
+        response = await self.async_client.get(
+            f'/api/async/diary/{self.diary.id}/', headers={'Authorization': self.auth_header}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, sync_response.content)
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+
+    async def test_async_diary_list(self):
+        """Тест async списка дневников"""
+        response = await self.async_client.get(
+            '/api/async/diary/', headers={'Authorization': self.auth_header}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([d['id'] for d in response.json()['results']], [self.diary.id])
+
+    async def test_async_diary_unauthorized(self):
+        """Тест async дневника без авторизации"""
+        response = await self.async_client.get(f'/api/async/diary/{self.diary.id}/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_update_profile(self):
+        """Тест async обновления профиля"""
+        response = await self.async_client.patch(
+            '/api/async/users/update/',
+            {'first_name': 'Changed'},
+            content_type='application/json',
+            headers={'Authorization': self.auth_header},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user']['first_name'], 'Changed')
+
+    async def test_async_token_refresh(self):
+        """Тест async обновления токенов"""
+        response = await self.async_client.post(
+            '/api/async/token/refresh/', {'refresh': self.refresh}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('refresh', response.json())
+
+
+class TestRateLimiting(AccountAPITestCase):
+    def setUp(self):
+        from .throttling import reset_rate_limits
+
+        reset_rate_limits()
+        self.client = BudgetAPIClient()
+        self.login_url = '/api/users/login/'
+        User.objects.create_user(
+            username='limiteduser',
+            email='limited@example.com',
+            password='TestPass123'
+        )
+
+    def test_login_ip_bucket_exhausted(self):
+        """Тест 429 после исчерпания ведра по IP"""
+        from django.test import override_settings
+        from .throttling import get_rate_limit_settings
+
+        limits = get_rate_limit_settings()
+        limits = {**limits, 'RATES': {**limits['RATES'], 'login_ip': '2/min'}}
+        with override_settings(ACCOUNT_RATE_LIMITS=limits):
+            for _ in range(2):
+                response = self.client.post(
+                    self.login_url, {'email': 'limited@example.com', 'password': 'TestPass123'}
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.post(
+                self.login_url, {'email': 'limited@example.com', 'password': 'TestPass123'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    def test_login_ip_bucket_ignores_forwarded_for(self):
+        """Тест что подмена X-Forwarded-For не дает новое ведро по IP"""
+        from django.test import override_settings
+        from .throttling import get_rate_limit_settings
+
+        limits = get_rate_limit_settings()
+        limits = {**limits, 'RATES': {**limits['RATES'], 'login_ip': '2/min'}}
+        with override_settings(ACCOUNT_RATE_LIMITS=limits):
+            for i in range(3):
+                response = self.client.post(
+                    self.login_url, {'email': 'limited@example.com', 'password': 'TestPass123'},
+                    HTTP_X_FORWARDED_FOR=f'203.0.113.{i}',
+                )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_failures_short_circuit_before_hashing(self):
+        """Тест что после MAX неудачных попыток пароль даже не проверяется"""
+        from unittest import mock
+
+        for _ in range(5):
+            response = self.client.post(
+                self.login_url, {'email': 'limited@example.com', 'password': 'WrongPass'}
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch('account.serializers.verify_password') as verify_password:
+            response = self.client.post(
+                self.login_url, {'email': 'LIMITED@example.com', 'password': 'TestPass123'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        verify_password.assert_not_called()
+
+    def test_local_storage_bounded(self):
+        """Тест что при наплыве ключей вытесняются давно не тронутые, а активные ведра остаются"""
+        from .throttling import LocalRateLimitStorage
+
+        storage = LocalRateLimitStorage(max_keys=3)
+        self.assertEqual(storage.consume('login_email:victim', 1, 1 / 60), 0.0)
+        for i in range(5):
+            storage.consume(f'login_email:flood{i}', 1, 1 / 60)
+            # Ведро жертвы трогается снова и остается пустым
+            self.assertGreater(storage.consume('login_email:victim', 1, 1 / 60), 0)
+        self.assertEqual(len(storage._buckets), 3)
+        self.assertEqual(storage.consume('login_email:flood0', 1, 1 / 60), 0.0)
+
+        for i in range(5):
+            storage.incr(f'failures:{i}', 900)
+        self.assertEqual(len(storage._counters), 3)
+        self.assertEqual(storage.get_count('failures:4'), 1)
+
+    def test_cache_storage_bucket(self):
+        """Тест ведра в общем кэше"""
+        from .throttling import CacheRateLimitStorage
+
+        storage = CacheRateLimitStorage('default')
+        storage.cache.clear()
+        self.assertEqual(storage.consume('test:key', 1, 1 / 60), 0.0)
+        self.assertGreater(storage.consume('test:key', 1, 1 / 60), 0)
+
+
+class TestRequestMetrics(AccountAPITestCase):
+    def setUp(self):
+        from .metrics import metrics
+
+        metrics.clear()
+        self.client = BudgetAPIClient()
+        self.user = User.objects.create_user(
+            username='metricsuser',
+            email='metrics@example.com',
+            password='TestPass123'
+        )
+        self.diary = Diary.objects.create(owner=self.user, title='Metrics Diary')
+        self.client.force_authenticate(user=self.user)
+
+    def test_route_recorded_with_db_queries(self):
+        """Тест что запрос попадает в метрики по шаблону маршрута вместе с запросами к БД"""
+        from .metrics import metrics
+
+        self.client.get(f'/api/diary/{self.diary.id}/')
+        self.client.get('/api/diary/999999/')
+        routes = {(m, r): s for m, r, s in metrics.collect()['routes']}
+        stats = routes[('GET', '/api/diary/<int:diary_id>/')]
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['statuses'], {'200': 1, '404': 1})
+        self.assertGreaterEqual(stats['db_queries'], 2)
+        self.assertGreater(stats['response_bytes'], 0)
+
+    def test_metrics_endpoint_exposition(self):
+        """Тест текстового формата Prometheus на /metrics"""
+        self.client.get(f'/api/diary/{self.diary.id}/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        labels = 'method="GET",route="/api/diary/<int:diary_id>/"'
+        self.assertIn(f'account_http_requests_total{{{labels},status="200"}} 1', body)
+        self.assertIn(f'account_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1', body)
+        self.assertNotIn('route="/metrics"', body)
+
+    def test_metrics_token(self):
+        """Тест что при заданном токене /metrics без него недоступен"""
+        from django.test import override_settings
+
+        with override_settings(ACCOUNT_METRICS={'TOKEN': 'secret'}):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_multiprocess_snapshots_are_summed(self):
+        """Тест сложения снимков нескольких воркеров"""
+        import json
+        import tempfile
+        from .metrics import MetricsRegistry, MultiProcessStore, merge_snapshots
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = MultiProcessStore(directory)
+            for pid, duration in ((1, 0.001), (2, 0.2)):
+                registry = MetricsRegistry((0.01, 0.5))
+                registry.observe('GET', '/api/diary/', 200, duration, db_queries=2)
+                with open(store.path(pid), 'w') as f:
+                    json.dump(registry.snapshot(), f)
+            merged = merge_snapshots(store.read_all())
+
+        [(method, route, stats)] = merged['routes']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['db_queries'], 4)
+        self.assertEqual(stats['buckets'], [1, 1, 0])
+
+    async def test_async_view_recorded(self):
+        """Тест метрик async представления"""
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .metrics import metrics
+
+        token = AccessToken.for_user(self.user)
+        response = await BudgetAsyncClient().get(
+            f'/api/async/diary/{self.diary.id}/', headers={'Authorization': f'Bearer {token}'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        routes = {(m, r): s for m, r, s in metrics.collect()['routes']}
+        stats = routes[('GET', '/api/async/diary/<int:diary_id>/')]
+        self.assertEqual(stats['count'], 1)
+        self.assertGreaterEqual(stats['db_queries'], 1)
+
+
+class TestDatabasePool(AccountAPITestCase):
+    def test_pool_samples_rendered_and_summed(self):
+        """Тест что значения пула из разных воркеров складываются, а мгновенные значения
+        завершившегося воркера отбрасываются"""
+        import os
+        from .metrics import _drop_stale_gauges, merge_snapshots, render
+
+        def snapshot(pid, size, waited):
+            labels = {'database': 'default'}
+            return {'buckets': [0.1], 'routes': [], 'pid': pid, 'samples': [
+                ['account_db_pool_connections', labels, 'gauge', 'Открытые соединения пула', size],
+                ['account_db_pool_wait_seconds_total', labels, 'counter', 'Суммарное ожидание соединения', waited],
+            ]}
+
+        # Больше предельного pid_max в Linux - такого процесса нет
+        dead_pid = 2 ** 22 + 1
+        merged = merge_snapshots(
+            _drop_stale_gauges(s) for s in (snapshot(os.getpid(), 4, 0.5), snapshot(dead_pid, 3, 0.25))
+        )
+        body = render(merged)
+        self.assertIn('# TYPE account_db_pool_connections gauge', body)
+        self.assertIn('account_db_pool_connections{database="default"} 4', body)
+        self.assertIn('account_db_pool_wait_seconds_total{database="default"} 0.75', body)
+
+    def test_metrics_collect_registered_collectors(self):
+        """Тест что зарегистрированный сборщик попадает в /metrics"""
+        from .metrics import _collectors, register_collector
+
+        def collector():
+            return [('account_test_value', {}, 'gauge', 'Тестовое значение', 7)]
+
+        register_collector(collector)
+        try:
+            body = self.client.get('/metrics').content.decode()
+        finally:
+            _collectors.remove(collector)
+        self.assertIn('account_test_value 7', body)
+
+    def test_warm_up_without_pool(self):
+        """Тест прогрева БД без пула: соединение открыто, метрик пула нет"""
+        from contextlib import ExitStack
+        from unittest import mock
+        from django.db import connection, connections
+        from .dbpool import pool_samples, warm_up
+
+        # По умолчанию (DB_POOL=True) у PostgreSQL пул есть. pool - cached_property,
+        # значение уже в __dict__ соединения - подменяем его там у всех алиасов
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(mock.patch.dict(connections[alias].__dict__, {'pool': None}))
+            timings = warm_up()
+            samples = pool_samples()
+        self.assertIn('default', timings)
+        self.assertIsNotNone(connection.connection)
+        self.assertEqual(samples, [])
+
+    @skipUnless(
+        'pool' in settings.DATABASES['default'].get('OPTIONS', {}), 'Пул задается с DB_POOL=True'
+    )
+    def test_warm_up_with_pool(self):
+        """Тест прогрева пула: min_size соединений открыто, метрики пула по алиасу default"""
+        from django.db import connection
+        from .dbpool import pool_samples, warm_up
+
+        timings = warm_up()
+        self.assertIn('default', timings)
+        samples = {
+            name: value for name, labels, _, _, value in pool_samples()
+            if labels == {'database': 'default'}
+        }
+        options = connection.settings_dict['OPTIONS']['pool']
+        self.assertGreaterEqual(samples['account_db_pool_connections'], options['min_size'])
+        self.assertEqual(samples['account_db_pool_max_connections'], options['max_size'])
+        self.assertIn('account_db_pool_requests_total', samples)
+        self.assertIn('account_db_pool_wait_seconds_total', samples)
+
+
+class TestWarmUp(AccountAPITestCase):
+    def setUp(self):
+        from .metrics import metrics, startup
+
+        metrics.clear()
+        startup.first_request = None
+        self.addCleanup(setattr, startup, 'cold_start', None)
+        self.addCleanup(setattr, startup, 'first_request', None)
+
+    def test_warm_up_app_without_database(self):
+        """Тест что прогрев для мастера gunicorn не обращается к БД и не пишет метрики"""
+        from .metrics import metrics
+        from .warmup import WARM_UP_STEPS, warm_up_app
+
+        with self.assertNumQueries(0):
+            timings = warm_up_app()
+        self.assertEqual(set(timings), set(WARM_UP_STEPS))
+        self.assertEqual(metrics.collect()['routes'], [])
+
+    def test_worker_ready_reports_startup(self):
+        """Тест что холодный старт и первый запрос воркера попадают в /metrics"""
+        import time
+        from .metrics import startup
+        from .warmup import worker_ready
+
+        timings = worker_ready(time.perf_counter(), preloaded=True)
+        self.assertIn('db:default', timings)
+        self.assertIsNotNone(startup.cold_start)
+        self.client.get('/api/users/update/')
+        self.client.get('/api/users/update/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('account_worker_starts_total 1', body)
+        self.assertIn(f'account_worker_first_request_seconds_total {startup.first_request}', body)
+
+
+@skipUnless('replica' in settings.DATABASES, 'Алиас replica задается с DB_REPLICA=True')
+class TestReplicaRouting(AccountAPITestCase):
+    """Вместо реплики - отдельная БД replica, строки в нее копируются вручную с отставанием"""
+
+    # Раннер собирает базы и у пропущенных классов
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def setUp(self):
+        from django.core.cache import cache
+        from django.test import override_settings
+        from .authentication import user_cache
+
+        cache.clear()
+        user_cache.clear()
+        routing = override_settings(ACCOUNT_DB_ROUTING={'REPLICAS': ['replica'], 'STICKY_SECONDS': 60})
+        routing.enable()
+        self.addCleanup(routing.disable)
+        self.client = BudgetAPIClient()
+        self.user = User.objects.create_user(
+            username='replicauser',
+            email='replica@example.com',
+            password='TestPass123',
+            first_name='Primary',
+        )
+        self.diary = Diary.objects.create(owner=self.user, title='Primary Diary')
+        # Реплика отстает: старое имя и заголовок
+        User.objects.using('replica').bulk_create([
+            User(**{**self._fields(self.user), 'first_name': 'Stale'})
+        ])
+        Diary.objects.using('replica').bulk_create([
+            Diary(id=self.diary.id, owner_id=self.user.id, title='Stale Diary')
+        ])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    @staticmethod
+    def _fields(user):
+        return {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields}
+
+    def test_reads_go_to_replica(self):
+        """Тест что без своих записей дневник читается с реплики, а профиль (версия для ETag) -
+        всегда с основной БД"""
+        self.assertEqual(self.client.get(f'/api/diary/{self.diary.id}/').data['title'], 'Stale Diary')
+        self.assertEqual(self.client.get('/api/users/update/').data['first_name'], 'Primary')
+
+    def test_epoch_checked_on_primary(self):
+        """Тест что отзыв токенов виден сразу, хотя пользователь прочитан с отстающей реплики"""
+        from django.db.models import F
+        from .authentication import epoch_cache
+        from .tokens import RefreshToken as AccountRefreshToken
+
+        epoch_cache.clear()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccountRefreshToken.for_user(self.user).access_token}'
+        )
+        # Выход везде в другом процессе: реплика еще с прежней эпохой
+        User.objects.filter(pk=self.user.pk).update(token_epoch=F('token_epoch') + 1)
+
+        response = self.client.get('/api/users/update/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['code'], 'token_revoked')
+
+    def test_own_write_sticks_to_primary(self):
+        """Тест что после PATCH профиля пользователь читает свои изменения с основной БД,
+        а другие пользователи - по-прежнему с реплики"""
+        response = self.client.patch('/api/users/update/', {'first_name': 'Fresh'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(User.objects.using('replica').get(pk=self.user.pk).first_name, 'Stale')
+
+        self.assertEqual(self.client.get('/api/users/update/').data['first_name'], 'Fresh')
+        self.assertEqual(self.client.get(f'/api/diary/{self.diary.id}/').data['title'], 'Primary Diary')
+
+        other = User.objects.create_user(username='otheruser', email='other@example.com', password='TestPass123')
+        other_diary = Diary.objects.create(owner=other, title='Primary Other')
+        User.objects.using('replica').bulk_create([User(**self._fields(other))])
+        Diary.objects.using('replica').bulk_create([
+            Diary(id=other_diary.id, owner_id=other.id, title='Stale Other')
+        ])
+        client = BudgetAPIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(other).access_token}')
+        self.assertEqual(client.get(f'/api/diary/{other_diary.id}/').data['title'], 'Stale Other')
+
+    def test_login_falls_back_to_primary(self):
+        """Тест входа сразу после регистрации, пока аккаунта нет на реплике"""
+        client = BudgetAPIClient()
+        response = client.post('/api/users/register/', {
+            'username': 'newuser',
+            'email': 'new@example.com',
+            'password': 'TestPass123',
+            'password2': 'TestPass123',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(User.objects.using('replica').filter(username='newuser').exists())
+        response = client.post('/api/users/login/', {'email': 'new@example.com', 'password': 'TestPass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_outside_request_reads_primary(self):
+        """Тест что вне запроса (команды, shell) чтение идет с основной БД"""
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, 'Primary')
+
+
+class TestQueryBudgets(AccountAPITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='budgetuser',
+            email='budget@example.com',
+            password='TestPass123'
+        )
+        self.diary = Diary.objects.create(owner=self.user, title='Budget Diary')
+        self.client.force_authenticate(user=self.user)
+
+    def test_every_endpoint_has_budget(self):
+        """Тест что у каждого эндпоинта account объявлен бюджет запросов"""
+        from django.urls import URLPattern, URLResolver, get_resolver
+        from django.urls.resolvers import ResolverMatch
+        from rest_framework.routers import APIRootView
+        from .query_budget import get_view_budget
+
+        def walk(patterns, prefix=''):
+            for pattern in patterns:
+                if isinstance(pattern, URLResolver):
+                    yield from walk(pattern.url_patterns, prefix + str(pattern.pattern))
+                elif isinstance(pattern, URLPattern):
+                    yield prefix + str(pattern.pattern), pattern.callback
+
+        missing = []
+        for route, callback in walk(get_resolver().url_patterns):
+            if not (route.startswith('api/') or route == 'metrics') or 'format' in route:
+                continue
+            view_class = getattr(callback, 'cls', None)
+            if view_class is APIRootView:
+                continue
+            if getattr(callback, 'actions', None):
+                methods = list(callback.actions)
+            elif view_class is not None:
+                methods = [m for m in ('get', 'post', 'put', 'patch', 'delete') if hasattr(view_class, m)]
+            else:
+                methods = ['get']
+            match = ResolverMatch(callback, (), {}, route=route)
+            for method in methods:
+                if get_view_budget(match, method) is None:
+                    missing.append(f'{method.upper()} {route}')
+        self.assertEqual(missing, [])
+
+    def test_over_budget_lists_sql(self):
+        """Тест что превышение бюджета падает со списком SQL"""
+        from unittest import mock
+        from .query_budget import QueryBudgetExceeded
+        from .views import GetMyDiaryAPIView
+
+        with mock.patch.object(GetMyDiaryAPIView.get, 'query_budget', 0):
+            with self.assertRaises(QueryBudgetExceeded) as ctx:
+                self.client.get(f'/api/diary/{self.diary.id}/')
+        self.assertIn('бюджете 0', str(ctx.exception))
+        self.assertIn('"account_diary"', str(ctx.exception))
+
+
+class TestRepresentations(AccountAPITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='repruser',
+            email='repr@example.com',
+            password='TestPass123',
+            first_name='Иван',
+            last_name='Петров "Тест"'
+        )
+        self.diaries = [
+            Diary.objects.create(owner=self.user, title=title)
+            for title in ('Первый', 'Second "quoted"', '😀 emoji')
+        ]
+
+    def render(self, data):
+        from rest_framework.renderers import JSONRenderer
+
+        return JSONRenderer().render(data)
+
+    def test_diary_matches_serializer(self):
+        """Тест что быстрый дневник совпадает с DairySerializer байт в байт"""
+        from . import representations
+        from .serializers import DairySerializer
+
+        for diary in self.diaries:
+            row = Diary.objects.values(*representations.DIARY_VALUES).get(id=diary.id)
+            self.assertEqual(
+                self.render(representations.diary(row)),
+                self.render(DairySerializer(Diary.objects.get(id=diary.id)).data),
+            )
+
+    def test_diary_list_matches_serializer(self):
+        """Тест что элементы списка совпадают с DiaryListSerializer байт в байт"""
+        from . import representations
+        from .serializers import DiaryListSerializer
+
+        rows = Diary.objects.filter(owner=self.user).values(*representations.DIARY_LIST_VALUES)
+        fast = [representations.diary_list_item(row, self.user.username) for row in rows]
+        slow = DiaryListSerializer(Diary.objects.filter(owner=self.user), many=True).data
+        self.assertEqual(self.render(fast), self.render(slow))
+
+    def test_profile_matches_serializer(self):
+        """Тест что профиль совпадает с UserProfileSerializer байт в байт"""
+        from . import representations
+        from .serializers import UserProfileSerializer
+
+        user = User.objects.get(id=self.user.id)
+        self.assertEqual(
+            self.render(representations.profile(user)),
+            self.render(UserProfileSerializer(user).data),
+        )
+
+
+class TestPurgeDeletedUsers(AccountAPITestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        old = timezone.now() - timedelta(days=60)
+        self.deleted = []
+        for i in range(3):
+            user = User.objects.create_user(
+                username=f'gone{i}', email=f'gone{i}@example.com', password='TestPass123'
+            )
+            Diary.objects.create(owner=user, title=f'Old diary {i}')
+            RefreshToken.for_user(user).blacklist()
+            User.objects.filter(id=user.id).update(is_active=False, deleted_at=old)
+            self.deleted.append(user)
+        self.recent = User.objects.create_user(
+            username='recent', email='recent@example.com', password='TestPass123'
+        )
+        self.recent.soft_delete()
+        self.active = User.objects.create_user(
+            username='active', email='active@example.com', password='TestPass123'
+        )
+        Diary.objects.create(owner=self.active, title='Active diary')
+
+    def purge(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('purge_deleted_users', '--sleep', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_delete_mode(self):
+        """Тест удаления пользователей старше срока вместе с дневниками и токенами"""
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+        self.purge('--batch-size', '2')
+        ids = [user.id for user in self.deleted]
+        self.assertFalse(User.objects.filter(id__in=ids).exists())
+        self.assertFalse(Diary.objects.filter(owner_id__in=ids).exists())
+        self.assertFalse(OutstandingToken.objects.filter(user__isnull=True).exists())
+        self.assertTrue(User.objects.filter(id=self.recent.id).exists())
+        self.assertEqual(Diary.objects.filter(owner=self.active).count(), 1)
+
+    def test_anonymize_mode(self):
+        """Тест обезличивания: строка остается без личных данных, повторный запуск ее не трогает"""
+        self.purge('--mode', 'anonymize')
+        user = User.objects.get(id=self.deleted[0].id)
+        self.assertEqual(user.username, f'deleted-{user.id}')
+        self.assertEqual(user.email, '')
+        self.assertFalse(user.has_usable_password())
+        self.assertFalse(Diary.objects.filter(owner=user).exists())
+        self.assertIn('Обезличено пользователей: 0', self.purge('--mode', 'anonymize'))
+
+    def test_resume_from_state_file(self):
+        """Тест продолжения прерванного запуска по файлу прогресса"""
+        import json
+        import os
+        import tempfile
+
+        state_file = os.path.join(tempfile.mkdtemp(), 'purge.json')
+        self.purge('--batch-size', '1', '--max-batches', '1', '--state-file', state_file)
+        with open(state_file) as f:
+            self.assertEqual(json.load(f)['after_id'], self.deleted[0].id)
+        self.assertEqual(User.objects.filter(id__in=[u.id for u in self.deleted]).count(), 2)
+
+        self.purge('--batch-size', '1', '--state-file', state_file)
+        self.assertFalse(User.objects.filter(id__in=[u.id for u in self.deleted]).exists())
+        self.assertFalse(os.path.exists(state_file))
+
+    def test_soft_delete_sets_deleted_at(self):
+        """Тест что soft_delete запоминает момент удаления"""
+        self.assertIsNotNone(self.recent.deleted_at)
+
+
+class TestPruneTokens(AccountAPITestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+        self.user = User.objects.create_user(
+            username='tokenuser', email='token@example.com', password='TestPass123'
+        )
+        tokens = [RefreshToken.for_user(self.user) for _ in range(5)]
+        tokens[0].blacklist()
+        tokens[1].blacklist()
+        self.expired_jtis = [token['jti'] for token in tokens[:4]]
+        self.live_jti = tokens[4]['jti']
+        OutstandingToken.objects.filter(jti__in=self.expired_jtis).update(
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+
+    def test_prunes_expired_in_batches(self):
+        """Тест удаления истекших токенов пачками вместе с blacklist"""
+        from io import StringIO
+        from django.core.management import call_command
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+        out = StringIO()
+        call_command('prune_tokens', '--batch-size', '3', '--sleep', '0', stdout=out)
+        self.assertIn('Удалено токенов: 4 (из них в blacklist: 2), пачек: 2', out.getvalue())
+        self.assertEqual(
+            list(OutstandingToken.objects.values_list('jti', flat=True)), [self.live_jti]
+        )
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    def test_max_batches(self):
+        """Тест остановки после заданного числа пачек"""
+        from django.utils import timezone
+        from .token_prune import prune_expired_tokens
+
+        totals = prune_expired_tokens(timezone.now(), batch_size=1, max_batches=2)
+        self.assertEqual(totals['tokens'], 2)
+
+
+class TestGenerateLoadData(AccountAPITestCase):
+    def generate(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('generate_load_data', '--method', 'bulk', '--chunk-size', '40', *args, stdout=out)
+        return out.getvalue()
+
+    def test_generates_and_resumes(self):
+        """Тест генерации с общим хэшем пароля и продолжения без дублей"""
+        self.generate('--users', '60', '--inactive-percent', '10')
+        self.assertEqual(User.objects.filter(username__startswith='load').count(), 60)
+        self.assertEqual(
+            User.objects.filter(username__startswith='load').values('password').distinct().count(), 1
+        )
+        self.assertTrue(User.objects.filter(is_active=False, deleted_at__isnull=False).exists())
+        self.assertTrue(Diary.objects.exists())
+        # Дневники мягко удаленных скрыты, остальные видны
+        self.assertFalse(Diary.objects.filter(owner__is_active=False, is_hidden=False).exists())
+        self.assertFalse(Diary.objects.filter(owner__is_active=True, is_hidden=True).exists())
+        self.assertTrue(Diary.objects.filter(is_hidden=True).exists())
+
+        out = self.generate('--users', '100')
+        self.assertIn('Продолжение с пользователя 60', out)
+        self.assertEqual(User.objects.filter(username__startswith='load').count(), 100)
+        self.assertIn('Уже создано 100', self.generate('--users', '100'))
+
+    def test_login_with_generated_password(self):
+        """Тест что сгенерированный пользователь может войти"""
+        self.generate('--users', '1', '--inactive-percent', '0')
+        response = self.client.post(
+            '/api/users/login/', {'email': 'load0000000@load.example.com', 'password': 'LoadPass123'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
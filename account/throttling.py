@@ -0,0 +1,260 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMIT_SETTINGS = {
+    # "local" - в памяти процесса (одна нода), "cache" - общий кэш из CACHES
+    "STORAGE": "local",
+    "CACHE_ALIAS": "default",
+    # "N/период": ведро на N запросов, которое пополняется на N за период
+    "RATES": {
+        "login_ip": "30/min",
+        "login_email": "10/min",
+        "login_global": "6000/min",
+        "register_ip": "20/min",
+        "register_global": "1200/min",
+        "refresh_ip": "120/min",
+        "refresh_global": "12000/min",
+    },
+    # Неудачные входы на аккаунт: после MAX попыток за WINDOW секунд - 429 до хэширования
+    "LOGIN_FAILURES": {"MAX": 5, "WINDOW": 900},
+}
+
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+# Сколько ключей держит локальное хранилище, дальше вытесняются давно не тронутые
+LOCAL_MAX_KEYS = 100_000
+
+
+def get_rate_limit_settings() -> Dict[str, Any]:
+    return {**DEFAULT_RATE_LIMIT_SETTINGS, **getattr(settings, "ACCOUNT_RATE_LIMITS", {})}
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """"30/min" -> (емкость 30, пополнение 0.5 в секунду)"""
+    num, period = rate.split("/")
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period]
+
+
+class LocalRateLimitStorage:
+    """Ведра и счетчики в памяти процесса. Ограничены LOCAL_MAX_KEYS как LRU: при наплыве
+    новых ключей (перебор email) вытеснение O(1), без пересборки словарей под блокировкой.
+    Вытесняется дольше всех не тронутое ведро - оно ближе всего к полному"""
+
+    def __init__(self, max_keys: int = LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._counters: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _put(self, data: OrderedDict, key: str, value) -> None:
+        data[key] = value
+        data.move_to_end(key)
+        while len(data) > self.max_keys:
+            data.popitem(last=False)
+
+    def consume(self, key: str, capacity: int, refill_rate: float) -> float:
+        """Забирает токен из ведра, возвращает 0 или сколько секунд ждать"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            if tokens >= 1:
+                self._put(self._buckets, key, (tokens - 1, now))
+                return 0.0
+            self._put(self._buckets, key, (tokens, now))
+            return (1 - tokens) / refill_rate
+
+    def get_count(self, key: str) -> int:
+        count, expires_at = self._counters.get(key, (0, 0.0))
+        return count if expires_at > time.monotonic() else 0
+
+    def incr(self, key: str, window: int) -> int:
+        now = time.monotonic()
+        with self._lock:
+            count, expires_at = self._counters.get(key, (0, 0.0))
+            if expires_at <= now:
+                count, expires_at = 0, now + window
+            self._put(self._counters, key, (count + 1, expires_at))
+            return count + 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self._counters.clear()
+
+
+class CacheRateLimitStorage:
+    """Ведра и счетчики в общем кэше Django для нескольких нод.
+    Чтение и запись ведра не атомарны, при гонке проходит на пару запросов больше"""
+
+    prefix = "account:ratelimit:"
+
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def consume(self, key: str, capacity: int, refill_rate: float) -> float:
+        now = time.time()
+        cache_key = f"{self.prefix}bucket:{key}"
+        tokens, updated = self.cache.get(cache_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+        timeout = math.ceil(capacity / refill_rate)
+        if tokens >= 1:
+            self.cache.set(cache_key, (tokens - 1, now), timeout)
+            return 0.0
+        self.cache.set(cache_key, (tokens, now), timeout)
+        return (1 - tokens) / refill_rate
+
+    def get_count(self, key: str) -> int:
+        return self.cache.get(f"{self.prefix}count:{key}", 0)
+
+    def incr(self, key: str, window: int) -> int:
+        cache_key = f"{self.prefix}count:{key}"
+        self.cache.add(cache_key, 0, window)
+        try:
+            return self.cache.incr(cache_key)
+        except ValueError:
+            # Ключ истек между add и incr
+            self.cache.set(cache_key, 1, window)
+            return 1
+
+    def delete(self, key: str) -> None:
+        self.cache.delete(f"{self.prefix}count:{key}")
+
+    def clear(self) -> None:
+        pass
+
+
+_local_storage = LocalRateLimitStorage()
+
+
+def get_storage():
+    config = get_rate_limit_settings()
+    if config["STORAGE"] == "cache":
+        return CacheRateLimitStorage(config["CACHE_ALIAS"])
+    return _local_storage
+
+
+def reset_rate_limits() -> None:
+    """Сброс локальных ведер и счетчиков (тесты, бенчмарки)"""
+    _local_storage.clear()
+
+
+def get_request_email(request) -> Optional[str]:
+    data = getattr(request, "data", None)
+    email = data.get("email") if hasattr(data, "get") else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket с ключом из get_key и лимитом ACCOUNT_RATE_LIMITS["RATES"][scope]"""
+
+    scope: str = ""
+
+    def get_key(self, request, view) -> Optional[str]:
+        raise NotImplementedError
+
+    def allow_request(self, request, view) -> bool:
+        key = self.get_key(request, view)
+        rate = get_rate_limit_settings()["RATES"].get(self.scope)
+        if key is None or rate is None:
+            return True
+        capacity, refill_rate = parse_rate(rate)
+        self._wait = get_storage().consume(f"{self.scope}:{key}", capacity, refill_rate)
+        if self._wait:
+            logger.warning(f"Превышен лимит {self.scope} для {key}")
+        return not self._wait
+
+    def wait(self) -> Optional[float]:
+        return getattr(self, "_wait", None)
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    def get_key(self, request, view) -> Optional[str]:
+        return self.get_ident(request)
+
+
+class EmailRateThrottle(TokenBucketThrottle):
+    def get_key(self, request, view) -> Optional[str]:
+        return get_request_email(request)
+
+
+class GlobalRateThrottle(TokenBucketThrottle):
+    def get_key(self, request, view) -> Optional[str]:
+        return "all"
+
+
+class LoginIPThrottle(IPRateThrottle):
+    scope = "login_ip"
+
+
+class LoginEmailThrottle(EmailRateThrottle):
+    scope = "login_email"
+
+
+class LoginGlobalThrottle(GlobalRateThrottle):
+    scope = "login_global"
+
+
+class RegisterIPThrottle(IPRateThrottle):
+    scope = "register_ip"
+
+
+class RegisterGlobalThrottle(GlobalRateThrottle):
+    scope = "register_global"
+
+
+class RefreshIPThrottle(IPRateThrottle):
+    scope = "refresh_ip"
+
+
+class RefreshGlobalThrottle(GlobalRateThrottle):
+    scope = "refresh_global"
+
+
+LOGIN_THROTTLES = [LoginIPThrottle, LoginEmailThrottle, LoginGlobalThrottle]
+REGISTER_THROTTLES = [RegisterIPThrottle, RegisterGlobalThrottle]
+REFRESH_THROTTLES = [RefreshIPThrottle, RefreshGlobalThrottle]
+
+
+class LoginFailureCounter:
+    """Счетчик неудачных входов на аккаунт, проверяется до вычисления хэша пароля"""
+
+    def _key(self, email: str) -> str:
+        return f"login_failures:{email.strip().lower()}"
+
+    def check(self, email: str) -> None:
+        config = get_rate_limit_settings()["LOGIN_FAILURES"]
+        if get_storage().get_count(self._key(email)) >= config["MAX"]:
+            logger.warning(f"Слишком много неудачных входов для {email}")
+            raise Throttled(wait=config["WINDOW"])
+
+    def record_failure(self, email: str) -> None:
+        config = get_rate_limit_settings()["LOGIN_FAILURES"]
+        get_storage().incr(self._key(email), config["WINDOW"])
+
+    def reset(self, email: str) -> None:
+        get_storage().delete(self._key(email))
+
+
+login_failures = LoginFailureCounter()
@@ -0,0 +1,79 @@
+"""Очистка истекших OutstandingToken и BlacklistedToken небольшими пачками.
+flushexpiredtokens из simplejwt удаляет все одним DELETE - на больших таблицах это
+долгая транзакция и всплеск WAL. Здесь пачки идут keyset по индексу (expires_at, id)
+(миграция 0009), каждая пачка - отдельная транзакция, между пачками пауза"""
+
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_PRUNE_SETTINGS = {
+    "BATCH_SIZE": 1000,
+    # Пауза между пачками, секунды
+    "SLEEP": 0.1,
+}
+
+
+def get_token_prune_settings() -> Dict[str, Any]:
+    return {**DEFAULT_TOKEN_PRUNE_SETTINGS, **getattr(settings, "ACCOUNT_TOKEN_PRUNE", {})}
+
+
+def expired_tokens(now: datetime):
+    return OutstandingToken.objects.filter(expires_at__lt=now).order_by("expires_at", "id")
+
+
+def next_batch(now: datetime, position: Optional[Tuple[datetime, int]], size: int) -> List[tuple]:
+    queryset = expired_tokens(now)
+    if position is not None:
+        expires_at, pk = position
+        # Как в KeysetPagination: expires_at__gte дает планировщику границу диапазона
+        queryset = queryset.filter(
+            Q(expires_at__gt=expires_at) | Q(expires_at=expires_at, id__gt=pk),
+            expires_at__gte=expires_at,
+        )
+    return list(queryset.values_list("expires_at", "id")[:size])
+
+
+def delete_tokens(ids: List[int]) -> Dict[str, int]:
+    with transaction.atomic():
+        # BlacklistedToken ссылается на OutstandingToken с CASCADE - удаляется тем же вызовом
+        _, deleted = OutstandingToken.objects.filter(id__in=ids).delete()
+    return {
+        "tokens": deleted.get(OutstandingToken._meta.label, 0),
+        "blacklisted_tokens": deleted.get(BlacklistedToken._meta.label, 0),
+    }
+
+
+def prune_expired_tokens(
+    now: datetime,
+    batch_size: int = 1000,
+    sleep: float = 0.0,
+    max_batches: Optional[int] = None,
+    on_batch: Optional[Callable[[Dict[str, int]], None]] = None,
+) -> Dict[str, int]:
+    totals = {"batches": 0, "tokens": 0, "blacklisted_tokens": 0}
+    position = None
+    while max_batches is None or totals["batches"] < max_batches:
+        rows = next_batch(now, position, batch_size)
+        if not rows:
+            break
+        counts = delete_tokens([pk for _, pk in rows])
+        position = rows[-1]
+        totals["batches"] += 1
+        for name, value in counts.items():
+            totals[name] += value
+        if on_batch is not None:
+            on_batch(counts)
+        if sleep:
+            time.sleep(sleep)
+    logger.info(f"Очистка истекших токенов: {totals}")
+    return totals
@@ -0,0 +1,109 @@
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import (
+    AccessToken as BaseAccessToken,
+    RefreshToken as BaseRefreshToken,
+    Token,
+)
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .blacklist import blacklist_filter
+
+# Версия токенов пользователя (User.token_epoch), сверяется при аутентификации
+TOKEN_EPOCH_CLAIM = "epoch"
+
+
+def token_for_user(token_class, user):
+    """Token.for_user без записи в БД и с claims для аутентификации без загрузки
+    пользователя (account.authentication.TokenUserAuthentication)"""
+    token = Token.for_user.__func__(token_class, user)
+    token["username"] = user.username
+    token["is_active"] = user.is_active
+    token[TOKEN_EPOCH_CLAIM] = user.token_epoch
+    return token
+
+
+def outstanding_token(token, user) -> OutstandingToken:
+    return OutstandingToken(
+        user=user,
+        jti=token[api_settings.JTI_CLAIM],
+        token=str(token),
+        created_at=token.current_time,
+        expires_at=datetime_from_epoch(token["exp"]),
+    )
+
+
+def blacklist_user_tokens(user_id) -> int:
+    """Все неистекшие refresh токены пользователя в blacklist одним INSERT ... SELECT,
+    без строки на каждый токен. Уже отозванные пропускаются. Возвращает число добавленных"""
+    outstanding = connection.ops.quote_name(OutstandingToken._meta.db_table)
+    blacklisted = connection.ops.quote_name(BlacklistedToken._meta.db_table)
+    now = timezone.now()
+    sql = (
+        f"{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} {blacklisted} "
+        f"(token_id, blacklisted_at) SELECT id, %s FROM {outstanding} "
+        f"WHERE user_id = %s AND expires_at > %s "
+        + connection.ops.on_conflict_suffix_sql(
+            [BlacklistedToken._meta.get_field("token")], OnConflict.IGNORE, None, None
+        )
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [now, user_id, now])
+        count = cursor.rowcount
+    # Новые jti попадут в фильтр этого процесса сразу после коммита, в остальных - при синхронизации
+    transaction.on_commit(lambda: blacklist_filter.sync(force=True))
+    return count
+
+
+class RefreshToken(BaseRefreshToken):
+    """RefreshToken, который проверяет blacklist через фильтр в памяти процесса"""
+
+    def check_blacklist(self) -> None:
+        jti = self.payload[api_settings.JTI_CLAIM]
+        # В БД идем только если jti есть в фильтре
+        if blacklist_filter.might_contain(jti):
+            super().check_blacklist()
+
+    def _outstanding_defaults(self):
+        # user_id из claim без SELECT пользователя, который делает simplejwt
+        return {
+            "user_id": self.payload.get(api_settings.USER_ID_CLAIM),
+            "token": str(self),
+            "created_at": self.current_time,
+            "expires_at": datetime_from_epoch(self.payload["exp"]),
+        }
+
+    def blacklist(self):
+        token, _ = OutstandingToken.objects.get_or_create(
+            jti=self.payload[api_settings.JTI_CLAIM], defaults=self._outstanding_defaults()
+        )
+        result = BlacklistedToken.objects.get_or_create(token=token)
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM], self.payload["exp"])
+        return result
+
+    def outstand(self):
+        return OutstandingToken.objects.get_or_create(
+            jti=self.payload[api_settings.JTI_CLAIM], defaults=self._outstanding_defaults()
+        )
+
+    @classmethod
+    def for_user(cls, user) -> "RefreshToken":
+        token = token_for_user(cls, user)
+        outstanding_token(token, user).save()
+        return token
+
+    @classmethod
+    async def afor_user(cls, user) -> "RefreshToken":
+        """Async вариант for_user: OutstandingToken создается через asave"""
+        token = token_for_user(cls, user)
+        await outstanding_token(token, user).asave()
+        return token
+
+
+class AccessToken(BaseAccessToken):
+    @classmethod
+    def for_user(cls, user) -> "AccessToken":
+        return token_for_user(cls, user)
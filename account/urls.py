@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 app_name = 'account'
 
@@ -10,5 +10,13 @@ router.register(r'users', views.UserAuthenticationViewSet, basename='users')
 urlpatterns = [
     path('', include(router.urls)),
     path('users/update/', views.UpdateProfileAPIView.as_view(), name='update-profile'),
+    path('diary/', views.DiaryListAPIView.as_view(), name='diary-list'),
+    path('diary/batch/', views.DiaryBatchAPIView.as_view(), name='diary-batch'),
     path('diary/<int:diary_id>/', views.GetMyDiaryAPIView.as_view(), name='update-profile'),
+    # Async (ASGI) варианты горячих эндпоинтов
+    path('async/users/login/', async_views.login, name='async-login'),
+    path('async/users/update/', async_views.update_profile, name='async-update-profile'),
+    path('async/token/refresh/', async_views.token_refresh, name='async-token-refresh'),
+    path('async/diary/', async_views.list_diaries, name='async-diary-list'),
+    path('async/diary/<int:diary_id>/', async_views.get_diary, name='async-diary'),
 ]
\ No newline at end of file
@@ -5,11 +5,12 @@ from rest_framework.request import Request
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework import permissions
 from http import HTTPMethod
 from drf_spectacular.utils import extend_schema
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.views import TokenRefreshView
 
 # Локальные импорты
 from .serializers import (
@@ -17,9 +18,19 @@ from .serializers import (
     UserLoginSerializer,
     UserProfileSerializer,
     DairySerializer,
+    DiaryBatchSerializer,
+    DiaryListSerializer,
 )
-from .services import UserAuthService
+from .services import UserAuthService, fresh_user
+from .tokens import RefreshToken
+from .authentication import TokenUserAuthentication, invalidate_user
+from .diary_batch import apply_diary_batch
+from .conditional import has_validators, not_modified_response, set_validators
+from .pagination import KeysetPagination
 from .permissions import IsAuthenticatedAndActiveUser, IsDairyOwner
+from .query_budget import query_budget
+from . import representations
+from .throttling import LOGIN_THROTTLES, REFRESH_THROTTLES, REGISTER_THROTTLES
 from .models import User, Diary
 
 import logging
@@ -35,12 +46,16 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         responses={201: None},
         description="Регистрация пользователя",
     )
-    @action(detail=False, methods=[HTTPMethod.POST])
+    @action(detail=False, methods=[HTTPMethod.POST], throttle_classes=REGISTER_THROTTLES)
+    @query_budget(1)
     def register(self, request: Request) -> Response:
         serializer = UserRegistrationSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user, error = UserAuthService.register_user(serializer.validated_data)
         if user is None:
+            # Ошибки уникальности приходят по полям, как от валидации серилизатора
+            if isinstance(error, dict):
+                return Response(error, status=status.HTTP_400_BAD_REQUEST)
             return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(
@@ -55,7 +70,10 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         responses={200: None},
         description="Вход пользователя",
     )
-    @action(detail=False, methods=[HTTPMethod.POST])
+    @action(detail=False, methods=[HTTPMethod.POST], throttle_classes=LOGIN_THROTTLES)
+    # Поиск по email (с реплики - еще повтор на основной БД или эпоха токенов) и OutstandingToken.
+    # Устаревший хэш пароля обновляется в фоне после ответа (account.hashing.schedule_rehash)
+    @query_budget(3)
     def login(self, request: Request) -> Response:
         serializer = UserLoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -78,6 +96,7 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
         methods=[HTTPMethod.POST],
         permission_classes=[permissions.IsAuthenticated],
     )
+    @query_budget(5)
     def logout(self, request: Request) -> Response:
         """Выход с добавлением refresh токена в blacklist"""
         try:
@@ -104,28 +123,31 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
                 {"error": "Неверный токен"}, status=status.HTTP_400_BAD_REQUEST
             )
 
+    @extend_schema(request=None, responses={204: None})
+    @action(
+        detail=False,
+        methods=[HTTPMethod.POST],
+        url_path="logout-all",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    # Пользователь, UPDATE и перечитывание эпохи, INSERT ... SELECT всех refresh токенов
+    @query_budget(4)
+    def logout_all(self, request: Request) -> Response:
+        """Выход на всех устройствах: все refresh и access токены пользователя отзываются"""
+        UserAuthService.logout_everywhere(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         detail=False,
         methods=[HTTPMethod.DELETE],
         permission_classes=[IsAuthenticatedAndActiveUser],
     )
+    # Пользователь, UPDATE пользователя, новая эпоха, UPDATE дневников, INSERT ... SELECT refresh токенов
+    @query_budget(5)
     def delete(self, request: Request) -> Response:
-        """Мягкое удаление аккаунта"""
+        """Мягкое удаление аккаунта вместе с дневниками и токенами"""
         try:
-            user = request.user
-            user.soft_delete()
-
-            try:
-                refresh_token = request.data.get("refresh")
-                if refresh_token:
-                    token = RefreshToken(refresh_token)
-                    token.blacklist()
-            except (
-                TokenError,
-                KeyError,
-                AttributeError,
-            ):  # Если нет токена просто отдаем респонс
-                pass
+            UserAuthService.soft_delete_user(request.user)
 
             return Response(
                 {"message": "Аккаунт успешно удален"}, status=status.HTTP_200_OK
@@ -139,36 +161,145 @@ class UserAuthenticationViewSet(viewsets.ViewSet):
             )
 
 
+class TokenRefreshAPIView(TokenRefreshView):
+    """Обновление токенов с ограничением частоты по IP и глобально"""
+
+    throttle_classes = REFRESH_THROTTLES
+
+    # Пользователь с эпохой, blacklist старого и OutstandingToken нового токена
+    @query_budget(7)
+    def post(self, request: Request, *args, **kwargs) -> Response:
+        return super().post(request, *args, **kwargs)
+
+
 class UpdateProfileAPIView(APIView):
-    """Обновление профиля"""
+    """Просмотр и обновление профиля"""
 
     permission_classes = [IsAuthenticatedAndActiveUser]
 
+    @extend_schema(
+        responses={200: UserProfileSerializer, 304: None},
+        description="Профиль, поддерживает If-None-Match/If-Modified-Since",
+    )
+    # Пользователь при промахе кэша и строка профиля с основной БД
+    @query_budget(2)
+    def get(self, request: Request) -> Response:
+        # Версия и тело - из основной БД: пользователь из кэша может не знать о записи в другом процессе
+        user = fresh_user(request.user).get()
+        if user.updated_at != request.user.updated_at:
+            invalidate_user(user.pk)
+        response = not_modified_response(request, user.pk, user.updated_at)
+        if response is not None:
+            return response
+        return set_validators(
+            Response(representations.profile(user), status=status.HTTP_200_OK),
+            user.pk,
+            user.updated_at,
+        )
+
     @extend_schema(
         request=UserProfileSerializer,
         responses={200: None},
         description="Обновление профиля",
     )
+    # Пользователь при промахе кэша, строка с основной БД и UPDATE измененных полей
+    @query_budget(3)
     def patch(self, request: Request) -> Response:
         serializer = UserProfileSerializer(
             instance=request.user, data=request.data, partial=True
         )
         serializer.is_valid(raise_exception=True)
 
-        serializer.save()
+        user, errors = UserAuthService.update_profile(request.user, serializer.validated_data)
+        if errors:
+            raise ValidationError(errors)
         return Response(
-            {"message": "Профиль успешно обновлен", "user": serializer.data},
+            {"message": "Профиль успешно обновлен", "user": representations.profile(user)},
             status=status.HTTP_200_OK,
         )
 
 
 class GetMyDiaryAPIView(APIView):
+    # Нужны только id владельца - пользователь из claims токена, без SELECT
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [IsAuthenticatedAndActiveUser, IsDairyOwner]
 
+    @extend_schema(
+        responses={200: DairySerializer, 304: None},
+        description="Свой дневник, поддерживает If-None-Match/If-Modified-Since",
+    )
+    # Эпоха токенов (или пользователь) при промахе кэша, updated_at для ревалидации и сам дневник
+    @query_budget(3)
     def get(self, request: Request, diary_id: int) -> Response:
-        # Получение дневника в 1 запрос
-        diary = get_object_or_404(Diary.objects.select_related("owner"), id=diary_id)
+        if has_validators(request):
+            # Ревалидация: только updated_at по первичному ключу, без модели и серилизатора.
+            # Чужой дневник сюда не попадет и дальше получит 403
+            updated_at = (
+                Diary.objects.visible().filter(id=diary_id, owner_id=request.user.id)
+                .values_list("updated_at", flat=True)
+                .order_by("pk")
+                .first()
+            )
+            response = not_modified_response(request, diary_id, updated_at)
+            if response is not None:
+                return response
+
+        # Получение дневника в 1 запрос, от владельца только username
+        diary = get_object_or_404(
+            Diary.objects.visible().values(*representations.DIARY_VALUES), id=diary_id
+        )
         # Выдаст 403 если пользователь не является владельцем дневника
         self.check_object_permissions(request, diary)
-        serializer = DairySerializer(diary)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(
+            Response(representations.diary(diary), status=status.HTTP_200_OK),
+            diary["id"],
+            diary["updated_at"],
+        )
+
+
+class DiaryListAPIView(APIView):
+    """Список своих дневников, keyset пагинация по индексу (owner, created_at, id)"""
+
+    authentication_classes = [TokenUserAuthentication]
+    permission_classes = [IsAuthenticatedAndActiveUser]
+    pagination_class = KeysetPagination
+
+    @extend_schema(
+        responses={200: DiaryListSerializer(many=True)},
+        description="Список своих дневников, для следующей страницы передайте cursor из next",
+    )
+    @query_budget(2)
+    def get(self, request: Request) -> Response:
+        paginator = self.pagination_class()
+        diaries = paginator.paginate_queryset(
+            Diary.objects.visible().filter(owner_id=request.user.id).values(*representations.DIARY_LIST_VALUES),
+            request,
+            view=self,
+        )
+        # Владелец у всех дневников один - подставляем его без JOIN
+        owner = request.user.username
+        return paginator.get_paginated_response(
+            [representations.diary_list_item(diary, owner) for diary in diaries]
+        )
+
+
+class DiaryBatchAPIView(APIView):
+    """Создание, изменение и удаление своих дневников пачкой"""
+
+    authentication_classes = [TokenUserAuthentication]
+    permission_classes = [IsAuthenticatedAndActiveUser]
+
+    @extend_schema(
+        request=DiaryBatchSerializer,
+        responses={200: None},
+        description="Пачка операций create/update/delete, результат по каждой в том же порядке",
+    )
+    # Эпоха токенов при промахе кэша, выборка своих дневников, INSERT, UPDATE, DELETE - при любом размере пачки
+    @query_budget(5)
+    def post(self, request: Request) -> Response:
+        serializer = DiaryBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_diary_batch(
+            request.user.id, request.user.username, serializer.validated_data["operations"]
+        )
+        return Response({"results": results}, status=status.HTTP_200_OK)
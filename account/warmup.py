@@ -0,0 +1,126 @@
+"""Прогрев приложения до первого запроса.
+warm_up_app() не обращается к БД и не запускает потоков, поэтому его можно вызвать в
+мастере gunicorn с preload_app до fork: воркеры получат прогретое состояние копией памяти.
+Соединения с БД открываются уже в воркере (worker_ready, см. gunicorn.conf.py)"""
+
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.state import token_backend
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import dbpool, representations
+from .benchmarks import EXCLUDED_MIDDLEWARE
+from .metrics import startup
+from .serializers import (
+    DairySerializer,
+    DiaryListSerializer,
+    UserLoginSerializer,
+    UserProfileSerializer,
+    UserRegistrationSerializer,
+)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SERIALIZERS = (
+    UserRegistrationSerializer,
+    UserLoginSerializer,
+    UserProfileSerializer,
+    DairySerializer,
+    DiaryListSerializer,
+)
+WARM_UP_EMAIL = "warm-up@example.com"
+WARM_UP_PATH = "/api/users/update/"
+
+
+def _compile_patterns(patterns) -> None:
+    # Регулярки маршрутов компилируются лениво, при первом resolve по ним
+    for pattern in patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            _compile_patterns(pattern.url_patterns)
+
+
+def warm_up_urls() -> None:
+    resolver = get_resolver()
+    _compile_patterns(resolver.url_patterns)
+    # Таблицы reverse() для всех namespace строятся один раз на процесс
+    resolver.reverse_dict
+    resolver.namespace_dict
+    resolver.app_dict
+
+
+def warm_up_serializers() -> None:
+    """Поля серилизаторов, _meta моделей и ленивые регулярки валидаторов"""
+    for serializer_class in SERIALIZERS:
+        serializer_class().fields
+    UserLoginSerializer().fields["email"].run_validation(WARM_UP_EMAIL)
+    representations._iso_datetime.to_representation(timezone.now())
+
+
+def warm_up_jwt() -> None:
+    """Подготовленные ключи и алгоритмы PyJWT: выпуск и проверка токена без БД"""
+    # Ключ проверки для HS* - тот же ключ подписи, он подготовится при декодировании
+    token_backend.prepared_signing_key
+    token = AccessToken()
+    token[api_settings.USER_ID_CLAIM] = 0
+    AccessToken(str(token))
+
+
+def warm_up_request() -> None:
+    """Один запрос через middleware и DRF: ленивые импорты и регулярки, которые
+    срабатывают только на живом запросе. Refresh вместо access - 401 до загрузки
+    пользователя, без БД. В метрики запрос не попадает"""
+    host = next((host.lstrip(".") for host in settings.ALLOWED_HOSTS if host != "*"), "localhost")
+    request_logger = logging.getLogger("django.request")
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        with override_settings(
+            ACCOUNT_METRICS={**getattr(settings, "ACCOUNT_METRICS", {}), "ENABLED": False},
+            MIDDLEWARE=[m for m in settings.MIDDLEWARE if m not in EXCLUDED_MIDDLEWARE],
+        ):
+            Client(HTTP_HOST=host).get(WARM_UP_PATH, headers={"Authorization": f"Bearer {RefreshToken()}"})
+    finally:
+        request_logger.setLevel(level)
+
+
+WARM_UP_STEPS: Dict[str, Callable[[], None]] = {
+    "urls": warm_up_urls,
+    "serializers": warm_up_serializers,
+    "jwt": warm_up_jwt,
+    "request": warm_up_request,
+}
+
+
+def warm_up_app() -> Dict[str, float]:
+    """Время каждого шага в секундах"""
+    timings = {}
+    for name, step in WARM_UP_STEPS.items():
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def worker_ready(boot_started: Optional[float] = None, preloaded: bool = False) -> Dict[str, float]:
+    """Вызывается в воркере до приема запросов: прогрев приложения (если не было
+    preload), открытие пула соединений и учет холодного старта для /metrics.
+    boot_started - time.perf_counter() в мастере перед fork"""
+    timings = {} if preloaded else warm_up_app()
+    timings.update({f"db:{alias}": t for alias, t in dbpool.warm_up().items()})
+    if boot_started is not None:
+        startup.cold_start = time.perf_counter() - boot_started
+    logger.info(
+        f"Воркер готов{f' за {startup.cold_start * 1000:.0f}ms' if startup.cold_start else ''}: "
+        + ", ".join(f"{name}={t * 1000:.1f}ms" for name, t in timings.items())
+    )
+    return timings
@@ -0,0 +1,40 @@
+"""Настройки gunicorn, читаются автоматически из рабочего каталога (/app в Docker).
+С preload_app приложение импортируется и прогревается один раз в мастере, воркеры
+получают его копией памяти при fork и только открывают свои соединения с БД"""
+
+import logging
+import os
+import time
+
+logger = logging.getLogger("gunicorn.error")
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "True").lower() == "true"
+
+# Потоки в воркере: пока вход ждет PBKDF2 в пуле хэширования (account.hashing, hashlib отпускает GIL),
+# остальные потоки отвечают на дневники. С sync воркером запрос в процессе один и пул хэширования
+# только добавляет передачу между потоками. Пул соединений с БД (DB_POOL_MAX_SIZE) - не меньше threads
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+
+def when_ready(server):
+    # Мастер, до запуска воркеров
+    if preload_app:
+        from django.db import connections
+        from account.warmup import warm_up_app
+
+        timings = warm_up_app()
+        # Соединения мастера не должны достаться воркерам после fork
+        connections.close_all()
+        logger.info("Приложение прогрето в мастере: %s", {name: f"{t * 1000:.1f}ms" for name, t in timings.items()})
+
+
+def pre_fork(server, worker):
+    worker.boot_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # Приложение уже загружено: прогрев и соединения с БД до первого запроса, а не на нем
+    from account.warmup import worker_ready
+
+    worker_ready(getattr(worker, "boot_started", None), preloaded=preload_app)
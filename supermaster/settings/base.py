@@ -1,3 +1,4 @@
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -19,6 +20,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы время ответа включало остальные middleware
+    "account.metrics.MetricsMiddleware",
+    "account.db_routing.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -81,6 +85,126 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=14),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'account.serializers.TokenRefreshSerializer',
 }
 
-AUTH_USER_MODEL = 'account.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'account.User'
+
+# Кэш пользователей для JWT аутентификации (account.authentication)
+ACCOUNT_USER_CACHE = {
+    "LOCAL_MAXSIZE": 4096,
+    "LOCAL_TTL": 30,
+    # alias из CACHES для общего кэша между процессами, None - только локальный LRU: тогда отзыв
+    # (удаление, смена пароля, выход везде) в других процессах виден не сразу, а через EPOCH_LOCAL_TTL
+    "SHARED_CACHE_ALIAS": None,
+    "SHARED_TTL": 300,
+    # Дневники без загрузки пользователя: id, username и is_active из токена,
+    # отзыв - по token_epoch (account.authentication.TokenUserAuthentication)
+    "TOKEN_USER": True,
+    "EPOCH_LOCAL_TTL": 5,
+}
+
+# Пул для хэширования паролей (account.hashing), при переполнении - 503
+ACCOUNT_PASSWORD_HASHING = {
+    "MAX_WORKERS": 2,
+    "MAX_PENDING": 8,
+    "TIMEOUT": 5,
+    # Подобрать под железо: python manage.py calibrate_hasher --target-ms 250
+    "PBKDF2_ITERATIONS": int(os.getenv('PASSWORD_HASH_ITERATIONS') or 0) or None,
+}
+
+# Django PBKDF2PasswordHasher не указан: у него тот же алгоритм pbkdf2_sha256, он перекрыл бы калиброванный
+PASSWORD_HASHERS = [
+    "account.hashing.CalibratedPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+# Фильтр blacklist токенов в памяти процесса (account.blacklist)
+ACCOUNT_TOKEN_BLACKLIST_FILTER = {
+    "SYNC_INTERVAL": 1.0,
+    "SYNC_MARGIN": 30,
+}
+
+# Ограничение частоты входа, регистрации и обновления токенов (account.throttling)
+ACCOUNT_RATE_LIMITS = {
+    # "local" - в памяти процесса, "cache" - общий кэш из CACHES для нескольких нод
+    "STORAGE": "local",
+    "CACHE_ALIAS": "default",
+    "RATES": {
+        "login_ip": "30/min",
+        "login_email": "10/min",
+        "login_global": "6000/min",
+        "register_ip": "20/min",
+        "register_global": "1200/min",
+        "refresh_ip": "120/min",
+        "refresh_global": "12000/min",
+    },
+    "LOGIN_FAILURES": {"MAX": 5, "WINDOW": 900},
+}
+
+# Очистка мягко удаленных пользователей (account.purge, команда purge_deleted_users)
+ACCOUNT_USER_PURGE = {
+    "RETENTION_DAYS": 30,
+    "BATCH_SIZE": 500,
+    "SLEEP": 0.5,
+    "MODE": "delete",
+}
+
+# Очистка истекших refresh токенов (account.token_prune, команда prune_tokens)
+ACCOUNT_TOKEN_PRUNE = {
+    "BATCH_SIZE": 1000,
+    "SLEEP": 0.1,
+}
+
+# Пакетная запись дневников (account.diary_batch, POST /api/diary/batch/)
+ACCOUNT_DIARY_BATCH = {
+    "MAX_OPERATIONS": 100,
+}
+
+# Метрики запросов для Prometheus (account.metrics), отдаются на /metrics
+ACCOUNT_METRICS = {
+    "ENABLED": True,
+    # Каталог для снимков воркеров gunicorn, None - один процесс
+    "MULTIPROCESS_DIR": None,
+    "FLUSH_INTERVAL": 5.0,
+    "RECORD_DB": True,
+    "TOKEN": None,
+}
+
+# Соединения с PostgreSQL (DATABASES в local.py и prod.py). По умолчанию пул psycopg_pool на воркер:
+# соединение берется из пула на запрос и возвращается после него. DB_POOL=False - постоянные
+# соединения на поток с CONN_MAX_AGE. Пул несовместим с CONN_MAX_AGE > 0
+if os.getenv('DB_POOL', 'True').lower() == 'true':
+    DATABASE_CONNECTION = {
+        "CONN_MAX_AGE": 0,
+        # Пул проверяет соединение перед выдачей (ConnectionPool.check_connection)
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": {
+                "min_size": int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                "max_size": int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                # Лишние соединения сверх min_size закрываются после простоя, секунды
+                "max_idle": float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+                # Сколько ждать свободное соединение, потом PoolTimeout
+                "timeout": float(os.getenv('DB_POOL_TIMEOUT', '5')),
+            },
+        },
+    }
+else:
+    DATABASE_CONNECTION = {
+        "CONN_MAX_AGE": int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        "CONN_HEALTH_CHECKS": True,
+    }
+
+DATABASE_ROUTERS = ["account.db_routing.ReplicaRouter"]
+
+# Чтение User и Diary с реплик (account.db_routing). Запись - в default,
+# после своей записи пользователь STICKY_SECONDS секунд читает с default
+ACCOUNT_DB_ROUTING = {
+    "REPLICAS": [],
+    "STICKY_SECONDS": 10,
+    "CACHE_ALIAS": "default",
+}
@@ -1,18 +1,28 @@
 from .base import *
+import os
+import sys
 
 SECRET_KEY = "django-insecure-x#l_qijzh@(777q#2+t&z&0kf*qtcq%-vv4b!h69!mm(jg9rk0"
 
 ALLOWED_HOSTS = ["*"]
 
-MIDDLEWARE += [
-    'silk.middleware.SilkyMiddleware',
-]
+# Запуск через manage.py test
+TESTING = sys.argv[1:2] == ["test"]
 
 INSTALLED_APPS += [
     "drf_spectacular",
-    "silk"
 ]
 
+# silk после каждого запроса ORM делает EXPLAIN в той же транзакции: в тестах (TestCase - все
+# в транзакции) после ошибки ограничения он подменяет IntegrityError на InternalError
+if not TESTING:
+    MIDDLEWARE += [
+        'silk.middleware.SilkyMiddleware',
+    ]
+    INSTALLED_APPS += [
+        "silk",
+    ]
+
 # Локальная БД для разработки
 DATABASES = {
     "default": {
@@ -22,15 +32,31 @@ DATABASES = {
         "PASSWORD": "postgres",
         "HOST": "localhost",
         "PORT": "5432",
-    }
+        **DATABASE_CONNECTION,
+    },
 }
 
+# DB_REPLICA=True - читать через вторую БД вместо реплики. По умолчанию та же база через отдельное
+# соединение (реплика без отставания), в тестах - отдельная test_account_replica. Без флага алиаса
+# нет и второй пул соединений не открывается
+if os.getenv('DB_REPLICA', 'False').lower() == 'true':
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.getenv('DB_REPLICA_NAME', 'account'),
+        "TEST": {"NAME": "test_account_replica"},
+    }
+    # В тестах реплику включает только TestReplicaRouting (override_settings): остальные классы
+    # не объявляют replica в databases, и чтение с нее было бы DatabaseOperationForbidden
+    if not TESTING:
+        ACCOUNT_DB_ROUTING = {**ACCOUNT_DB_ROUTING, "REPLICAS": ["replica"]}
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "account.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # Прокси нет: лимиты по IP берут REMOTE_ADDR, X-Forwarded-For клиента не учитывается
+    "NUM_PROXIES": 0,
 }
 
 SPECTACULAR_SETTINGS = {
@@ -1,5 +1,6 @@
 from .base import *
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv(BASE_DIR / '.env')
@@ -27,9 +28,43 @@ DATABASES = {
         "PASSWORD": os.getenv('DB_PASSWORD', 'postgres'),
         "HOST": os.getenv('DB_HOST', 'db'),
         "PORT": os.getenv('DB_PORT', '5432'),
+        **DATABASE_CONNECTION,
     }
 }
 
+# Общий кэш воркеров: REDIS_URL=redis://redis:6379/0. Без него - LocMemCache в памяти каждого воркера
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv('REDIS_URL'),
+        }
+    }
+    # Ведра лимитов и счетчик неудачных входов - общие: в памяти воркера лимит умножается на их число
+    ACCOUNT_RATE_LIMITS = {**ACCOUNT_RATE_LIMITS, "STORAGE": "cache"}
+    # Пользователи и эпохи токенов - в общем кэше, сброс после отзыва виден всем воркерам. LRU воркера
+    # перед ним о чужих сбросах не знает и держит отозванное до LOCAL_TTL/EPOCH_LOCAL_TTL, поэтому
+    # по умолчанию выключен (0): каждая проверка - запрос в Redis вместо БД
+    ACCOUNT_USER_CACHE = {
+        **ACCOUNT_USER_CACHE,
+        "SHARED_CACHE_ALIAS": "default",
+        "LOCAL_MAXSIZE": int(os.getenv('USER_CACHE_LOCAL_MAXSIZE', '0')),
+    }
+
+# Реплики для чтения: DB_REPLICA_HOSTS=replica1,replica2 (те же имя БД и пользователь)
+for number, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f"replica_{number}"] = {**DATABASES["default"], "HOST": host.strip()}
+
+ACCOUNT_DB_ROUTING = {
+    **ACCOUNT_DB_ROUTING,
+    "REPLICAS": [alias for alias in DATABASES if alias != "default"],
+    "STICKY_SECONDS": int(os.getenv('DB_REPLICA_STICKY_SECONDS', '10')),
+}
+
+# Метку read-your-writes ставит один воркер, а читать может другой: в памяти процесса она не работает
+if ACCOUNT_DB_ROUTING["REPLICAS"] and not os.getenv('REDIS_URL'):
+    raise ImproperlyConfigured("DB_REPLICA_HOSTS требует общий кэш для меток чтения: задайте REDIS_URL")
+
 # Static files
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATIC_URL = '/static/'
@@ -41,13 +76,27 @@ MEDIA_URL = '/media/'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
+    # Число прокси перед gunicorn (nginx - 1). Лимиты по IP берут адрес из X-Forwarded-For
+    # только от них, без прокси - REMOTE_ADDR, иначе клиент подменяет ключ заголовком
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
+# Метрики вместо silk: воркеры gunicorn складывают снимки в METRICS_DIR
+ACCOUNT_METRICS = {
+    **ACCOUNT_METRICS,
+    "MULTIPROCESS_DIR": os.getenv('METRICS_DIR') or None,
+    "TOKEN": os.getenv('METRICS_TOKEN') or None,
+}
+
+# /metrics раскрывает маршруты, нагрузку и пул БД - в проде только с токеном
+if ACCOUNT_METRICS["ENABLED"] and not ACCOUNT_METRICS["TOKEN"]:
+    raise ImproperlyConfigured("Задайте METRICS_TOKEN: без него /metrics открыт всем")
+
 # Простое логирование в консоль
 LOGGING = {
     'version': 1,
@@ -1,16 +1,17 @@
 from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
-from rest_framework_simplejwt.views import (
-    TokenRefreshView,
-)
+from account.metrics import metrics_view
+from account.views import TokenRefreshAPIView
 
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('api/', include('account.urls')),
     # Simple JWT
-    path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("api/token/refresh/", TokenRefreshAPIView.as_view(), name="token_refresh"),
+    # Prometheus
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG: